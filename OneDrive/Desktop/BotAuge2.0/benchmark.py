@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark dos handlers do Bot Auge Traders
+
+Monta a Application real (mesmos handlers de main()) sobre um Bot falso, sem
+rede, e reproduz fluxos sintéticos de Updates:
+
+    python benchmark.py                         # todos os cenários
+    python benchmark.py --scenarios text,stats --sizes 10k,1m
+    python benchmark.py --updates 20000 --send-latency-ms 30
+    python benchmark.py --concurrency 1            # processamento sequencial
+
+Cenários:
+    text       - enxurrada de mensagens de texto (message_handler, sem anti-flood)
+    flood      - poucos usuários inundando um grupo (anti-flood com os limites padrão)
+    joins      - rajadas de entrada de membros (new_member_handler)
+    callbacks  - tempestade de cliques em botões (button_callback)
+    stats      - /stats contra bancos pré-populados (--sizes)
+    persistence - ciclos de update_persistence: SQLitePersistence x PicklePersistence
+
+Para cada cenário são reportados updates/s, latências p50/p99 por update e
+quantas mensagens chegaram ao banco. O cenário persistence tem tabela própria:
+tempo de carga, latência por ciclo e bytes gravados por ciclo de cada backend.
+Bancos pré-populados ficam em --data-dir e são reaproveitados entre execuções.
+"""
+
+import argparse
+import asyncio
+import copy
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, List
+
+# Configuração do bot antes de importar o módulo (ele lê o ambiente na importação)
+BENCH_ADMIN_ID = 1000
+BENCH_GROUP_ID = -1001
+BENCH_DIR = tempfile.mkdtemp(prefix='bot-bench-')
+os.environ['BOT_TOKEN'] = '123456:BENCHMARK'
+os.environ['ADMIN_IDS'] = str(BENCH_ADMIN_ID)
+os.environ['GRUPO_PRINCIPAL_ID'] = str(BENCH_GROUP_ID)
+os.environ['GRUPO_DUVIDAS_ID'] = '-1002'
+os.environ['DATABASE_PATH'] = os.path.join(BENCH_DIR, 'bench.db')
+
+import logging
+
+import bot
+from telegram import Update
+from telegram.ext import PicklePersistence
+from telegram.request import BaseRequest, RequestData
+
+logging.getLogger().setLevel(logging.WARNING)
+
+SIZES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000, '10m': 10_000_000}
+
+class FakeRequest(BaseRequest):
+    """Camada de rede falsa: responde às chamadas da Bot API sem sair do processo"""
+
+    def __init__(self, latency_ms: float = 0):
+        self.latency = latency_ms / 1000
+        self.calls: Dict[str, int] = {}
+        self._message_id = 0
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _message(self, params: Dict) -> Dict:
+        self._message_id += 1
+        return {
+            'message_id': self._message_id,
+            'date': int(time.time()),
+            'chat': {'id': int(params.get('chat_id', BENCH_GROUP_ID)), 'type': 'supergroup'},
+            'text': params.get('text', '')
+        }
+
+    async def do_request(self, url: str, method: str, request_data: RequestData = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None, pool_timeout=None):
+        endpoint = url.rsplit('/', 1)[-1]
+        self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+        params = request_data.parameters if request_data else {}
+
+        if self.latency and endpoint != 'getMe':
+            await asyncio.sleep(self.latency)
+        if endpoint == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+        elif endpoint in ('sendMessage', 'editMessageText', 'sendDocument'):
+            result = self._message(params)
+        elif endpoint == 'getChatAdministrators':
+            result = [{'status': 'administrator', 'user': {'id': BENCH_ADMIN_ID, 'is_bot': False, 'first_name': 'Admin'},
+                       'can_be_edited': False, 'is_anonymous': False, 'can_manage_chat': True,
+                       'can_delete_messages': True, 'can_manage_video_chats': True, 'can_restrict_members': True,
+                       'can_promote_members': False, 'can_change_info': True, 'can_invite_users': True}]
+        elif endpoint == 'getUpdates':
+            result = []
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+# Geradores de Updates sintéticos
+def _user(user_id: int) -> Dict:
+    return {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}', 'username': f'user_{user_id}'}
+
+def _chat(chat_id: int) -> Dict:
+    return {'id': chat_id, 'type': 'supergroup', 'title': 'Bench'}
+
+def text_flood(count: int, users: int = 500, chats: int = 2) -> List[Dict]:
+    """Mensagens de texto de `users` usuários distribuídas em `chats` grupos"""
+    return [{
+        'update_id': i,
+        'message': {
+            'message_id': i, 'date': int(time.time()),
+            'chat': _chat(BENCH_GROUP_ID - (i % chats)),
+            'from': _user(10_000 + random.randrange(users)),
+            'text': f'mensagem de teste número {i} sobre o mercado de hoje'
+        }
+    } for i in range(count)]
+
+def spam_flood(count: int, users: int = 20) -> List[Dict]:
+    """Mensagens de `users` usuários repetindo spam no grupo principal"""
+    return [{
+        'update_id': i,
+        'message': {
+            'message_id': i, 'date': int(time.time()),
+            'chat': _chat(BENCH_GROUP_ID),
+            'from': _user(20_000 + i % users),
+            'text': 'COMPRE AGORA!!! sinal garantido, chama no privado'
+        }
+    } for i in range(count)]
+
+def join_bursts(count: int, burst: int = 20) -> List[Dict]:
+    """Updates de entrada de membros, cada um com `burst` novos membros"""
+    updates = []
+    next_user = 5_000_000
+    for i in range(max(1, count // burst)):
+        members = [_user(next_user + j) for j in range(burst)]
+        next_user += burst
+        updates.append({
+            'update_id': i,
+            'message': {
+                'message_id': i, 'date': int(time.time()),
+                'chat': _chat(BENCH_GROUP_ID),
+                'from': members[0],
+                'new_chat_members': members
+            }
+        })
+    return updates
+
+CALLBACK_DATA = [bot.callback_router.encode('g', 'morning'), bot.callback_router.encode('g', 'alert'),
+                 bot.callback_router.encode('g', 'motivational'), bot.callback_router.encode('m')]
+
+def callback_storm(count: int) -> List[Dict]:
+    """Cliques de admin nos menus inline (sem disparar envios para os grupos)"""
+    return [{
+        'update_id': i,
+        'callback_query': {
+            'id': str(i),
+            'from': _user(BENCH_ADMIN_ID),
+            'chat_instance': 'bench',
+            'data': CALLBACK_DATA[i % len(CALLBACK_DATA)],
+            'message': {
+                'message_id': 1, 'date': int(time.time()),
+                'chat': {'id': BENCH_ADMIN_ID, 'type': 'private'},
+                'from': {'id': 1, 'is_bot': True, 'first_name': 'Bench'},
+                'text': 'menu'
+            }
+        }
+    } for i in range(count)]
+
+def stats_commands(count: int) -> List[Dict]:
+    """Comandos /stats enviados por um admin"""
+    return [{
+        'update_id': i,
+        'message': {
+            'message_id': i, 'date': int(time.time()),
+            'chat': {'id': BENCH_ADMIN_ID, 'type': 'private'},
+            'from': _user(BENCH_ADMIN_ID),
+            'text': '/stats',
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}]
+        }
+    } for i in range(count)]
+
+# Bancos pré-populados
+def seed_database(path: str, rows: int):
+    """Cria um banco com `rows` mensagens (e rows/100 usuários) em blocos"""
+    if os.path.exists(path):
+        return
+    print(f"  populando {path} com {rows:,} mensagens...", flush=True)
+    start = time.perf_counter()
+    tmp_path = path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    conn.execute('PRAGMA journal_mode=OFF')
+    conn.execute('PRAGMA synchronous=OFF')
+    bot.migrate_database(conn)
+    users = max(1, rows // 100)
+    chunk = 100_000
+    conn.executemany(
+        "INSERT INTO users (user_id, username, first_name, join_date) VALUES (?, ?, ?, datetime('now', ?))",
+        ((100_000 + i, f'user_{i}', f'User{i}', f'-{i % 365} days') for i in range(users))
+    )
+    for offset in range(0, rows, chunk):
+        conn.executemany(
+            "INSERT INTO messages (user_id, chat_id, message_text, message_type, timestamp) "
+            "VALUES (?, ?, ?, 'user', datetime('now', ?))",
+            ((100_000 + (i % users), BENCH_GROUP_ID - (i % 2), f'mensagem histórica {i}', f'-{(rows - i) // 1000} minutes')
+             for i in range(offset, min(offset + chunk, rows)))
+        )
+        conn.commit()
+    bot.StatsCounters.recount(conn)
+    conn.execute("UPDATE backfills SET cursor = high_water, done = 1")
+    conn.commit()
+    conn.close()
+    os.replace(tmp_path, path)
+    print(f"  pronto em {time.perf_counter() - start:.1f}s", flush=True)
+
+# Execução
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+async def replay(application, raw_updates: List[Dict]) -> Dict:
+    """Processa os updates como a Application faz: em sequência ou pelo processador concorrente.
+    
+    No modo concorrente a latência vai da chegada do update ao fim do processamento.
+    """
+    updates = [Update.de_json(data, application.bot) for data in raw_updates]
+    processor = application.update_processor
+    latencies = []
+    
+    async def timed(update):
+        t0 = time.perf_counter()
+        if processor.max_concurrent_updates > 1:
+            await processor.process_update(update, application.process_update(update))
+        else:
+            await application.process_update(update)
+        latencies.append(time.perf_counter() - t0)
+    
+    start = time.perf_counter()
+    if processor.max_concurrent_updates > 1:
+        await asyncio.gather(*(timed(update) for update in updates))
+    else:
+        for update in updates:
+            await timed(update)
+    elapsed = time.perf_counter() - start
+
+    # Inclui o tempo de gravar o que ficou no buffer de escrita e nas janelas de entrada
+    stored_before = bot.db_manager.stats.total_messages
+    flush_start = time.perf_counter()
+    await bot.join_aggregator.stop()
+    await bot.db_manager.buffer.stop()
+    flush = time.perf_counter() - flush_start
+    return {
+        'updates': len(updates),
+        'ups': len(updates) / (elapsed + flush) if elapsed + flush else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'mean_ms': statistics.fmean(latencies) * 1000 if latencies else 0.0,
+        'flush_ms': flush * 1000,
+        'stored': bot.db_manager.stats.total_messages - stored_before
+    }
+
+@asynccontextmanager
+async def scenario_application(args, path: str, flood=None):
+    """Cria os serviços do bot sobre o banco `path` e monta a Application real sobre um Bot falso"""
+    db = bot.init_services(path, flood=flood)
+    request = FakeRequest(args.send_latency_ms)
+    application = bot.build_application(bot.InstrumentedBot(token=os.environ['BOT_TOKEN'], request=request),
+                                        concurrency=args.concurrency)
+    await application.initialize()
+    try:
+        await db.start()
+        await bot.group_registry.load()
+        yield application
+    finally:
+        await application.shutdown()
+        await db.shutdown()
+
+def written_bytes() -> int:
+    """Bytes enviados a write() pelo processo até agora (Linux; 0 em outros sistemas)"""
+    try:
+        with open('/proc/self/io') as f:
+            return next(int(line.split()[1]) for line in f if line.startswith('wchar:'))
+    except (OSError, StopIteration):
+        return 0
+
+def persisted_chat(chat_id: int, version: int) -> Dict:
+    return {'idioma': 'pt', 'versao': version, 'avisos': list(range(chat_id % 32)), 'titulo': f'Grupo {chat_id}'}
+
+async def persistence_cycles(args) -> List[Dict]:
+    """Compara a SQLitePersistence com a PicklePersistence do PTB em ciclos de update_persistence.
+
+    Parte de --persist-entries chats já gravados. Em cada ciclo --persist-touched
+    chats recebem updates (refresh_chat_data, como faz a Application), metade
+    deles muda de conteúdo e todos passam por update_chat_data. A SQLite grava
+    a fila com flush() ao fim do ciclo; a pickle regrava o arquivo inteiro a
+    cada entrada alterada.
+    """
+    rng = random.Random(42)
+    fake_bot = bot.InstrumentedBot(token=os.environ['BOT_TOKEN'], request=FakeRequest(0))
+    results = []
+    for backend in ('sqlite', 'pickle'):
+        path = os.path.join(BENCH_DIR, f'persistence.{backend}')
+        if backend == 'sqlite':
+            db = bot.DatabaseManager(path)
+            seed, create = bot.SQLitePersistence(db), lambda: bot.SQLitePersistence(db)
+        else:
+            seed, create = PicklePersistence(path, on_flush=True), lambda: PicklePersistence(path)
+        versions = {-chat: 0 for chat in range(1, args.persist_entries + 1)}
+        seed.set_bot(fake_bot)
+        for chat_id in versions:
+            await seed.update_chat_data(chat_id, persisted_chat(chat_id, 0))
+        await seed.flush()
+
+        persistence = create()
+        persistence.set_bot(fake_bot)
+        start = time.perf_counter()
+        chats = defaultdict(dict, await persistence.get_chat_data())
+        load = time.perf_counter() - start
+
+        latencies = []
+        written = written_bytes()
+        for _ in range(args.persist_cycles):
+            touched = rng.sample(list(versions), args.persist_touched)
+            t0 = time.perf_counter()
+            for chat_id in touched:
+                await persistence.refresh_chat_data(chat_id, chats[chat_id])
+            for chat_id in touched[:len(touched) // 2]:
+                versions[chat_id] += 1
+                chats[chat_id]['versao'] = versions[chat_id]
+            await asyncio.gather(*(persistence.update_chat_data(chat_id, copy.deepcopy(chats[chat_id]))
+                                   for chat_id in touched))
+            if backend == 'sqlite':
+                await persistence.flush()
+            latencies.append(time.perf_counter() - t0)
+        written = written_bytes() - written
+        if backend == 'sqlite':
+            db.close()
+
+        results.append({
+            'scenario': f'persist[{backend}]',
+            'entries': args.persist_entries,
+            'cycles': args.persist_cycles,
+            'load_ms': load * 1000,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'kb_per_cycle': written / 1024 / args.persist_cycles
+        })
+    return results
+
+async def run(args) -> List[Dict]:
+    scenarios: Dict[str, Callable[[int], List[Dict]]] = {
+        'text': text_flood,
+        'flood': spam_flood,
+        'joins': join_bursts,
+        'callbacks': callback_storm,
+    }
+    results = []
+    for name in args.scenarios:
+        if name == 'persistence':
+            results.extend(await persistence_cycles(args))
+            continue
+        if name == 'stats':
+            for size in args.sizes:
+                path = os.path.join(args.data_dir, f'stats_{size}.db')
+                seed_database(path, SIZES[size])
+                async with scenario_application(args, path) as application:
+                    result = await replay(application, stats_commands(args.stats_updates))
+                results.append({'scenario': f'stats[{size}]', **result})
+            continue
+        # O cenário text mede o caminho completo de gravação; flood usa os limites padrão
+        flood = bot.FloodGuard(user_limit=0, chat_limit=0) if name == 'text' else None
+        async with scenario_application(args, os.path.join(BENCH_DIR, f'{name}.db'), flood) as application:
+            result = await replay(application, scenarios[name](args.updates))
+        results.append({'scenario': name, **result})
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark offline dos handlers do bot')
+    parser.add_argument('--scenarios', default='text,flood,joins,callbacks,stats,persistence',
+                        help='cenários separados por vírgula (text, flood, joins, callbacks, stats, persistence)')
+    parser.add_argument('--updates', type=int, default=5000, help='updates por cenário')
+    parser.add_argument('--stats-updates', type=int, default=200, help='comandos /stats por tamanho de banco')
+    parser.add_argument('--sizes', default='10k,1m,10m', help=f"tamanhos dos bancos do /stats ({', '.join(SIZES)})")
+    parser.add_argument('--persist-entries', type=int, default=2000, help='chats gravados no cenário persistence')
+    parser.add_argument('--persist-touched', type=int, default=20, help='chats com updates em cada ciclo de persistência')
+    parser.add_argument('--persist-cycles', type=int, default=10, help='ciclos de update_persistence medidos')
+    parser.add_argument('--send-latency-ms', type=float, default=0, help='latência simulada da Bot API')
+    parser.add_argument('--concurrency', type=int, default=bot.UPDATE_CONCURRENCY,
+                        help='handlers simultâneos (1 = processamento sequencial)')
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'bot-bench-data'),
+                        help='diretório dos bancos pré-populados (reaproveitados)')
+    parser.add_argument('--json', action='store_true', help='imprime os resultados em JSON')
+    args = parser.parse_args()
+    args.scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    args.sizes = [s.strip().lower() for s in args.sizes.split(',') if s.strip()]
+
+    unknown = [s for s in args.scenarios if s not in ('text', 'flood', 'joins', 'callbacks', 'stats', 'persistence')]
+    unknown += [s for s in args.sizes if s not in SIZES]
+    if unknown:
+        parser.error(f"valores desconhecidos: {', '.join(unknown)}")
+    os.makedirs(args.data_dir, exist_ok=True)
+
+    results = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    handlers = [r for r in results if 'ups' in r]
+    if handlers:
+        print(f"\n{'cenário':<16}{'updates':>9}{'upd/s':>11}{'p50 ms':>10}{'p99 ms':>10}{'flush ms':>10}{'gravadas':>10}")
+        for r in handlers:
+            print(f"{r['scenario']:<16}{r['updates']:>9}{r['ups']:>11.0f}{r['p50_ms']:>10.3f}{r['p99_ms']:>10.3f}"
+                  f"{r['flush_ms']:>10.1f}{r['stored']:>10}")
+    persisted = [r for r in results if 'kb_per_cycle' in r]
+    if persisted:
+        print(f"\n{'persistência':<18}{'entradas':>10}{'carga ms':>10}{'ciclo p50':>11}{'ciclo p99':>11}{'KB/ciclo':>11}")
+        for r in persisted:
+            print(f"{r['scenario']:<18}{r['entries']:>10}{r['load_ms']:>10.1f}{r['p50_ms']:>11.2f}{r['p99_ms']:>11.2f}"
+                  f"{r['kb_per_cycle']:>11.1f}")
+
+if __name__ == '__main__':
+    sys.exit(main())
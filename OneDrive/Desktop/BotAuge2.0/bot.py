@@ -7,34 +7,64 @@ Data: Janeiro 2024
 """
 
 import os
+import asyncio
+import bisect
+import csv
+import functools
+import gzip
+import hashlib
+import heapq
+import inspect
+import io
+import itertools
+import json
 import logging
+import pickle
+import queue
+import random
+import shutil
+import signal
 import sqlite3
+import string
+import sys
+import tempfile
+import threading
+import time as time_module
 import pytz
-from datetime import datetime, time, timedelta
-from typing import Dict, List, Optional
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import aclosing, contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional
 
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+# Início da inicialização (antes dos imports pesados), referência do perfil de startup
+STARTUP_T0 = time_module.perf_counter()
+
+from telegram import ChatMember, ChatPermissions, Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application,
+    BasePersistence,
+    BaseUpdateProcessor,
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
     filters,
     ContextTypes,
-    JobQueue
+    ChatMemberHandler,
+    ExtBot,
+    JobQueue,
+    PersistenceInput,
+    TypeHandler
 )
 from telegram.constants import ParseMode
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
 from dotenv import load_dotenv
-from flask import Flask, request
 
 # Carrega variáveis de ambiente
 load_dotenv()
 
-# Configuração de logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+# Logger do bot (o logging é configurado em main(), não no import)
 logger = logging.getLogger(__name__)
 
 # Configurações do bot
@@ -45,262 +75,2150 @@ ADMIN_IDS = [int(id.strip()) for id in os.getenv('ADMIN_IDS', '').split(',') if
 GRUPO_PRINCIPAL_ID = int(os.getenv('GRUPO_PRINCIPAL_ID', 0))
 GRUPO_DUVIDAS_ID = int(os.getenv('GRUPO_DUVIDAS_ID', 0))
 TIMEZONE = pytz.timezone('America/Sao_Paulo')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+UPDATE_QUEUE_MAX = int(os.getenv('UPDATE_QUEUE_MAX', 1000))
+UPDATE_CONCURRENCY = int(os.getenv('UPDATE_CONCURRENCY', 16))
+HTTP_IDLE_TIMEOUT = float(os.getenv('HTTP_IDLE_TIMEOUT', 15))
+DATABASE_PATH = os.getenv('DATABASE_PATH', 'bot_data.db')
+DB_READER_THREADS = int(os.getenv('DB_READER_THREADS', 2))
+WRITE_BATCH_SIZE = int(os.getenv('WRITE_BATCH_SIZE', 500))
+WRITE_FLUSH_MS = int(os.getenv('WRITE_FLUSH_MS', 50))
+WRITE_QUEUE_MAX = int(os.getenv('WRITE_QUEUE_MAX', 10000))
+BROADCAST_GLOBAL_RATE = float(os.getenv('BROADCAST_GLOBAL_RATE', 30))
+BROADCAST_CHAT_RATE = float(os.getenv('BROADCAST_CHAT_RATE', 1))
+BROADCAST_GROUP_PER_MINUTE = int(os.getenv('BROADCAST_GROUP_PER_MINUTE', 20))
+BROADCAST_MAX_RETRIES = int(os.getenv('BROADCAST_MAX_RETRIES', 3))
+MEETING_NOTIFY_MINUTES = int(os.getenv('MEETING_NOTIFY_MINUTES', 30))
+MEETING_RETRY_SECONDS = int(os.getenv('MEETING_RETRY_SECONDS', 60))
+MEETINGS_PAGE_SIZE = int(os.getenv('MEETINGS_PAGE_SIZE', 5))
+MEETING_LIST_CACHE_TTL = int(os.getenv('MEETING_LIST_CACHE_TTL', 60))
+SCHEDULE_CATCHUP_HOURS = float(os.getenv('SCHEDULE_CATCHUP_HOURS', 24))
+SCHEDULE_CATCHUP_MAX = int(os.getenv('SCHEDULE_CATCHUP_MAX', 10))
+PERSISTENCE_UPDATE_SECONDS = float(os.getenv('PERSISTENCE_UPDATE_SECONDS', 60))
+TEMPLATES_PATH = os.getenv('TEMPLATES_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates.json'))
+TEMPLATES_RELOAD_SECONDS = int(os.getenv('TEMPLATES_RELOAD_SECONDS', 30))
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 50000))
+BACKFILL_CHUNK = int(os.getenv('BACKFILL_CHUNK', 5000))
+BACKFILL_PAUSE_MS = int(os.getenv('BACKFILL_PAUSE_MS', 20))
+MESSAGE_RETENTION_DAYS = int(os.getenv('MESSAGE_RETENTION_DAYS', 90))
+DB_SIZE_BUDGET_MB = float(os.getenv('DB_SIZE_BUDGET_MB', 0))
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', os.path.join(os.path.dirname(os.path.abspath(DATABASE_PATH)), 'archive'))
+RETENTION_CHUNK = int(os.getenv('RETENTION_CHUNK', 2000))
+RETENTION_INTERVAL_MINUTES = int(os.getenv('RETENTION_INTERVAL_MINUTES', 60))
+JOIN_WINDOW_SECONDS = float(os.getenv('JOIN_WINDOW_SECONDS', 5))
+JOIN_FLUSH_SIZE = int(os.getenv('JOIN_FLUSH_SIZE', 100))
+WELCOME_MAX_NAMES = int(os.getenv('WELCOME_MAX_NAMES', 10))
+ADMIN_CACHE_TTL = int(os.getenv('ADMIN_CACHE_TTL', 600))
+SEARCH_PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', 5))
+SEARCH_MAX_CANDIDATES = int(os.getenv('SEARCH_MAX_CANDIDATES', 5000))
+FLOOD_USER_LIMIT = int(os.getenv('FLOOD_USER_LIMIT', 10))
+FLOOD_USER_WINDOW = float(os.getenv('FLOOD_USER_WINDOW', 10))
+FLOOD_CHAT_LIMIT = int(os.getenv('FLOOD_CHAT_LIMIT', 200))
+FLOOD_CHAT_WINDOW = float(os.getenv('FLOOD_CHAT_WINDOW', 10))
+FLOOD_MUTE_SECONDS = int(os.getenv('FLOOD_MUTE_SECONDS', 300))
+FLOOD_MAX_TRACKED = int(os.getenv('FLOOD_MAX_TRACKED', 100000))
+EXPORT_FETCH_SIZE = int(os.getenv('EXPORT_FETCH_SIZE', 1000))
+EXPORT_PART_MB = float(os.getenv('EXPORT_PART_MB', 45))
+STARTUP_PROFILE = os.getenv('STARTUP_PROFILE', '').lower() in ('1', 'true', 'yes') or '--profile-startup' in sys.argv
 
-# Flask app para webhook
-app = Flask(__name__)
+# Métricas (formato de texto do Prometheus)
+class MetricsRegistry:
+    """Contadores, histogramas e gauges em memória, expostos em /metrics.
+    
+    Thread-safe: os histogramas do banco são alimentados pelas threads do SQLiteEngine.
+    Gauges são funções avaliadas apenas no momento da coleta.
+    """
+    
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    
+    def __init__(self, buckets: tuple = BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._help: Dict[str, tuple] = {}
+        self._counters: Dict[tuple, float] = {}
+        self._histograms: Dict[tuple, list] = {}
+        self._gauges: Dict[tuple, Callable[[], float]] = {}
+    
+    def describe(self, name: str, kind: str, help_text: str):
+        """Registra o tipo e a descrição de uma métrica"""
+        self._help[name] = (kind, help_text)
+    
+    @staticmethod
+    def _key(name: str, labels: Dict) -> tuple:
+        return name, tuple(sorted(labels.items()))
+    
+    def inc(self, name: str, value: float = 1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+    
+    def observe(self, name: str, value: float, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                # [contagem por bucket..., soma, total]
+                histogram = self._histograms[key] = [0] * len(self.buckets) + [0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                histogram[index] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+    
+    def gauge(self, name: str, fn: Callable[[], float], **labels):
+        """Registra uma função que fornece o valor atual de um gauge"""
+        self._gauges[self._key(name, labels)] = fn
+    
+    @contextmanager
+    def timer(self, name: str, error_counter: Optional[str] = None, **labels):
+        """Mede a duração do bloco; conta erros em `error_counter` se o bloco falhar"""
+        start = time_module.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            if error_counter and not isinstance(e, asyncio.CancelledError):
+                self.inc(error_counter, error=type(e).__name__, **labels)
+            raise
+        finally:
+            self.observe(name, time_module.perf_counter() - start, **labels)
+    
+    @staticmethod
+    def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+        items = labels + extra
+        if not items:
+            return ''
+        escaped = (f'{k}="{str(v)}"'.replace('\\', '\\\\').replace('\n', '\\n') for k, v in items)
+        return '{' + ','.join(escaped) + '}'
+    
+    def render(self) -> str:
+        """Gera a exposição no formato de texto do Prometheus"""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: list(value) for key, value in self._histograms.items()}
+        gauges = {}
+        for key, fn in list(self._gauges.items()):
+            try:
+                gauges[key] = fn()
+            except Exception:
+                continue
+        
+        by_name: Dict[str, List[str]] = {}
+        for (name, labels), value in counters.items():
+            by_name.setdefault(name, []).append(f'{name}{self._format_labels(labels)} {value}')
+        for (name, labels), value in gauges.items():
+            by_name.setdefault(name, []).append(f'{name}{self._format_labels(labels)} {value}')
+        for (name, labels), histogram in histograms.items():
+            lines = by_name.setdefault(name, [])
+            cumulative = 0
+            for bound, count in zip(self.buckets, histogram):
+                cumulative += count
+                lines.append(f'{name}_bucket{self._format_labels(labels, (("le", bound),))} {cumulative}')
+            lines.append(f'{name}_bucket{self._format_labels(labels, (("le", "+Inf"),))} {histogram[-1]}')
+            lines.append(f'{name}_sum{self._format_labels(labels)} {histogram[-2]}')
+            lines.append(f'{name}_count{self._format_labels(labels)} {histogram[-1]}')
+        
+        output = []
+        for name in sorted(by_name):
+            if name in self._help:
+                kind, help_text = self._help[name]
+                output.append(f'# HELP {name} {help_text}')
+                output.append(f'# TYPE {name} {kind}')
+            output.extend(sorted(by_name[name]))
+        return '\n'.join(output) + '\n'
 
-class DatabaseManager:
-    """Gerenciador do banco de dados SQLite"""
+def _resident_memory_bytes() -> float:
+    """Memória residente do processo (Linux); 0 se indisponível"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+# Registro global de métricas
+metrics = MetricsRegistry()
+metrics.describe('bot_handler_duration_seconds', 'histogram', 'Duração dos handlers e jobs do bot')
+metrics.describe('bot_handler_errors_total', 'counter', 'Exceções lançadas pelos handlers e jobs')
+metrics.describe('bot_db_query_duration_seconds', 'histogram', 'Tempo de execução dos jobs de banco nas threads do SQLite')
+metrics.describe('bot_db_queue_wait_seconds', 'histogram', 'Tempo de espera dos jobs de banco antes de executar')
+metrics.describe('bot_db_errors_total', 'counter', 'Falhas em jobs de banco')
+metrics.describe('bot_db_call_duration_seconds', 'histogram', 'Duração das chamadas ao DatabaseManager (inclui fila e backpressure)')
+metrics.describe('bot_db_call_errors_total', 'counter', 'Exceções lançadas por chamadas ao DatabaseManager')
+metrics.describe('bot_send_duration_seconds', 'histogram', 'Latência das chamadas a send_message')
+metrics.describe('bot_send_errors_total', 'counter', 'Falhas em send_message por tipo de erro')
+metrics.describe('bot_update_queue_depth', 'gauge', 'Updates aguardando processamento (update_queue + processador)')
+metrics.describe('bot_update_wait_seconds', 'histogram', 'Espera de cada update pela vez do seu chat/usuário e por uma vaga de processamento')
+metrics.describe('bot_updates_in_flight', 'gauge', 'Updates sendo processados por handlers neste momento')
+metrics.describe('bot_write_buffer_pending', 'gauge', 'Linhas aguardando flush no buffer de escrita')
+metrics.describe('bot_messages_archived_total', 'counter', 'Mensagens movidas para os arquivos compactados')
+metrics.describe('bot_db_size_bytes', 'gauge', 'Tamanho do arquivo do banco SQLite')
+metrics.describe('bot_flood_dropped_total', 'counter', 'Mensagens descartadas pelo anti-flood antes de chegar ao banco')
+metrics.describe('bot_flood_mutes_total', 'counter', 'Usuários silenciados por flood, por resultado')
+metrics.describe('bot_flood_tracked_keys', 'gauge', 'Usuários e chats acompanhados pelo anti-flood')
+metrics.describe('bot_schedule_fires_total', 'counter', 'Disparos de envios programados por resultado')
+metrics.describe('bot_schedules_active', 'gauge', 'Envios programados ativos')
+metrics.describe('bot_persistence_rows_written_total', 'counter', 'Entradas de user_data/chat_data/bot_data gravadas ou removidas, por tipo')
+metrics.describe('bot_persistence_pending', 'gauge', 'Entradas alteradas aguardando a próxima gravação da persistência')
+metrics.describe('bot_admin_refresh_total', 'counter', 'Atualizações da lista de administradores por resultado')
+metrics.describe('process_resident_memory_bytes', 'gauge', 'Memória residente do processo')
+metrics.describe('process_cpu_seconds_total', 'counter', 'Tempo de CPU consumido pelo processo')
+metrics.gauge('process_resident_memory_bytes', _resident_memory_bytes)
+metrics.gauge('process_cpu_seconds_total', time_module.process_time)
+
+def instrumented(name: str, callback: Callable[..., Awaitable]) -> Callable[..., Awaitable]:
+    """Envolve um handler/job para medir latência e contar erros"""
+    @functools.wraps(callback)
+    async def wrapper(*args, **kwargs):
+        with metrics.timer('bot_handler_duration_seconds', 'bot_handler_errors_total', handler=name):
+            return await callback(*args, **kwargs)
+    return wrapper
+
+def instrument_async_methods(metric: str, error_counter: str):
+    """Decorador de classe: mede a duração de cada método assíncrono público"""
+    def decorator(cls):
+        for name, attr in list(vars(cls).items()):
+            if name.startswith('_') or not inspect.iscoroutinefunction(attr):
+                continue
+            
+            def wrap(method, method_name=f'{cls.__name__}.{name}'):
+                @functools.wraps(method)
+                async def wrapper(*args, **kwargs):
+                    with metrics.timer(metric, error_counter, method=method_name):
+                        return await method(*args, **kwargs)
+                return wrapper
+            setattr(cls, name, wrap(attr))
+        return cls
+    return decorator
+
+class StartupProfile:
+    """Duração de cada fase da inicialização, do import do módulo ao primeiro update.
+
+    As fases são sempre medidas e expostas em bot_startup_phase_seconds; com
+    STARTUP_PROFILE=1 (ou --profile-startup) o perfil completo vai para o log
+    quando o primeiro update chega. Fases podem se sobrepor (ex.: banco e getMe).
+    """
+
+    def __init__(self, started: float):
+        self.started = started
+        self._last = started
+        self.phases: List[tuple] = []  # (fase, início relativo, duração)
+        self.reported = False
+
+    def record(self, phase: str, start: float, end: float):
+        duration = end - start
+        self.phases.append((phase, start - self.started, duration))
+        metrics.gauge('bot_startup_phase_seconds', lambda: duration, phase=phase)
+
+    def mark(self, phase: str):
+        """Encerra a fase sequencial que começou na marca anterior"""
+        now = time_module.perf_counter()
+        self.record(phase, self._last, now)
+        self._last = now
+
+    async def timed(self, phase: str, coroutine: Awaitable) -> Any:
+        """Aguarda a corrotina registrando sua duração (permite fases concorrentes)"""
+        start = time_module.perf_counter()
+        try:
+            return await coroutine
+        finally:
+            self.record(phase, start, time_module.perf_counter())
+            self._last = max(self._last, time_module.perf_counter())
+
+    @property
+    def elapsed(self) -> float:
+        return time_module.perf_counter() - self.started
+
+    def report(self) -> str:
+        lines = [f"{'fase':<18}{'início':>10}{'duração':>10}"]
+        for phase, offset, duration in self.phases:
+            lines.append(f"{phase:<18}{offset * 1000:>8.1f}ms{duration * 1000:>8.1f}ms")
+        lines.append(f"{'total':<18}{'':>10}{self.elapsed * 1000:>8.1f}ms")
+        return '\n'.join(lines)
+
+metrics.describe('bot_startup_phase_seconds', 'gauge', 'Duração de cada fase da inicialização do processo')
+
+# Perfil da inicialização atual
+startup_profile = StartupProfile(STARTUP_T0)
+startup_profile.mark('imports')
+
+class InstrumentedBot(ExtBot):
+    """ExtBot que mede a latência e os erros de todas as chamadas a send_message"""
+    
+    async def send_message(self, *args, **kwargs):
+        with metrics.timer('bot_send_duration_seconds', 'bot_send_errors_total'):
+            return await super().send_message(*args, **kwargs)
+
+class SQLiteEngine:
+    """Motor de armazenamento SQLite com conexões persistentes em modo WAL.
+    
+    Todas as escritas são serializadas em uma thread dedicada e as leituras
+    rodam em um pool de threads, de modo que nenhum SQL executa no event loop.
+    """
     
-    def __init__(self, db_path: str = 'bot_data.db'):
+    def __init__(self, db_path: str, reader_threads: int = 2):
         self.db_path = db_path
-        self.init_database()
+        self._write_queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._readers = ThreadPoolExecutor(
+            max_workers=max(1, reader_threads),
+            thread_name_prefix='sqlite-reader'
+        )
+        self._writer = threading.Thread(target=self._writer_loop, name='sqlite-writer', daemon=True)
+        self._closed = False
+        self._writer.start()
     
-    def init_database(self):
-        """Inicializa o banco de dados com as tabelas necessárias"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            
-            # Tabela de usuários
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id INTEGER PRIMARY KEY,
-                    username TEXT,
-                    first_name TEXT,
-                    last_name TEXT,
-                    join_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    is_active BOOLEAN DEFAULT 1
+    def _connect(self, readonly: bool = False) -> sqlite3.Connection:
+        """Abre uma conexão configurada para uso de longa duração"""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        # Só tem efeito em um arquivo novo, e precisa vir antes do WAL gravar o cabeçalho
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA busy_timeout=30000')
+        if readonly:
+            conn.execute('PRAGMA query_only=1')
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+    
+    def _reader_connection(self) -> sqlite3.Connection:
+        """Retorna a conexão de leitura da thread atual"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect(readonly=True)
+            self._local.conn = conn
+        return conn
+    
+    def _writer_loop(self):
+        """Loop da thread de escrita: executa cada job em uma transação"""
+        conn = self._connect()
+        while True:
+            item = self._write_queue.get()
+            if item is None:
+                break
+            fn, args, future, enqueued = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            metrics.observe('bot_db_queue_wait_seconds', time_module.perf_counter() - enqueued, op='write')
+            try:
+                with metrics.timer('bot_db_query_duration_seconds', 'bot_db_errors_total',
+                                   op='write', query=self._label(fn)):
+                    with conn:
+                        result = fn(conn, *args)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+    
+    @staticmethod
+    def _label(fn: Callable) -> str:
+        """Nome do método que originou o job (ex.: DatabaseManager.add_meeting)"""
+        return getattr(fn, '__qualname__', repr(fn)).split('.<locals>')[0]
+    
+    def _run_read(self, fn: Callable, args: tuple, enqueued: float) -> Any:
+        """Executa uma função de leitura na conexão da thread do pool"""
+        metrics.observe('bot_db_queue_wait_seconds', time_module.perf_counter() - enqueued, op='read')
+        with metrics.timer('bot_db_query_duration_seconds', 'bot_db_errors_total',
+                           op='read', query=self._label(fn)):
+            return fn(self._reader_connection(), *args)
+    
+    def submit_write(self, fn: Callable, *args) -> Future:
+        """Enfileira uma função de escrita; recebe a conexão como primeiro argumento"""
+        if self._closed:
+            raise RuntimeError("SQLiteEngine já foi encerrado")
+        future: Future = Future()
+        self._write_queue.put((fn, args, future, time_module.perf_counter()))
+        return future
+    
+    def submit_read(self, fn: Callable, *args) -> Future:
+        """Enfileira uma função de leitura no pool de leitores"""
+        if self._closed:
+            raise RuntimeError("SQLiteEngine já foi encerrado")
+        return self._readers.submit(self._run_read, fn, args, time_module.perf_counter())
+    
+    async def write(self, fn: Callable, *args) -> Any:
+        """Executa uma escrita fora do event loop e aguarda o resultado"""
+        return await asyncio.wrap_future(self.submit_write(fn, *args))
+    
+    async def read(self, fn: Callable, *args) -> Any:
+        """Executa uma leitura fora do event loop e aguarda o resultado"""
+        return await asyncio.wrap_future(self.submit_read(fn, *args))
+    
+    def write_sync(self, fn: Callable, *args) -> Any:
+        """Executa uma escrita de forma bloqueante (uso fora do event loop)"""
+        return self.submit_write(fn, *args).result()
+    
+    def close(self):
+        """Finaliza a thread de escrita, o pool de leitura e as conexões"""
+        if self._closed:
+            return
+        self._closed = True
+        self._write_queue.put(None)
+        self._writer.join()
+        self._readers.shutdown(wait=True)
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+# Migrações de esquema versionadas (PRAGMA user_version)
+def register_backfill(conn: sqlite3.Connection, name: str, table: str, column: str = 'rowid'):
+    """Registra um backfill online sobre as linhas já existentes de uma tabela.
+    
+    O limite superior é fixado no momento do registro; linhas gravadas depois
+    disso são tratadas pelo caminho normal de escrita, sem contagem dupla.
+    """
+    high_water = conn.execute(f'SELECT COALESCE(MAX({column}), 0) FROM {table}').fetchone()[0]
+    conn.execute('''
+        INSERT OR REPLACE INTO backfills (name, cursor, high_water, done)
+        VALUES (?, 0, ?, ?)
+    ''', (name, high_water, 1 if high_water == 0 else 0))
+
+def _migration_001_base_tables(conn: sqlite3.Connection):
+    """Tabelas originais do bot (compatível com bancos criados antes das migrações)"""
+    # Tabela de usuários
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            join_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_active BOOLEAN DEFAULT 1
+        )
+    ''')
+    
+    # Tabela de mensagens
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            chat_id INTEGER,
+            message_text TEXT,
+            message_type TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    ''')
+    
+    # Tabela de reuniões
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS meetings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            description TEXT,
+            scheduled_time TIMESTAMP NOT NULL,
+            created_by INTEGER,
+            is_active BOOLEAN DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (created_by) REFERENCES users (user_id)
+        )
+    ''')
+    
+    # Controle dos backfills online
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS backfills (
+            name TEXT PRIMARY KEY,
+            cursor INTEGER NOT NULL DEFAULT 0,
+            high_water INTEGER NOT NULL DEFAULT 0,
+            done INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+def _migration_002_stats_counters(conn: sqlite3.Connection):
+    """Contadores materializados do /stats"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS stats_counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS daily_user_joins (
+            day TEXT PRIMARY KEY,
+            count INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    if conn.execute('SELECT 1 FROM stats_counters LIMIT 1').fetchone() is not None:
+        return
+    
+    # Usuários são contados aqui mesmo: a tabela é pequena e user_id não é
+    # monotônico, então não serve como cursor de backfill
+    total_users = conn.execute('SELECT COUNT(*) FROM users WHERE is_active = 1').fetchone()[0]
+    conn.execute('''
+        INSERT INTO daily_user_joins (day, count)
+        SELECT DATE(join_date), COUNT(*) FROM users
+        WHERE is_active = 1 AND join_date IS NOT NULL
+        GROUP BY DATE(join_date)
+    ''')
+    conn.executemany('INSERT INTO stats_counters (name, value) VALUES (?, ?)',
+                     [('total_users', total_users), ('total_messages', 0)])
+    # Mensagens são contadas em blocos pelo backfill, sem travar a inicialização
+    register_backfill(conn, 'stats_messages', 'messages', 'id')
+
+def _migration_003_indexes(conn: sqlite3.Connection):
+    """Índices das consultas quentes"""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_messages_chat_timestamp ON messages (chat_id, timestamp)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_messages_user ON messages (user_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_users_join_date ON users (join_date)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_meetings_scheduled ON meetings (scheduled_time, is_active)')
+
+def _migration_004_meeting_notifications(conn: sqlite3.Connection):
+    """Controle de lembretes enviados e índice das reuniões pendentes"""
+    conn.execute('ALTER TABLE meetings ADD COLUMN notified_at TIMESTAMP')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_meetings_pending ON meetings (scheduled_time)
+        WHERE is_active = 1 AND notified_at IS NULL
+    ''')
+
+def _migration_005_meeting_epochs(conn: sqlite3.Connection):
+    """Horário das reuniões como epoch inteiro (UTC), com índices de intervalo"""
+    conn.execute('ALTER TABLE meetings ADD COLUMN scheduled_ts INTEGER')
+    # As strings ISO gravadas têm offset de fuso; o strftime do SQLite as converte para UTC.
+    # A tabela de reuniões é pequena, então a conversão é feita aqui mesmo.
+    conn.execute("UPDATE meetings SET scheduled_ts = CAST(strftime('%s', scheduled_time) AS INTEGER)")
+    conn.execute('DROP INDEX IF EXISTS idx_meetings_pending')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_meetings_pending_ts ON meetings (scheduled_ts)
+        WHERE is_active = 1 AND notified_at IS NULL
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_meetings_active_ts ON meetings (scheduled_ts, id)
+        WHERE is_active = 1
+    ''')
+
+def _migration_006_message_retention(conn: sqlite3.Connection):
+    """Catálogo dos arquivos de mensagens e contagens preservadas após o arquivamento"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS message_archives (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            path TEXT NOT NULL,
+            first_id INTEGER NOT NULL,
+            last_id INTEGER NOT NULL,
+            row_count INTEGER NOT NULL,
+            first_timestamp TIMESTAMP,
+            last_timestamp TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS archived_message_counts (
+            day TEXT NOT NULL,
+            chat_id INTEGER NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, chat_id)
+        )
+    ''')
+    conn.execute("INSERT OR IGNORE INTO stats_counters (name, value) VALUES ('archived_messages', 0)")
+
+def _migration_007_chat_daily_stats(conn: sqlite3.Connection):
+    """Rollups diários por chat (mensagens, usuários ativos e entradas)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS chat_daily_stats (
+            day TEXT NOT NULL,
+            chat_id INTEGER NOT NULL,
+            messages INTEGER NOT NULL DEFAULT 0,
+            active_users INTEGER NOT NULL DEFAULT 0,
+            joins INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, chat_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS chat_daily_users (
+            day TEXT NOT NULL,
+            chat_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            PRIMARY KEY (day, chat_id, user_id)
+        ) WITHOUT ROWID
+    ''')
+    # Mensagens já arquivadas só sobrevivem como contagens
+    conn.execute('''
+        INSERT INTO chat_daily_stats (day, chat_id, messages)
+        SELECT day, chat_id, count FROM archived_message_counts WHERE true
+        ON CONFLICT(day, chat_id) DO UPDATE SET messages = messages + excluded.messages
+    ''')
+    register_backfill(conn, 'chat_daily_stats', 'messages', 'id')
+
+def _migration_008_messages_fts(conn: sqlite3.Connection):
+    """Índice de busca textual (FTS5) sobre messages, sincronizado por triggers"""
+    # Tabela de conteúdo externo: o texto fica só em messages, o índice guarda os tokens
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+            message_text,
+            content='messages',
+            content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts (rowid, message_text) VALUES (new.id, new.message_text);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, message_text) VALUES ('delete', old.id, old.message_text);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF message_text ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, message_text) VALUES ('delete', old.id, old.message_text);
+            INSERT INTO messages_fts (rowid, message_text) VALUES (new.id, new.message_text);
+        END
+    ''')
+    # Linhas existentes são indexadas em blocos; o MessageArchiver espera o backfill terminar
+    register_backfill(conn, 'messages_fts', 'messages', 'id')
+
+def _migration_009_groups(conn: sqlite3.Connection):
+    """Registro de grupos gerenciados, semeado com GRUPO_PRINCIPAL_ID e GRUPO_DUVIDAS_ID"""
+    # welcome_template: NULL usa o template padrão do papel; '' desativa as boas-vindas
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS groups (
+            chat_id INTEGER PRIMARY KEY,
+            alias TEXT NOT NULL UNIQUE COLLATE NOCASE,
+            title TEXT NOT NULL,
+            role TEXT NOT NULL,
+            welcome_template TEXT,
+            broadcast INTEGER NOT NULL DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    seeds = [(GRUPO_PRINCIPAL_ID, 'principal', 'Grupo Principal', 'principal'),
+             (GRUPO_DUVIDAS_ID, 'duvidas', 'Grupo de Dúvidas', 'duvidas')]
+    conn.executemany('INSERT OR IGNORE INTO groups (chat_id, alias, title, role) VALUES (?, ?, ?, ?)',
+                     [seed for seed in seeds if seed[0]])
+
+def _migration_010_schedules(conn: sqlite3.Connection):
+    """Envios recorrentes (cron), semeados com a mensagem matinal das 8:00 nos grupos principais"""
+    # last_fire_ts: horário previsto do último disparo tratado, base para recuperar os perdidos
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schedules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            cron TEXT NOT NULL,
+            timezone TEXT NOT NULL,
+            template TEXT NOT NULL,
+            target TEXT NOT NULL,
+            catch_up TEXT NOT NULL DEFAULT 'ignorar',
+            is_active INTEGER NOT NULL DEFAULT 1,
+            last_fire_ts INTEGER,
+            created_by INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        INSERT INTO schedules (cron, timezone, template, target, catch_up, last_fire_ts, created_by)
+        VALUES ('0 8 * * *', ?, 'morning', 'principal', 'ignorar', CAST(strftime('%s', 'now') AS INTEGER), 0)
+    ''', (TIMEZONE.zone,))
+
+def _migration_011_persistence(conn: sqlite3.Connection):
+    """Persistência do PTB: user_data, chat_data e bot_data (uma linha por entrada) e estados de conversa"""
+    # kind: 'user', 'chat' ou 'bot' (id 0); data: pickle do dicionário
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS persistence_data (
+            kind TEXT NOT NULL,
+            id INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            updated_at INTEGER NOT NULL,
+            PRIMARY KEY (kind, id)
+        )
+    ''')
+    # key: chave da conversa em JSON (lista de IDs); state: pickle do estado
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS persistence_conversations (
+            name TEXT NOT NULL,
+            key TEXT NOT NULL,
+            state BLOB NOT NULL,
+            PRIMARY KEY (name, key)
+        )
+    ''')
+
+def _migration_012_meeting_claims(conn: sqlite3.Connection):
+    """Lembrete em envio (notify_claimed_at), separado do lembrete entregue (notified_at)"""
+    conn.execute('ALTER TABLE meetings ADD COLUMN notify_claimed_at TIMESTAMP')
+
+MIGRATIONS: List[tuple] = [
+    (1, 'tabelas base', _migration_001_base_tables),
+    (2, 'contadores de estatísticas', _migration_002_stats_counters),
+    (3, 'índices', _migration_003_indexes),
+    (4, 'lembretes de reunião', _migration_004_meeting_notifications),
+    (5, 'horários de reunião em epoch', _migration_005_meeting_epochs),
+    (6, 'retenção de mensagens', _migration_006_message_retention),
+    (7, 'rollups diários por chat', _migration_007_chat_daily_stats),
+    (8, 'busca textual nas mensagens', _migration_008_messages_fts),
+    (9, 'registro de grupos', _migration_009_groups),
+    (10, 'envios programados', _migration_010_schedules),
+    (11, 'persistência do PTB', _migration_011_persistence),
+    (12, 'lembretes em envio', _migration_012_meeting_claims),
+]
+
+def migrate_database(conn: sqlite3.Connection, migrations: List[tuple] = MIGRATIONS) -> int:
+    """Aplica, em ordem, as migrações acima da versão atual do banco.
+    
+    Cada migração roda em sua própria transação junto com a atualização de
+    PRAGMA user_version, então uma falha não deixa o esquema pela metade.
+    """
+    current = conn.execute('PRAGMA user_version').fetchone()[0]
+    for version, name, migration in migrations:
+        if version <= current:
+            continue
+        logger.info(f"Aplicando migração {version}: {name}")
+        if not conn.in_transaction:
+            conn.execute('BEGIN')
+        try:
+            migration(conn)
+            conn.execute(f'PRAGMA user_version = {int(version)}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logger.error(f"Falha na migração {version}: {name}")
+            raise
+        current = version
+    return current
+
+# Backfills: nome -> função(conn, cursor_exclusivo, fim_inclusivo) que retorna deltas opcionais
+def _backfill_stats_messages(conn: sqlite3.Connection, start: int, end: int) -> Dict:
+    count = conn.execute('SELECT COUNT(*) FROM messages WHERE id > ? AND id <= ?', (start, end)).fetchone()[0]
+    conn.execute("UPDATE stats_counters SET value = value + ? WHERE name = 'total_messages'", (count,))
+    return {'messages': count}
+
+def _backfill_chat_daily_stats(conn: sqlite3.Connection, start: int, end: int) -> Dict:
+    rows = conn.execute(
+        'SELECT user_id, chat_id, timestamp FROM messages WHERE id > ? AND id <= ? AND timestamp IS NOT NULL',
+        (start, end)
+    ).fetchall()
+    ChatRollups.add(conn, rows, [])
+    return {}
+
+def _backfill_messages_fts(conn: sqlite3.Connection, start: int, end: int) -> Dict:
+    conn.execute('''
+        INSERT INTO messages_fts (rowid, message_text)
+        SELECT id, message_text FROM messages WHERE id > ? AND id <= ?
+    ''', (start, end))
+    return {}
+
+BACKFILLS: Dict[str, Callable] = {
+    'stats_messages': _backfill_stats_messages,
+    'chat_daily_stats': _backfill_chat_daily_stats,
+    'messages_fts': _backfill_messages_fts,
+}
+
+class BackfillRunner:
+    """Executa os backfills pendentes em blocos curtos, em segundo plano.
+    
+    Cada bloco é um job separado na thread de escrita, seguido de uma pausa,
+    para que o tráfego normal nunca espere muito pelo lock de escrita.
+    """
+    
+    def __init__(self, engine: SQLiteEngine, chunk_size: int = BACKFILL_CHUNK,
+                 pause_ms: int = BACKFILL_PAUSE_MS,
+                 on_commit: Optional[Callable[[str, Dict], None]] = None):
+        self.engine = engine
+        self.chunk_size = max(1, chunk_size)
+        self.pause = pause_ms / 1000
+        self.on_commit = on_commit
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self):
+        """Inicia a task de backfill no event loop atual"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run(), name='backfills')
+    
+    async def stop(self):
+        """Interrompe a task entre dois blocos; o progresso já está salvo"""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+    
+    @staticmethod
+    def _pending(conn: sqlite3.Connection) -> List[tuple]:
+        return conn.execute(
+            'SELECT name, cursor, high_water FROM backfills WHERE done = 0 ORDER BY name'
+        ).fetchall()
+    
+    def _step(self, conn: sqlite3.Connection, name: str, cursor: int, high_water: int) -> tuple:
+        """Processa um bloco e avança o cursor na mesma transação"""
+        end = min(cursor + self.chunk_size, high_water)
+        deltas = BACKFILLS[name](conn, cursor, end)
+        conn.execute('UPDATE backfills SET cursor = ?, done = ? WHERE name = ?',
+                     (end, 1 if end >= high_water else 0, name))
+        return end, deltas
+    
+    async def _run(self):
+        for name, cursor, high_water in await self.engine.read(self._pending):
+            if name not in BACKFILLS:
+                logger.warning(f"Backfill desconhecido ignorado: {name}")
+                continue
+            logger.info(f"Iniciando backfill {name} ({cursor}/{high_water})")
+            try:
+                while cursor < high_water:
+                    cursor, deltas = await self.engine.write(self._step, name, cursor, high_water)
+                    if deltas and self.on_commit:
+                        self.on_commit(name, deltas)
+                    await asyncio.sleep(self.pause)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Erro no backfill {name}: {e}")
+                continue
+            logger.info(f"Backfill {name} concluído")
+
+class StatsCounters:
+    """Contadores materializados de estatísticas, mantidos em memória e na tabela stats_counters.
+    
+    São incrementados na mesma transação que grava usuários e mensagens, de modo
+    que o /stats responde em tempo constante. `recount` refaz a contagem completa.
+    """
+    
+    def __init__(self):
+        self.total_users = 0
+        self.total_messages = 0
+        self.joins_by_day: Dict[str, int] = {}
+    
+    @staticmethod
+    def today() -> str:
+        """Dia corrente em UTC, no mesmo formato de DATE(join_date)"""
+        return datetime.now(timezone.utc).strftime('%Y-%m-%d')
+    
+    def snapshot(self) -> Dict:
+        """Retorna os valores atuais sem tocar no banco"""
+        return {
+            'total_users': self.total_users,
+            'users_today': self.joins_by_day.get(self.today(), 0),
+            'total_messages': self.total_messages
+        }
+    
+    def apply(self, deltas: Dict):
+        """Aplica os incrementos de um lote já commitado"""
+        self.total_users += deltas.get('new_users', 0)
+        self.total_messages += deltas.get('messages', 0)
+        if deltas.get('new_users'):
+            day = deltas['day']
+            self.joins_by_day[day] = self.joins_by_day.get(day, 0) + deltas['new_users']
+    
+    def load(self, values: Dict):
+        """Substitui os valores em memória pelos valores lidos do banco"""
+        self.total_users = values['total_users']
+        self.total_messages = values['total_messages']
+        self.joins_by_day = {values['day']: values['users_today']}
+    
+    @staticmethod
+    def increment(conn: sqlite3.Connection, deltas: Dict):
+        """Grava os incrementos na mesma transação do lote"""
+        conn.executemany('''
+            INSERT INTO stats_counters (name, value) VALUES (?, ?)
+            ON CONFLICT(name) DO UPDATE SET value = value + excluded.value
+        ''', [('total_users', deltas['new_users']), ('total_messages', deltas['messages'])])
+        if deltas['new_users']:
+            conn.execute('''
+                INSERT INTO daily_user_joins (day, count) VALUES (?, ?)
+                ON CONFLICT(day) DO UPDATE SET count = count + excluded.count
+            ''', (deltas['day'], deltas['new_users']))
+    
+    @staticmethod
+    def read(conn: sqlite3.Connection) -> Dict:
+        """Lê os contadores materializados (O(1))"""
+        values = dict(conn.execute('SELECT name, value FROM stats_counters').fetchall())
+        day = StatsCounters.today()
+        row = conn.execute('SELECT count FROM daily_user_joins WHERE day = ?', (day,)).fetchone()
+        return {
+            'total_users': values.get('total_users', 0),
+            'total_messages': values.get('total_messages', 0),
+            'users_today': row[0] if row else 0,
+            'day': day
+        }
+    
+    @staticmethod
+    def recount(conn: sqlite3.Connection) -> Dict:
+        """Refaz a contagem completa e regrava os contadores materializados"""
+        total_users = conn.execute('SELECT COUNT(*) FROM users WHERE is_active = 1').fetchone()[0]
+        # Mensagens arquivadas saem da tabela, mas continuam contando no total
+        archived = conn.execute("SELECT value FROM stats_counters WHERE name = 'archived_messages'").fetchone()
+        total_messages = conn.execute('SELECT COUNT(*) FROM messages').fetchone()[0] + (archived[0] if archived else 0)
+        conn.execute('DELETE FROM daily_user_joins')
+        conn.execute('''
+            INSERT INTO daily_user_joins (day, count)
+            SELECT DATE(join_date), COUNT(*) FROM users
+            WHERE is_active = 1 AND join_date IS NOT NULL
+            GROUP BY DATE(join_date)
+        ''')
+        conn.executemany('INSERT OR REPLACE INTO stats_counters (name, value) VALUES (?, ?)',
+                         [('total_users', total_users), ('total_messages', total_messages)])
+        return StatsCounters.read(conn)
+
+class ChatRollups:
+    """Rollups diários por chat em chat_daily_stats, mantidos no mesmo lote das mensagens.
+    
+    Usuários ativos são deduplicados por (dia, chat, usuário) em chat_daily_users,
+    que também responde aos usuários distintos de um intervalo. Os dias são em UTC,
+    como os demais contadores.
+    """
+    
+    @staticmethod
+    def add(conn: sqlite3.Connection, messages: List[tuple], joins: List[tuple]):
+        """Agrega mensagens (user_id, chat_id, timestamp) e entradas (chat_id, user_id, dia)"""
+        totals: Dict[tuple, list] = {}
+        seen = set()
+        for user_id, chat_id, timestamp in messages:
+            key = (timestamp[:10], chat_id)
+            counts = totals.setdefault(key, [0, 0, 0])
+            counts[0] += 1
+            if user_id is not None and (key, user_id) not in seen:
+                seen.add((key, user_id))
+                cursor = conn.execute(
+                    'INSERT OR IGNORE INTO chat_daily_users (day, chat_id, user_id) VALUES (?, ?, ?)',
+                    (key[0], chat_id, user_id)
                 )
-            ''')
+                counts[1] += cursor.rowcount
+        for chat_id, _user_id, day in joins:
+            totals.setdefault((day, chat_id), [0, 0, 0])[2] += 1
+        conn.executemany('''
+            INSERT INTO chat_daily_stats (day, chat_id, messages, active_users, joins) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(day, chat_id) DO UPDATE SET
+                messages = messages + excluded.messages,
+                active_users = active_users + excluded.active_users,
+                joins = joins + excluded.joins
+        ''', [(day, chat_id, *counts) for (day, chat_id), counts in totals.items()])
+    
+    @staticmethod
+    def query(conn: sqlite3.Connection, start_day: str, end_day: str, limit: int = 10) -> Dict:
+        """Totais do intervalo [start_day, end_day] e os grupos mais ativos"""
+        messages, joins = conn.execute('''
+            SELECT COALESCE(SUM(messages), 0), COALESCE(SUM(joins), 0)
+            FROM chat_daily_stats WHERE day BETWEEN ? AND ?
+        ''', (start_day, end_day)).fetchone()
+        active = conn.execute('''
+            SELECT COUNT(DISTINCT user_id) FROM chat_daily_users WHERE day BETWEEN ? AND ?
+        ''', (start_day, end_day)).fetchone()[0]
+        groups = conn.execute('''
+            SELECT s.chat_id, SUM(s.messages), SUM(s.joins),
+                   (SELECT COUNT(DISTINCT u.user_id) FROM chat_daily_users u
+                    WHERE u.chat_id = s.chat_id AND u.day BETWEEN ? AND ?)
+            FROM chat_daily_stats s
+            WHERE s.day BETWEEN ? AND ? AND s.chat_id < 0
+            GROUP BY s.chat_id
+            ORDER BY SUM(s.messages) DESC
+            LIMIT ?
+        ''', (start_day, end_day, start_day, end_day, limit)).fetchall()
+        return {
+            'messages': messages,
+            'joins': joins,
+            'active_users': active,
+            'groups': [
+                {'chat_id': chat_id, 'messages': msgs, 'joins': chat_joins, 'active_users': users}
+                for chat_id, msgs, chat_joins, users in groups
+            ]
+        }
+
+class UserProfileCache:
+    """Cache LRU dos perfis (username, nome, sobrenome) já gravados no banco"""
+    
+    def __init__(self, capacity: int = USER_CACHE_SIZE):
+        self.capacity = max(1, capacity)
+        self._profiles: "OrderedDict[int, tuple]" = OrderedDict()
+    
+    def __len__(self) -> int:
+        return len(self._profiles)
+    
+    def matches(self, user_id: int, profile: tuple) -> bool:
+        """Indica se o perfil em cache é idêntico (e marca o usuário como recente)"""
+        cached = self._profiles.get(user_id)
+        if cached is None:
+            return False
+        self._profiles.move_to_end(user_id)
+        return cached == profile
+    
+    def put(self, user_id: int, profile: tuple):
+        """Registra o perfil, removendo o menos recente se o cache estiver cheio"""
+        self._profiles[user_id] = profile
+        self._profiles.move_to_end(user_id)
+        while len(self._profiles) > self.capacity:
+            self._profiles.popitem(last=False)
+    
+    def discard(self, user_id: int):
+        """Remove um usuário do cache (ex.: quando a gravação falhou)"""
+        self._profiles.pop(user_id, None)
+
+class TTLCache:
+    """Cache simples com expiração por tempo e limite de entradas"""
+    
+    def __init__(self, ttl: float, max_entries: int = 256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data: "OrderedDict[Any, tuple]" = OrderedDict()
+    
+    def get(self, key) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires, value = item
+        if expires < time_module.monotonic():
+            del self._data[key]
+            return None
+        return value
+    
+    def put(self, key, value):
+        self._data[key] = (time_module.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+    
+    def clear(self):
+        self._data.clear()
+
+class SlidingWindowLimiter:
+    """Limite de `limit` eventos por janela deslizante de `window` segundos, por chave.
+    
+    Cada chave guarda apenas os horários dos seus últimos `limit` eventos em um
+    buffer circular (array de doubles): o evento é permitido se o mais antigo deles
+    já saiu da janela. Registrar e verificar custa O(1). Chaves sem eventos há mais
+    de uma janela são descartadas aos poucos a cada chamada e nunca há mais de
+    `max_keys` chaves, então a memória é limitada mesmo com milhões de usuários.
+    Eventos recusados também são registrados: quem continua insistindo continua bloqueado.
+    """
+    
+    EVICT_PER_HIT = 2
+    
+    def __init__(self, limit: int, window: float, max_keys: int = FLOOD_MAX_TRACKED):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max(1, max_keys)
+        self._entries: "OrderedDict[Any, list]" = OrderedDict()  # chave -> [ring, posição]
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    @property
+    def enabled(self) -> bool:
+        return self.limit > 0 and self.window > 0
+    
+    def hit(self, key, now: float) -> bool:
+        """Registra um evento de `key` no instante `now` (monotônico); retorna se ele está dentro do limite"""
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = [array('d', [float('-inf')]) * self.limit, 0]
+        else:
+            self._entries.move_to_end(key)
+        ring, position = entry
+        allowed = now - ring[position] >= self.window
+        ring[position] = now
+        entry[1] = (position + 1) % self.limit
+        self._evict(now)
+        return allowed
+    
+    def _evict(self, now: float):
+        entries = self._entries
+        while len(entries) > self.max_keys:
+            entries.popitem(last=False)
+        # A chave menos recente está no início: se ela não está ociosa, nenhuma está
+        for _ in range(self.EVICT_PER_HIT):
+            if not entries:
+                return
+            ring, position = next(iter(entries.values()))
+            if now - ring[position - 1] < self.window:
+                return
+            entries.popitem(last=False)
+
+class FloodGuard:
+    """Anti-flood em memória para o caminho quente das mensagens.
+    
+    Mensagens acima do limite por usuário (em cada chat) ou por chat são descartadas
+    antes de qualquer gravação no banco. Quem estoura o limite por usuário em um grupo
+    gerenciado é silenciado por `mute_seconds` (uma única chamada à API por período).
+    """
+    
+    def __init__(self, user_limit: int = FLOOD_USER_LIMIT, user_window: float = FLOOD_USER_WINDOW,
+                 chat_limit: int = FLOOD_CHAT_LIMIT, chat_window: float = FLOOD_CHAT_WINDOW,
+                 mute_seconds: int = FLOOD_MUTE_SECONDS, max_keys: int = FLOOD_MAX_TRACKED):
+        self.users = SlidingWindowLimiter(user_limit, user_window, max_keys)
+        self.chats = SlidingWindowLimiter(chat_limit, chat_window, max_keys)
+        self.mute_seconds = mute_seconds
+        self._muted = TTLCache(ttl=max(1, mute_seconds), max_entries=max(1, max_keys // 10))
+    
+    @property
+    def tracked(self) -> int:
+        return len(self.users) + len(self.chats)
+    
+    def check(self, chat_id: int, user_id: int, exempt: bool = False) -> Optional[str]:
+        """Retorna None se a mensagem pode seguir, ou o limite estourado ('user' ou 'chat')"""
+        now = time_module.monotonic()
+        user_ok = exempt or not self.users.enabled or self.users.hit((chat_id, user_id), now)
+        chat_ok = not self.chats.enabled or self.chats.hit(chat_id, now)
+        if not user_ok:
+            return 'user'
+        if not chat_ok:
+            return 'chat'
+        return None
+    
+    def claim_mute(self, chat_id: int, user_id: int) -> bool:
+        """Indica se o usuário deve ser silenciado agora (False se já foi neste período)"""
+        if self.mute_seconds <= 0 or self._muted.get((chat_id, user_id)):
+            return False
+        self._muted.put((chat_id, user_id), True)
+        return True
+
+class WriteBehindBuffer:
+    """Buffer de escrita tardia que agrupa inserts em commits coletivos.
+    
+    As linhas ficam em uma fila limitada; quando a fila enche, `put` aguarda
+    (backpressure). Um flush ocorre a cada `max_batch` linhas ou a cada
+    `flush_interval_ms`, o que vier primeiro, com um único `executemany` por tabela.
+    """
+    
+    def __init__(self, engine: SQLiteEngine, max_batch: int = WRITE_BATCH_SIZE,
+                 flush_interval_ms: int = WRITE_FLUSH_MS, max_pending: int = WRITE_QUEUE_MAX,
+                 on_commit: Optional[Callable[[Dict], None]] = None,
+                 on_error: Optional[Callable[[List[int]], None]] = None):
+        self.engine = engine
+        self.on_commit = on_commit
+        self.on_error = on_error
+        self.max_batch = max(1, max_batch)
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_pending = max(self.max_batch, max_pending)
+        self._queue: Optional[asyncio.Queue] = None
+        self._batch_ready: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+    
+    def _ensure_started(self):
+        """Cria a fila e a task de flush no event loop atual"""
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+            self._batch_ready = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run(), name='write-behind-flush')
+    
+    async def put(self, kind: str, row: tuple):
+        """Enfileira uma linha para escrita ('user' ou 'message')"""
+        self._ensure_started()
+        await self._queue.put((kind, row))
+        if self._queue.qsize() >= self.max_batch:
+            self._batch_ready.set()
+    
+    @property
+    def pending(self) -> int:
+        """Quantidade de linhas aguardando flush"""
+        return self._queue.qsize() if self._queue else 0
+    
+    async def _run(self):
+        """Loop de flush: coleta um lote e grava em uma única transação"""
+        while True:
+            first = await self._queue.get()
+            if first is None:
+                return
+            # No encerramento grava sem esperar: o que está na fila é tudo o que virá
+            if not self._stopping and self._queue.qsize() < self.max_batch - 1:
+                try:
+                    await asyncio.wait_for(self._batch_ready.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._batch_ready.clear()
             
-            # Tabela de mensagens
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS messages (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    chat_id INTEGER,
-                    message_text TEXT,
-                    message_type TEXT,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (user_id)
-                )
-            ''')
+            batch = [first]
+            stop = False
+            while len(batch) < self.max_batch and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+            if stop:
+                await self._drain()
+                return
+    
+    async def _drain(self):
+        """Grava tudo o que restou na fila"""
+        while not self._queue.empty():
+            batch = []
+            while len(batch) < self.max_batch and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is not None:
+                    batch.append(item)
+            if batch:
+                await self._flush(batch)
+    
+    async def _flush(self, batch: List[tuple]):
+        """Separa o lote por tabela e grava com executemany"""
+        users: Dict[int, tuple] = {}
+        messages: List[tuple] = []
+        for kind, row in batch:
+            if kind == 'user':
+                users[row[0]] = row  # o último perfil do usuário no lote prevalece
+            else:
+                messages.append(row)
+        try:
+            deltas = await self.engine.write(self._write_batch, list(users.values()), messages)
+        except Exception as e:
+            logger.error(f"Erro ao gravar lote de {len(batch)} linhas: {e}")
+            if self.on_error:
+                self.on_error(list(users))
+            return
+        if self.on_commit:
+            self.on_commit(deltas)
+    
+    @staticmethod
+    def _write_batch(conn: sqlite3.Connection, users: List[tuple], messages: List[tuple],
+                     joins: List[tuple] = ()) -> Dict:
+        new_users = 0
+        if users:
+            ids = [row[0] for row in users]
+            known = set()
+            for i in range(0, len(ids), 900):
+                chunk = ids[i:i + 900]
+                placeholders = ','.join('?' * len(chunk))
+                known.update(r[0] for r in conn.execute(
+                    f'SELECT user_id FROM users WHERE user_id IN ({placeholders})', chunk
+                ))
+            new_users = len(set(ids) - known)
+            # Upsert real: preserva join_date/is_active e só reescreve a linha se o perfil mudou
+            conn.executemany('''
+                INSERT INTO users (user_id, username, first_name, last_name)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    username = excluded.username,
+                    first_name = excluded.first_name,
+                    last_name = excluded.last_name
+                WHERE users.username IS NOT excluded.username
+                   OR users.first_name IS NOT excluded.first_name
+                   OR users.last_name IS NOT excluded.last_name
+            ''', users)
+        if messages:
+            conn.executemany('''
+                INSERT INTO messages (user_id, chat_id, message_text, message_type, timestamp)
+                VALUES (?, ?, ?, ?, ?)
+            ''', messages)
+        if messages or joins:
+            ChatRollups.add(conn, [(row[0], row[1], row[4]) for row in messages], joins)
+        deltas = {'new_users': new_users, 'messages': len(messages), 'day': StatsCounters.today()}
+        StatsCounters.increment(conn, deltas)
+        return deltas
+    
+    async def stop(self):
+        """Grava as linhas pendentes e encerra a task de flush"""
+        if self._task is None or self._task.done():
+            return
+        self._stopping = True
+        self._batch_ready.set()
+        await self._queue.put(None)
+        await self._task
+
+class MessageArchiver:
+    """Retenção da tabela messages: move as linhas expiradas para arquivos compactados.
+    
+    Políticas: mensagens com mais de `retention_days` dias são arquivadas e, se o
+    banco passar de `size_budget_mb`, as mais antigas (com pelo menos um dia) também.
+    Cada bloco é lido no pool de leitura, gravado em um .jsonl.gz e só então apagado
+    em uma transação curta, seguida de um passo de incremental vacuum (só se o banco
+    já estiver em auto_vacuum incremental; ver `--compact-db`). As contagens
+    por dia e chat ficam em archived_message_counts e o total do /stats não muda.
+    """
+    
+    VACUUM_STEP_PAGES = 2000
+    MIN_AGE = timedelta(days=1)
+    
+    def __init__(self, engine: SQLiteEngine, archive_dir: str = ARCHIVE_DIR,
+                 retention_days: int = MESSAGE_RETENTION_DAYS, size_budget_mb: float = DB_SIZE_BUDGET_MB,
+                 chunk_size: int = RETENTION_CHUNK, interval_minutes: int = RETENTION_INTERVAL_MINUTES,
+                 pause_ms: int = BACKFILL_PAUSE_MS):
+        self.engine = engine
+        self.archive_dir = archive_dir
+        self.retention_days = retention_days
+        self.size_budget = int(size_budget_mb * 1024 * 1024)
+        self.chunk_size = max(1, chunk_size)
+        self.interval = max(1, interval_minutes) * 60
+        self.pause = pause_ms / 1000
+        self._task: Optional[asyncio.Task] = None
+        self._vacuum_warned = False
+    
+    @property
+    def enabled(self) -> bool:
+        return self.retention_days > 0 or self.size_budget > 0
+    
+    def start(self):
+        """Inicia a task de retenção no event loop atual"""
+        if self.enabled and (self._task is None or self._task.done()):
+            self._task = asyncio.get_running_loop().create_task(self._loop(), name='message-retention')
+    
+    async def stop(self):
+        """Interrompe a task entre dois blocos; cada bloco é atômico"""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+    
+    async def _loop(self):
+        while True:
+            try:
+                archived = await self.run()
+                if archived:
+                    logger.info(f"Retenção: {archived} mensagens arquivadas em {self.archive_dir}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Erro na retenção de mensagens: {e}")
+            await asyncio.sleep(self.interval)
+    
+    @staticmethod
+    def _size_and_backfills(conn: sqlite3.Connection) -> tuple:
+        """Tamanho ocupado pelos dados (sem páginas livres) e backfills pendentes"""
+        page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+        used = conn.execute('PRAGMA page_count').fetchone()[0] - conn.execute('PRAGMA freelist_count').fetchone()[0]
+        pending = conn.execute('SELECT COUNT(*) FROM backfills WHERE done = 0').fetchone()[0]
+        return used * page_size, pending
+    
+    @staticmethod
+    def _oldest_chunk(conn: sqlite3.Connection, limit: int) -> List[tuple]:
+        return conn.execute('''
+            SELECT id, user_id, chat_id, message_text, message_type, timestamp
+            FROM messages ORDER BY id LIMIT ?
+        ''', (limit,)).fetchall()
+    
+    def _expired_prefix(self, rows: List[tuple], over_budget: bool) -> List[tuple]:
+        """Prefixo do bloco (em ordem de id) que a política manda arquivar"""
+        now = datetime.now(timezone.utc)
+        cutoffs = []
+        if self.retention_days > 0:
+            cutoffs.append(now - timedelta(days=self.retention_days))
+        if over_budget:
+            cutoffs.append(now - self.MIN_AGE)
+        if not cutoffs:
+            # Só orçamento de tamanho, e o banco está abaixo dele: nada a arquivar
+            return []
+        cutoff = max(cutoffs).strftime('%Y-%m-%d %H:%M:%S')
+        prefix = []
+        for row in rows:
+            if row[5] is None or row[5] >= cutoff:
+                break
+            prefix.append(row)
+        return prefix
+    
+    def _write_archive(self, rows: List[tuple]) -> str:
+        """Grava o bloco em um .jsonl.gz (idempotente: o nome vem do intervalo de ids)"""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = os.path.join(self.archive_dir, f'messages_{rows[0][0]:012d}_{rows[-1][0]:012d}.jsonl.gz')
+        tmp_path = path + '.tmp'
+        with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=6) as f:
+            for id_, user_id, chat_id, text, message_type, timestamp in rows:
+                f.write(json.dumps({
+                    'id': id_, 'user_id': user_id, 'chat_id': chat_id, 'text': text,
+                    'type': message_type, 'timestamp': timestamp
+                }, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        return path
+    
+    @staticmethod
+    def _delete_archived(conn: sqlite3.Connection, path: str, rows: List[tuple]):
+        """Remove o bloco já arquivado e preserva as contagens, na mesma transação"""
+        counts: Dict[tuple, int] = {}
+        for row in rows:
+            key = (row[5][:10], row[2])
+            counts[key] = counts.get(key, 0) + 1
+        # Os ids são crescentes e o bloco foi lido do início da tabela: apagar até o
+        # último id remove exatamente as linhas arquivadas
+        conn.execute('DELETE FROM messages WHERE id <= ?', (rows[-1][0],))
+        conn.executemany('''
+            INSERT INTO archived_message_counts (day, chat_id, count) VALUES (?, ?, ?)
+            ON CONFLICT(day, chat_id) DO UPDATE SET count = count + excluded.count
+        ''', [(day, chat_id, count) for (day, chat_id), count in counts.items()])
+        conn.execute('''
+            INSERT INTO stats_counters (name, value) VALUES ('archived_messages', ?)
+            ON CONFLICT(name) DO UPDATE SET value = value + excluded.value
+        ''', (len(rows),))
+        conn.execute('''
+            INSERT INTO message_archives (path, first_id, last_id, row_count, first_timestamp, last_timestamp)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (os.path.basename(path), rows[0][0], rows[-1][0], len(rows), rows[0][5], rows[-1][5]))
+    
+    @staticmethod
+    def _auto_vacuum(conn: sqlite3.Connection) -> int:
+        return conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+    
+    @classmethod
+    def _vacuum_step(cls, conn: sqlite3.Connection) -> int:
+        """Devolve ao sistema parte das páginas livres; retorna quantas ainda restam"""
+        # executescript executa o pragma até o fim; execute() liberaria só uma página por passo
+        conn.executescript(f'PRAGMA incremental_vacuum({cls.VACUUM_STEP_PAGES})')
+        return conn.execute('PRAGMA freelist_count').fetchone()[0]
+    
+    async def run(self) -> int:
+        """Executa uma passada completa da política; retorna quantas mensagens arquivou"""
+        archived = 0
+        incremental = await self.engine.read(self._auto_vacuum) == 2
+        if not incremental and not self._vacuum_warned:
+            self._vacuum_warned = True
+            logger.warning("Retenção sem incremental_vacuum (auto_vacuum não é incremental): o espaço das "
+                           "mensagens arquivadas fica livre no banco, mas não volta ao disco")
+        while True:
+            used_bytes, pending_backfills = await self.engine.read(self._size_and_backfills)
+            if pending_backfills:
+                # O backfill de contagem ainda precisa ver as linhas antigas
+                break
+            over_budget = self.size_budget > 0 and used_bytes > self.size_budget
+            rows = self._expired_prefix(await self.engine.read(self._oldest_chunk, self.chunk_size), over_budget)
+            if not rows:
+                break
+            path = await asyncio.to_thread(self._write_archive, rows)
+            await self.engine.write(self._delete_archived, path, rows)
+            archived += len(rows)
+            metrics.inc('bot_messages_archived_total', len(rows))
+            if incremental:
+                await self.engine.write(self._vacuum_step)
+            await asyncio.sleep(self.pause)
+        if not incremental:
+            return archived
+        free_pages = await self.engine.write(self._vacuum_step)
+        while free_pages:
+            await asyncio.sleep(self.pause)
+            remaining = await self.engine.write(self._vacuum_step)
+            if remaining >= free_pages:
+                break
+            free_pages = remaining
+        return archived
+
+class ExportCancelled(Exception):
+    """Exportação interrompida (shutdown do bot ou consumidor das partes cancelado)"""
+
+class TableExporter:
+    """Exportação em streaming de usuários e mensagens para partes CSV/JSONL compactadas.
+
+    As linhas são lidas com fetchmany em uma conexão somente leitura própria (fora
+    do pool de leitura, para não prender os leitores do bot) e passam por geradores
+    até o gzip, então a memória usada não depende do tamanho da tabela. Cada parte é
+    um .gz independente (no CSV, com cabeçalho) menor que `part_bytes`, abaixo do
+    limite de upload de documentos do Telegram.
+    """
+
+    TABLES = {
+        'usuarios': (
+            '''SELECT user_id, username, first_name, last_name, join_date, is_active FROM users
+               WHERE (? IS NULL OR join_date >= ?) AND (? IS NULL OR join_date < ?)
+               ORDER BY user_id''',
+            ('user_id', 'username', 'first_name', 'last_name', 'join_date', 'is_active')
+        ),
+        'mensagens': (
+            '''SELECT id, user_id, chat_id, message_text, message_type, timestamp FROM messages
+               WHERE (? IS NULL OR timestamp >= ?) AND (? IS NULL OR timestamp < ?)
+                 AND (? IS NULL OR chat_id = ?)
+               ORDER BY id''',
+            ('id', 'user_id', 'chat_id', 'message_text', 'message_type', 'timestamp')
+        ),
+    }
+    FORMATS = ('csv', 'jsonl')
+    # Folga para o que o compressor ainda não escreveu no arquivo
+    PART_MARGIN = 1024 * 1024
+    # Partes prontas em disco aguardando envio (limita o espaço temporário usado)
+    MAX_READY_PARTS = 2
+
+    def __init__(self, db_path: str, fetch_size: int = EXPORT_FETCH_SIZE, part_mb: float = EXPORT_PART_MB):
+        self.db_path = db_path
+        self.fetch_size = max(1, fetch_size)
+        self.part_bytes = max(2 * self.PART_MARGIN, int(part_mb * 1024 * 1024))
+
+    def rows(self, conn: sqlite3.Connection, table: str, chat_id: Optional[int] = None,
+             start: Optional[str] = None, end: Optional[str] = None,
+             stop: Optional[threading.Event] = None) -> Iterator[tuple]:
+        """Percorre a tabela em blocos de `fetch_size` linhas"""
+        sql, _ = self.TABLES[table]
+        params = [start, start, end, end] + ([chat_id, chat_id] if table == 'mensagens' else [])
+        cursor = conn.execute(sql, params)
+        while True:
+            if stop is not None and stop.is_set():
+                raise ExportCancelled()
+            batch = cursor.fetchmany(self.fetch_size)
+            if not batch:
+                return
+            yield from batch
+
+    @staticmethod
+    def encode(rows: Iterator[tuple], fmt: str, columns: tuple) -> Iterator[str]:
+        """Converte cada linha em uma linha de texto CSV ou JSONL"""
+        if fmt == 'jsonl':
+            for row in rows:
+                yield json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n'
+            return
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow(row)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    @staticmethod
+    def header(fmt: str, columns: tuple) -> bytes:
+        return (','.join(columns) + '\r\n').encode('utf-8') if fmt == 'csv' else b''
+
+    def write_parts(self, table: str, fmt: str, out_dir: str,
+                    on_part: Optional[Callable[[str, int, int], None]] = None,
+                    wait_slot: Optional[Callable[[], None]] = None,
+                    stop: Optional[threading.Event] = None, **filters) -> int:
+        """Grava as partes em `out_dir` (bloqueante, para rodar em uma thread); retorna o total de linhas.
+
+        `on_part(caminho, número, linhas até aqui)` é chamado a cada parte concluída e
+        `wait_slot()` antes de abrir cada nova parte.
+        """
+        columns = self.TABLES[table][1]
+        prefix = f"{table}_{datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')}"
+        conn = sqlite3.connect(f'file:{os.path.abspath(self.db_path)}?mode=ro', uri=True, check_same_thread=False)
+        raw = out = path = None
+        part = count = 0
+        try:
+            for line in self.encode(self.rows(conn, table, stop=stop, **filters), fmt, columns):
+                if out is None:
+                    if wait_slot is not None:
+                        wait_slot()
+                    part += 1
+                    path = os.path.join(out_dir, f'{prefix}_parte{part:03d}.{fmt}.gz')
+                    raw = open(path, 'wb')
+                    out = gzip.GzipFile(filename='', mode='wb', fileobj=raw, compresslevel=6)
+                    out.write(self.header(fmt, columns))
+                out.write(line.encode('utf-8'))
+                count += 1
+                if raw.tell() >= self.part_bytes - self.PART_MARGIN:
+                    out.close()
+                    raw.close()
+                    out = None
+                    if on_part is not None:
+                        on_part(path, part, count)
+            if out is not None:
+                out.close()
+                raw.close()
+                out = None
+                if on_part is not None:
+                    on_part(path, part, count)
+            return count
+        finally:
+            conn.close()
+            if out is not None:
+                # Interrompida no meio de uma parte: descarta o arquivo incompleto
+                out.close()
+                raw.close()
+                os.remove(path)
+
+    async def iter_parts(self, table: str, fmt: str, out_dir: str, **filters) -> AsyncIterator[tuple]:
+        """Gera (caminho, número da parte, linhas até aqui) à medida que as partes ficam prontas.
+
+        A leitura roda em uma thread; cada arquivo é apagado depois de consumido e a
+        thread espera enquanto houver `MAX_READY_PARTS` partes prontas não consumidas.
+        """
+        loop = asyncio.get_running_loop()
+        ready: asyncio.Queue = asyncio.Queue()
+        slots = threading.Semaphore(self.MAX_READY_PARTS)
+        stop = threading.Event()
+
+        def wait_slot():
+            while not slots.acquire(timeout=0.5):
+                if stop.is_set():
+                    raise ExportCancelled()
+
+        def on_part(path: str, number: int, rows: int):
+            loop.call_soon_threadsafe(ready.put_nowait, (path, number, rows))
+
+        def discard_ready(future: asyncio.Future):
+            # Partes que ficaram prontas depois que o consumidor parou
+            if not future.cancelled():
+                future.exception()  # já tratado pelo consumidor ou irrelevante após a parada
+            while not ready.empty():
+                item = ready.get_nowait()
+                if item is not None and os.path.exists(item[0]):
+                    os.remove(item[0])
+
+        worker = asyncio.ensure_future(asyncio.to_thread(
+            self.write_parts, table, fmt, out_dir, on_part, wait_slot, stop, **filters
+        ))
+        worker.add_done_callback(lambda _: ready.put_nowait(None))
+        try:
+            while True:
+                item = await ready.get()
+                if item is None:
+                    break
+                try:
+                    yield item
+                finally:
+                    if os.path.exists(item[0]):
+                        os.remove(item[0])
+                    slots.release()
+            await worker  # propaga erros da leitura
+        finally:
+            stop.set()
+            if worker.done():
+                discard_ready(worker)
+            else:
+                worker.add_done_callback(discard_ready)
+
+@instrument_async_methods('bot_db_call_duration_seconds', 'bot_db_call_errors_total')
+class DatabaseManager:
+    """Gerenciador do banco de dados SQLite.
+    
+    Com `initialize=False` nenhum I/O acontece na construção: as migrações e a
+    leitura dos contadores ficam para `start()`, que roda na thread de escrita
+    em paralelo com o restante da inicialização do bot.
+    """
+    
+    def __init__(self, db_path: str = DATABASE_PATH, reader_threads: int = DB_READER_THREADS,
+                 initialize: bool = True):
+        self.db_path = db_path
+        self.ready = False
+        self._start_lock = asyncio.Lock()
+        self.engine = SQLiteEngine(db_path, reader_threads)
+        self.stats = StatsCounters()
+        self.user_cache = UserProfileCache()
+        self.meeting_pages = TTLCache(MEETING_LIST_CACHE_TTL)
+        self.buffer = WriteBehindBuffer(self.engine, on_commit=self.stats.apply,
+                                        on_error=self._on_buffer_error)
+        self.backfills = BackfillRunner(self.engine, on_commit=self._on_backfill_commit)
+        self.archiver = MessageArchiver(self.engine)
+        if initialize:
+            self.init_database()
+    
+    @staticmethod
+    def _check_incremental_vacuum(conn: sqlite3.Connection):
+        """Avisa se o banco é anterior ao auto_vacuum incremental (bancos novos já nascem com ele)"""
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            # A conversão exige um VACUUM completo (trava as escritas e usa até 2x o tamanho em disco)
+            logger.warning("Banco sem auto_vacuum incremental: o espaço das mensagens arquivadas não volta "
+                           "ao disco até rodar `python bot.py --compact-db` com o bot parado")
+    
+    @staticmethod
+    def compact(db_path: str = DATABASE_PATH):
+        """Conversão única para auto_vacuum incremental (VACUUM completo, com o bot parado)"""
+        conn = sqlite3.connect(db_path, isolation_level=None)
+        try:
+            before = os.path.getsize(db_path)
+            logger.info(f"Compactando {db_path} ({before / 1024 / 1024:.1f} MB) com auto_vacuum incremental")
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute('VACUUM')
+            logger.info(f"Banco compactado: {os.path.getsize(db_path) / 1024 / 1024:.1f} MB")
+        finally:
+            conn.close()
+    
+    def init_database(self):
+        """Aplica as migrações pendentes e carrega os contadores"""
+        self.engine.write_sync(self._check_incremental_vacuum)
+        version = self.engine.write_sync(migrate_database)
+        logger.info(f"Banco de dados na versão {version}")
+        self.stats.load(self.engine.write_sync(StatsCounters.read))
+        self.ready = True
+    
+    async def start(self):
+        """Versão assíncrona de init_database (não bloqueia o event loop); idempotente.
+        
+        Chamadas simultâneas (initialize() da persistência e run_bot) aguardam a primeira.
+        """
+        async with self._start_lock:
+            if self.ready:
+                return
+            await self.engine.write(self._check_incremental_vacuum)
+            version = await self.engine.write(migrate_database)
+            logger.info(f"Banco de dados na versão {version}")
+            self.stats.load(await self.engine.write(StatsCounters.read))
+            self.ready = True
+    
+    def _on_buffer_error(self, user_ids: List[int]):
+        """Esquece os perfis de um lote que não foi gravado, para regravar na próxima mensagem"""
+        for user_id in user_ids:
+            self.user_cache.discard(user_id)
+    
+    def _on_backfill_commit(self, name: str, deltas: Dict):
+        """Reflete nos contadores em memória o que um bloco de backfill gravou"""
+        if name == 'stats_messages':
+            self.stats.apply(deltas)
+    
+    
+    def close(self):
+        """Encerra as conexões do banco"""
+        self.engine.close()
+    
+    async def shutdown(self):
+        """Grava o buffer pendente e encerra as conexões do banco"""
+        await self.backfills.stop()
+        await self.archiver.stop()
+        await self.buffer.stop()
+        self.close()
+    
+    async def add_user(self, user_id: int, username: str = None, first_name: str = None, last_name: str = None):
+        """Adiciona ou atualiza um usuário; só grava se o perfil mudou (gravação agrupada pelo buffer)"""
+        profile = (username, first_name, last_name)
+        if self.user_cache.matches(user_id, profile):
+            return
+        self.user_cache.put(user_id, profile)
+        await self.buffer.put('user', (user_id, username, first_name, last_name))
+    
+    async def log_message(self, user_id: int, chat_id: int, message_text: str, message_type: str = 'user'):
+        """Registra uma mensagem no banco (gravação agrupada pelo buffer)"""
+        timestamp = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        await self.buffer.put('message', (user_id, chat_id, message_text, message_type, timestamp))
+    
+    async def add_members(self, chat_id: int, members: List[tuple]):
+        """Grava novos membros (user_id, username, nome, sobrenome) e suas entradas em uma única transação"""
+        users = [member for member in members if not self.user_cache.matches(member[0], member[1:])]
+        for member in users:
+            self.user_cache.put(member[0], member[1:])
+        day = StatsCounters.today()
+        joins = [(chat_id, member[0], day) for member in members]
+        try:
+            deltas = await self.engine.write(WriteBehindBuffer._write_batch, users, [], joins)
+        except Exception:
+            self._on_buffer_error([member[0] for member in users])
+            raise
+        self.stats.apply(deltas)
+    
+    async def get_range_stats(self, start_day: str, end_day: str) -> Dict:
+        """Estatísticas de um intervalo de dias (UTC, 'AAAA-MM-DD'), lidas só dos rollups"""
+        return await self.engine.read(ChatRollups.query, start_day, end_day)
+    
+    async def get_user_stats(self) -> Dict:
+        """Retorna estatísticas dos usuários a partir dos contadores materializados"""
+        return self.stats.snapshot()
+    
+    async def reconcile_user_stats(self) -> Dict:
+        """Refaz a contagem completa e retorna a diferença em relação aos contadores"""
+        before = self.stats.snapshot()
+        values = await self.engine.write(StatsCounters.recount)
+        self.stats.load(values)
+        after = self.stats.snapshot()
+        return {key: after[key] - before[key] for key in after}
+    
+    async def add_meeting(self, title: str, description: str, scheduled_time: datetime, created_by: int) -> int:
+        """Adiciona uma nova reunião"""
+        def _write(conn: sqlite3.Connection) -> int:
+            cursor = conn.execute('''
+                INSERT INTO meetings (title, description, scheduled_time, scheduled_ts, created_by)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (title, description, scheduled_time.isoformat(), int(scheduled_time.timestamp()), created_by))
+            return cursor.lastrowid
+        meeting_id = await self.engine.write(_write)
+        self.meeting_pages.clear()
+        return meeting_id
+    
+    async def cancel_meeting(self, meeting_id: int) -> bool:
+        """Desativa uma reunião; retorna False se ela não existir ou já estiver inativa"""
+        def _write(conn: sqlite3.Connection) -> bool:
+            cursor = conn.execute('UPDATE meetings SET is_active = 0 WHERE id = ? AND is_active = 1', (meeting_id,))
+            return cursor.rowcount == 1
+        cancelled = await self.engine.write(_write)
+        if cancelled:
+            self.meeting_pages.clear()
+        return cancelled
+    
+    @staticmethod
+    def _meeting_from_row(row: tuple) -> Dict:
+        return {
+            'id': row[0],
+            'title': row[1],
+            'description': row[2],
+            'scheduled_time': datetime.fromtimestamp(row[3], TIMEZONE),
+            'created_by': row[4]
+        }
+    
+    async def get_upcoming_meetings(self, limit: Optional[int] = None,
+                                    cursor: Optional[tuple] = None) -> Dict:
+        """Retorna reuniões futuras em páginas, com paginação por cursor (scheduled_ts, id).
+        
+        O resultado traz 'meetings' e 'next_cursor' (None na última página).
+        Páginas ficam em cache até uma reunião mudar ou o TTL expirar; a primeira
+        página (cursor "agora") também é relida assim que a reunião do topo começa.
+        """
+        key = (limit, cursor)
+        page = self.meeting_pages.get(key)
+        if page is not None and cursor is None and page['meetings'] \
+                and page['meetings'][0]['scheduled_time'].timestamp() <= time_module.time():
+            page = None
+        if page is not None:
+            return page
+        
+        def _read(conn: sqlite3.Connection) -> Dict:
+            after_ts, after_id = cursor or (int(time_module.time()), 0)
+            rows = conn.execute('''
+                SELECT id, title, description, scheduled_ts, created_by
+                FROM meetings 
+                WHERE is_active = 1 AND (scheduled_ts, id) > (?, ?)
+                ORDER BY scheduled_ts ASC, id ASC
+                LIMIT ?
+            ''', (after_ts, after_id, -1 if limit is None else limit + 1)).fetchall()
             
-            # Tabela de reuniões
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS meetings (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    title TEXT NOT NULL,
-                    description TEXT,
-                    scheduled_time TIMESTAMP NOT NULL,
-                    created_by INTEGER,
-                    is_active BOOLEAN DEFAULT 1,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (created_by) REFERENCES users (user_id)
-                )
-            ''')
+            next_cursor = None
+            if limit is not None and len(rows) > limit:
+                rows = rows[:limit]
+                next_cursor = (rows[-1][3], rows[-1][0])
+            return {
+                'meetings': [self._meeting_from_row(row) for row in rows],
+                'next_cursor': next_cursor
+            }
+        page = await self.engine.read(_read)
+        self.meeting_pages.put(key, page)
+        return page
+    
+    async def get_pending_meetings(self, after: datetime) -> List[Dict]:
+        """Retorna reuniões ativas, futuras e ainda não notificadas (usa idx_meetings_pending_ts).
+        
+        Reuniões que começaram antes de `after` ficam de fora de propósito: um
+        lembrete depois do início não serve mais (ver count_missed_meetings).
+        """
+        def _read(conn: sqlite3.Connection) -> List[Dict]:
+            cursor = conn.execute('''
+                SELECT id, title, description, scheduled_ts, created_by
+                FROM meetings 
+                WHERE is_active = 1 AND notified_at IS NULL AND scheduled_ts > ?
+                ORDER BY scheduled_ts ASC
+            ''', (int(after.timestamp()),))
+            return [self._meeting_from_row(row) for row in cursor.fetchall()]
+        return await self.engine.read(_read)
+    
+    async def count_missed_meetings(self, before: datetime) -> int:
+        """Reuniões ativas que começaram sem o lembrete ter sido entregue (bot parado no horário)"""
+        def _read(conn: sqlite3.Connection) -> int:
+            return conn.execute('''
+                SELECT COUNT(*) FROM meetings
+                WHERE is_active = 1 AND notified_at IS NULL AND scheduled_ts <= ?
+            ''', (int(before.timestamp()),)).fetchone()[0]
+        return await self.engine.read(_read)
+    
+    async def claim_meeting_notification(self, meeting_id: int) -> bool:
+        """Marca o lembrete como em envio; retorna False se já foi entregue, está em envio ou a reunião foi cancelada"""
+        def _write(conn: sqlite3.Connection) -> bool:
+            cursor = conn.execute('''
+                UPDATE meetings SET notify_claimed_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND notified_at IS NULL AND notify_claimed_at IS NULL AND is_active = 1
+            ''', (meeting_id,))
+            return cursor.rowcount == 1
+        return await self.engine.write(_write)
+    
+    async def finish_meeting_notification(self, meeting_id: int, delivered: bool):
+        """Encerra o envio: marca o lembrete como entregue ou libera a marcação para nova tentativa"""
+        def _write(conn: sqlite3.Connection):
+            if delivered:
+                conn.execute('''
+                    UPDATE meetings SET notified_at = CURRENT_TIMESTAMP, notify_claimed_at = NULL WHERE id = ?
+                ''', (meeting_id,))
+            else:
+                conn.execute('UPDATE meetings SET notify_claimed_at = NULL WHERE id = ?', (meeting_id,))
+        await self.engine.write(_write)
+    
+    async def release_meeting_claims(self) -> int:
+        """Libera os envios que ficaram pela metade (o processo anterior caiu entre marcar e entregar)"""
+        def _write(conn: sqlite3.Connection) -> int:
+            return conn.execute('''
+                UPDATE meetings SET notify_claimed_at = NULL
+                WHERE notified_at IS NULL AND notify_claimed_at IS NOT NULL
+            ''').rowcount
+        return await self.engine.write(_write)
+    
+    @staticmethod
+    def _schedule_from_row(row: tuple) -> Dict:
+        return {
+            'id': row[0],
+            'cron': row[1],
+            'timezone': row[2],
+            'template': row[3],
+            'target': row[4],
+            'catch_up': row[5],
+            'last_fire_ts': row[6]
+        }
+    
+    async def get_schedules(self) -> List[Dict]:
+        """Retorna os envios programados ativos"""
+        def _read(conn: sqlite3.Connection) -> List[Dict]:
+            rows = conn.execute('''
+                SELECT id, cron, timezone, template, target, catch_up, last_fire_ts
+                FROM schedules WHERE is_active = 1 ORDER BY id
+            ''').fetchall()
+            return [self._schedule_from_row(row) for row in rows]
+        return await self.engine.read(_read)
+    
+    async def add_schedule(self, cron: str, timezone: str, template: str, target: str,
+                           catch_up: str, created_by: int) -> Dict:
+        """Cria um envio programado; disparos anteriores à criação nunca são recuperados"""
+        now = int(time_module.time())
+        
+        def _write(conn: sqlite3.Connection) -> int:
+            cursor = conn.execute('''
+                INSERT INTO schedules (cron, timezone, template, target, catch_up, last_fire_ts, created_by)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (cron, timezone, template, target, catch_up, now, created_by))
+            return cursor.lastrowid
+        schedule_id = await self.engine.write(_write)
+        return self._schedule_from_row((schedule_id, cron, timezone, template, target, catch_up, now))
+    
+    async def cancel_schedule(self, schedule_id: int) -> bool:
+        """Desativa um envio programado; retorna False se ele não existir ou já estiver inativo"""
+        def _write(conn: sqlite3.Connection) -> bool:
+            cursor = conn.execute('UPDATE schedules SET is_active = 0 WHERE id = ? AND is_active = 1', (schedule_id,))
+            return cursor.rowcount == 1
+        return await self.engine.write(_write)
+    
+    async def claim_schedule_fire(self, schedule_id: int, fire_ts: int) -> bool:
+        """Registra o disparo previsto para `fire_ts`; retorna False se ele (ou um posterior) já foi tratado"""
+        def _write(conn: sqlite3.Connection) -> bool:
+            cursor = conn.execute('''
+                UPDATE schedules SET last_fire_ts = ?
+                WHERE id = ? AND is_active = 1 AND (last_fire_ts IS NULL OR last_fire_ts < ?)
+            ''', (fire_ts, schedule_id, fire_ts))
+            return cursor.rowcount == 1
+        return await self.engine.write(_write)
+    
+    GROUP_FIELDS = ('welcome_template', 'broadcast')
+    
+    @staticmethod
+    def read_groups(conn: sqlite3.Connection) -> List[Dict]:
+        """Lê todos os grupos cadastrados"""
+        rows = conn.execute('''
+            SELECT chat_id, alias, title, role, welcome_template, broadcast FROM groups ORDER BY alias
+        ''').fetchall()
+        return [
+            {'chat_id': row[0], 'alias': row[1], 'title': row[2], 'role': row[3],
+             'welcome_template': row[4], 'broadcast': bool(row[5])}
+            for row in rows
+        ]
+    
+    async def get_groups(self) -> List[Dict]:
+        """Retorna todos os grupos cadastrados"""
+        return await self.engine.read(self.read_groups)
+    
+    async def save_group(self, chat_id: int, alias: str, title: str, role: str):
+        """Cadastra um grupo ou atualiza apelido, nome e papel (levanta IntegrityError se o apelido estiver em uso)"""
+        def _write(conn: sqlite3.Connection):
+            conn.execute('''
+                INSERT INTO groups (chat_id, alias, title, role) VALUES (?, ?, ?, ?)
+                ON CONFLICT(chat_id) DO UPDATE SET
+                    alias = excluded.alias, title = excluded.title, role = excluded.role,
+                    updated_at = CURRENT_TIMESTAMP
+            ''', (chat_id, alias, title, role))
+        await self.engine.write(_write)
+    
+    async def update_group(self, chat_id: int, **fields) -> bool:
+        """Altera o template de boas-vindas e/ou a participação nos envios; retorna False se o grupo não existir"""
+        unknown = set(fields) - set(self.GROUP_FIELDS)
+        if unknown:
+            raise ValueError(f"campos inválidos: {', '.join(sorted(unknown))}")
+        assignments = ', '.join(f'{field} = ?' for field in fields)
+        
+        def _write(conn: sqlite3.Connection) -> bool:
+            cursor = conn.execute(
+                f'UPDATE groups SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE chat_id = ?',
+                (*fields.values(), chat_id)
+            )
+            return cursor.rowcount == 1
+        return await self.engine.write(_write)
+    
+    async def remove_group(self, chat_id: int) -> bool:
+        """Remove um grupo do cadastro; retorna False se ele não existir"""
+        def _write(conn: sqlite3.Connection) -> bool:
+            return conn.execute('DELETE FROM groups WHERE chat_id = ?', (chat_id,)).rowcount == 1
+        return await self.engine.write(_write)
+
+    @staticmethod
+    def fts_query(text: str) -> str:
+        """Converte o texto digitado em uma consulta FTS5 segura (termos entre aspas, prefixo com *)"""
+        terms = []
+        for word in text.split():
+            prefix = word.endswith('*')
+            word = word.replace('"', '').strip('*')
+            if word:
+                terms.append(f'"{word}"*' if prefix else f'"{word}"')
+        return ' '.join(terms)
+    
+    async def search_messages(self, text: str, chat_id: Optional[int] = None, start: Optional[str] = None,
+                              end: Optional[str] = None, limit: int = SEARCH_PAGE_SIZE, offset: int = 0,
+                              max_candidates: int = SEARCH_MAX_CANDIDATES) -> Dict:
+        """Busca textual ranqueada (bm25) nas mensagens, com filtros de chat e período (UTC, fim exclusivo).
+        
+        O ranking considera as `max_candidates` ocorrências mais recentes, o que mantém
+        o custo limitado mesmo para termos muito comuns. Retorna 'results' e 'has_more'.
+        """
+        match = self.fts_query(text)
+        if not match:
+            return {'results': [], 'has_more': False}
+        
+        def _read(conn: sqlite3.Connection) -> Dict:
+            # 1ª fase: ocorrências mais recentes (FTS5 percorre o índice em ordem de rowid) e ranking
+            rows = conn.execute('''
+                SELECT c.id, c.chat_id, c.timestamp, u.username, u.first_name
+                FROM (
+                    SELECT m.id, m.chat_id, m.user_id, m.timestamp, messages_fts.rank AS rank
+                    FROM messages_fts
+                    JOIN messages m ON m.id = messages_fts.rowid
+                    WHERE messages_fts MATCH ?
+                      AND (? IS NULL OR m.chat_id = ?)
+                      AND (? IS NULL OR m.timestamp >= ?)
+                      AND (? IS NULL OR m.timestamp < ?)
+                    ORDER BY messages_fts.rowid DESC
+                    LIMIT ?
+                ) c
+                LEFT JOIN users u ON u.user_id = c.user_id
+                ORDER BY c.rank, c.id DESC
+                LIMIT ? OFFSET ?
+            ''', (match, chat_id, chat_id, start, start, end, end, max_candidates, limit + 1, offset)).fetchall()
+            page = rows[:limit]
             
-            conn.commit()
+            # 2ª fase: trechos destacados só para a página exibida
+            snippets = {}
+            if page:
+                placeholders = ','.join('?' * len(page))
+                snippets = dict(conn.execute(f'''
+                    SELECT rowid, snippet(messages_fts, 0, '', '', '…', 16) FROM messages_fts
+                    WHERE messages_fts MATCH ? AND rowid IN ({placeholders})
+                ''', (match, *(row[0] for row in page))).fetchall())
+            return {
+                'results': [
+                    {'id': row[0], 'chat_id': row[1], 'timestamp': row[2], 'username': row[3],
+                     'first_name': row[4], 'snippet': snippets.get(row[0], '')}
+                    for row in page
+                ],
+                'has_more': len(rows) > limit
+            }
+        return await self.engine.read(_read)
+
+class TemplateError(ValueError):
+    """Template inválido (Markdown desbalanceado ou placeholder malformado)"""
+
+class TemplateRegistry:
+    """Registro de templates de mensagens carregado de um arquivo JSON.
+    
+    Cada template é validado e pré-processado uma única vez no carregamento:
+    textos sem variáveis ficam prontos para envio e os demais guardam a lista
+    de variáveis (ex.: {nome}), cujos valores são escapados para Markdown na
+    renderização. Um template pode ser um texto ou uma lista de variações.
+    O arquivo é recarregado quando muda, sem reiniciar o bot; se a nova versão
+    for inválida, a anterior continua em uso.
+    """
+    
+    MARKDOWN_ENTITIES = ('*', '_', '`')
+    
+    def __init__(self, path: str = TEMPLATES_PATH):
+        self.path = path
+        self._templates: Dict[str, List[tuple]] = {}
+        self._mtime: Optional[float] = None
+    
+    @staticmethod
+    def escape(value: Any) -> str:
+        """Escapa um valor para Markdown (legado) do Telegram"""
+        text = '' if value is None else str(value)
+        for char in ('_', '*', '`', '['):
+            text = text.replace(char, '\\' + char)
+        return text
+    
+    @classmethod
+    def compile(cls, name: str, text: str) -> tuple:
+        """Valida um texto e retorna (texto, variáveis)"""
+        if not isinstance(text, str):
+            raise TemplateError(f"{name}: o template deve ser texto")
+        for entity in cls.MARKDOWN_ENTITIES:
+            if text.count(entity) % 2:
+                raise TemplateError(f"{name}: '{entity}' sem fechamento no Markdown")
+        try:
+            parsed = [(field, spec, conversion) for _, field, spec, conversion in string.Formatter().parse(text)
+                      if field is not None]
+        except ValueError as e:
+            raise TemplateError(f"{name}: {e}") from e
+        for field, spec, conversion in parsed:
+            # Os valores chegam já escapados como texto: só {nome}, sem conversão nem formato
+            if not field.isidentifier() or spec or conversion:
+                raise TemplateError(f"{name}: variável inválida {{{field}}}")
+        return text, tuple(sorted({field for field, _, _ in parsed}))
     
-    def add_user(self, user_id: int, username: str = None, first_name: str = None, last_name: str = None):
-        """Adiciona ou atualiza um usuário"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT OR REPLACE INTO users (user_id, username, first_name, last_name)
-                VALUES (?, ?, ?, ?)
-            ''', (user_id, username, first_name, last_name))
-            conn.commit()
+    @classmethod
+    def parse(cls, data: Dict) -> Dict[str, List[tuple]]:
+        """Valida e pré-processa todos os templates de um dicionário"""
+        if not isinstance(data, dict):
+            raise TemplateError("o arquivo de templates deve conter um objeto JSON")
+        templates = {}
+        for name, value in data.items():
+            variants = value if isinstance(value, list) else [value]
+            if not variants:
+                raise TemplateError(f"{name}: lista de variações vazia")
+            templates[name] = [cls.compile(name, variant) for variant in variants]
+        return templates
     
-    def log_message(self, user_id: int, chat_id: int, message_text: str, message_type: str = 'user'):
-        """Registra uma mensagem no banco"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO messages (user_id, chat_id, message_text, message_type)
-                VALUES (?, ?, ?, ?)
-            ''', (user_id, chat_id, message_text, message_type))
-            conn.commit()
+    def load(self):
+        """Carrega o arquivo de templates (levanta TemplateError se for inválido)"""
+        mtime = os.stat(self.path).st_mtime
+        with open(self.path, encoding='utf-8') as f:
+            try:
+                data = json.load(f)
+            except json.JSONDecodeError as e:
+                raise TemplateError(f"JSON inválido: {e}") from e
+        self._templates = self.parse(data)
+        self._mtime = mtime
+        logger.info(f"{len(self._templates)} templates carregados de {self.path}")
     
-    def get_user_stats(self) -> Dict:
-        """Retorna estatísticas dos usuários"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            
-            # Total de usuários
-            cursor.execute('SELECT COUNT(*) FROM users WHERE is_active = 1')
-            total_users = cursor.fetchone()[0]
-            
-            # Usuários hoje
-            cursor.execute('''
-                SELECT COUNT(*) FROM users 
-                WHERE DATE(join_date) = DATE('now') AND is_active = 1
-            ''')
-            users_today = cursor.fetchone()[0]
-            
-            # Total de mensagens
-            cursor.execute('SELECT COUNT(*) FROM messages')
-            total_messages = cursor.fetchone()[0]
-            
-            return {
-                'total_users': total_users,
-                'users_today': users_today,
-                'total_messages': total_messages
-            }
+    def reload_if_changed(self) -> bool:
+        """Recarrega o arquivo se ele mudou; mantém a versão anterior em caso de erro"""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError as e:
+            logger.error(f"Arquivo de templates indisponível: {e}")
+            return False
+        if mtime == self._mtime:
+            return False
+        try:
+            self.load()
+        except (OSError, TemplateError) as e:
+            self._mtime = mtime  # evita tentar de novo até o arquivo mudar outra vez
+            logger.error(f"Templates não recarregados, versão anterior mantida: {e}")
+            return False
+        return True
     
-    def add_meeting(self, title: str, description: str, scheduled_time: datetime, created_by: int) -> int:
-        """Adiciona uma nova reunião"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO meetings (title, description, scheduled_time, created_by)
-                VALUES (?, ?, ?, ?)
-            ''', (title, description, scheduled_time.isoformat(), created_by))
-            conn.commit()
-            return cursor.lastrowid
+    def names(self) -> List[str]:
+        return sorted(self._templates)
     
-    def get_upcoming_meetings(self) -> List[Dict]:
-        """Retorna reuniões futuras"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT id, title, description, scheduled_time, created_by
-                FROM meetings 
-                WHERE scheduled_time > datetime('now') AND is_active = 1
-                ORDER BY scheduled_time ASC
-            ''')
-            
-            meetings = []
-            for row in cursor.fetchall():
-                meetings.append({
-                    'id': row[0],
-                    'title': row[1],
-                    'description': row[2],
-                    'scheduled_time': datetime.fromisoformat(row[3]),
-                    'created_by': row[4]
-                })
-            return meetings
-    
-    def get_meetings_for_notification(self, minutes_ahead: int = 30) -> List[Dict]:
-        """Retorna reuniões que devem ser notificadas"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            now = datetime.now()
-            notification_time = now + timedelta(minutes=minutes_ahead)
-            
-            cursor.execute('''
-                SELECT id, title, description, scheduled_time
-                FROM meetings 
-                WHERE scheduled_time BETWEEN ? AND ? 
-                AND is_active = 1
-            ''', (now.isoformat(), notification_time.isoformat()))
-            
-            meetings = []
-            for row in cursor.fetchall():
-                meetings.append({
-                    'id': row[0],
-                    'title': row[1],
-                    'description': row[2],
-                    'scheduled_time': datetime.fromisoformat(row[3])
-                })
-            return meetings
+    def __contains__(self, name: str) -> bool:
+        return name in self._templates
+    
+    def render(self, name: str, **variables) -> str:
+        """Renderiza um template; se houver variações, escolhe uma aleatoriamente"""
+        variants = self._templates[name]
+        text, fields = variants[0] if len(variants) == 1 else random.choice(variants)
+        if not fields:
+            return text
+        return text.format_map({field: self.escape(variables.get(field)) for field in fields})
+
+async def template_reload_job(context: ContextTypes.DEFAULT_TYPE):
+    """Job que recarrega os templates quando o arquivo é alterado"""
+    templates.reload_if_changed()
+
+# Registro global de templates (carregado por init_services)
+templates: Optional[TemplateRegistry] = None
 
 class MessagesManager:
     """Gerenciador de mensagens predefinidas"""
     
     @staticmethod
-    def get_welcome_message(group_type: str = 'principal') -> str:
-        """Retorna mensagem de boas-vindas"""
-        if group_type == 'principal':
-            return (
-                "🎯 **BEM-VINDO AO AUGE TRADERS!** 🎯\n\n"
-                "Olá! Seja muito bem-vindo(a) ao nosso grupo de trading! 📈\n\n"
-                "🔥 **AQUI VOCÊ VAI ENCONTRAR:**\n"
-                "• Análises técnicas detalhadas\n"
-                "• Estratégias comprovadas\n"
-                "• Comunidade ativa e engajada\n\n"
-                "📋 **REGRAS IMPORTANTES:**\n"
-                "• Respeite todos os membros\n"
-                "• Não faça spam\n"
-                "• Mantenha o foco em trading\n"
-                "• Siga as orientações dos admins\n\n"
-                "💰 **VAMOS JUNTOS RUMO AO SUCESSO!** 💰\n\n"
-            )
-        else:  # grupo de dúvidas
-            return (
-                "❓ **BEM-VINDO AO GRUPO DE DÚVIDAS!** ❓\n\n"
-                "Este é o espaço para tirar suas dúvidas sobre trading! 🤔\n\n"
-                "📚 **AQUI VOCÊ PODE:**\n"
-                "• Fazer perguntas sobre análise técnica\n"
-                "• Esclarecer dúvidas sobre estratégias\n"
-                "• Pedir ajuda com plataformas\n"
-                "• Compartilhar experiências\n\n"
-                "🎯 **DICAS PARA BOAS PERGUNTAS:**\n"
-                "• Seja específico\n"
-                "• Compartilhe prints quando necessário\n"
-                "• Use as hashtags: #duvida #ajuda #analise\n\n"
-                "👥 **Nossa comunidade está aqui para ajudar!**\n\n"
-            )
+    def get_welcome_message(template: str = 'welcome_principal') -> str:
+        """Retorna mensagem de boas-vindas (a do grupo principal se o template não existir mais)"""
+        if template not in templates:
+            logger.warning(f"Template de boas-vindas '{template}' não encontrado, usando o do grupo principal")
+            template = 'welcome_principal'
+        return templates.render(template)
+    
+    @staticmethod
+    def get_welcome_greeting(name: str) -> str:
+        """Saudação personalizada que precede a mensagem de boas-vindas"""
+        return templates.render('welcome_greeting', nome=name)
     
     @staticmethod
     def get_morning_message() -> str:
         """Mensagem motivacional matinal"""
-        return (
-            "🌅 **BOM DIA, TRADERS!** 🌅\n\n"
-            "Mais um dia de oportunidades nos mercados! 📈\n\n"
-            "💪 **LEMBRE-SE:**\n"
-            "• Disciplina é a chave do sucesso\n"
-            "• Gerencie sempre o risco\n"
-            "• Mantenha a calma nas operações\n"
-            "• Foque na consistência, não na sorte\n\n"
-            "🎯 **HOJE É DIA DE LUCRAR COM INTELIGÊNCIA!**\n\n"
-            "Bom trading a todos! 🚀"
-        )
+        return templates.render('morning')
     
     @staticmethod
     def get_alert_message() -> str:
         """Mensagem de alerta para oportunidades"""
-        return (
-            "🚨 **ATENÇÃO TRADERS!** 🚨\n\n"
-            "📊 Oportunidade identificada nos mercados!\n\n"
-            "⚡ **AÇÃO NECESSÁRIA:**\n"
-            "• Verifique suas análises\n"
-            "• Confirme as análises técnicas\n"
-            "• Prepare suas estratégias\n"
-            "• Gerencie o risco adequadamente\n\n"
-            "💰 **VAMOS APROVEITAR ESTA OPORTUNIDADE!** 💰\n\n"
-            "Fiquem atentos às próximas análises técnicas! 👀"
-        )
+        return templates.render('alert')
     
     @staticmethod
     def get_motivational_message() -> str:
         """Mensagem motivacional"""
-        messages = [
-            (
-                "💎 **MINDSET DE TRADER VENCEDOR** 💎\n\n"
-                "🧠 O sucesso no trading começa na mente!\n\n"
-                "✅ **CARACTERÍSTICAS DO TRADER DE SUCESSO:**\n"
-                "• Disciplina inabalável\n"
-                "• Gestão de risco rigorosa\n"
-                "• Paciência para aguardar setups\n"
-                "• Capacidade de aceitar perdas\n"
-                "• Foco na consistência\n\n"
-                "🚀 **VOCÊ TEM TUDO PARA SER UM VENCEDOR!** 🚀"
-            ),
-            (
-                "📈 **FOCO NO PROCESSO, NÃO NO RESULTADO** 📈\n\n"
-                "🎯 Traders consistentes focam no processo!\n\n"
-                "⭐ **PROCESSO VENCEDOR:**\n"
-                "• Análise técnica criteriosa\n"
-                "• Entrada apenas em setups válidos\n"
-                "• Stop loss sempre definido\n"
-                "• Take profit planejado\n"
-                "• Revisão constante das operações\n\n"
-                "💪 **CONFIE NO SEU PROCESSO!** 💪"
-            )
-        ]
-        import random
-        return random.choice(messages)
+        return templates.render('motivational')
     
     @staticmethod
     def get_error_message(error_type: str = 'generic') -> str:
@@ -313,17 +2231,1175 @@ class MessagesManager:
         }
         return errors.get(error_type, errors['generic'])
 
-# Instância global do gerenciador de banco
-db_manager = DatabaseManager()
+class TokenBucket:
+    """Token bucket assíncrono: `rate` tokens por segundo, até `capacity` acumulados"""
+    
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._tokens = self.capacity
+        self._updated = time_module.monotonic()
+        self._lock = asyncio.Lock()
+    
+    def _refill(self):
+        now = time_module.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+    
+    async def acquire(self):
+        """Aguarda até haver um token disponível e o consome"""
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+    
+    def penalize(self, seconds: float):
+        """Bloqueia o bucket por `seconds` (ex.: após um RetryAfter do Telegram)"""
+        self._refill()
+        self._tokens = min(self._tokens, 1 - seconds * self.rate)
+
+class BroadcastEngine:
+    """Envio concorrente para vários chats respeitando os limites do Telegram.
+    
+    Um bucket global limita o total de mensagens por segundo e cada chat tem
+    os seus (1 msg/s e, em grupos, um limite por minuto). RetryAfter e erros
+    de rede transitórios são repetidos com backoff; erros permanentes não.
+    Usa apenas `bot.send_message`, então pode ser exercitado com um Bot falso.
+    """
+    
+    def __init__(self, global_rate: float = BROADCAST_GLOBAL_RATE, chat_rate: float = BROADCAST_CHAT_RATE,
+                 group_per_minute: int = BROADCAST_GROUP_PER_MINUTE, max_retries: int = BROADCAST_MAX_RETRIES,
+                 base_delay: float = 1.0):
+        self.chat_rate = chat_rate
+        self.group_per_minute = group_per_minute
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chat_buckets: Dict[int, List[TokenBucket]] = {}
+    
+    def _buckets_for(self, chat_id: int) -> List[TokenBucket]:
+        """Buckets do chat (criados na primeira vez e reaproveitados entre envios)"""
+        buckets = self._chat_buckets.get(chat_id)
+        if buckets is None:
+            buckets = [TokenBucket(self.chat_rate, 1)]
+            if chat_id < 0:  # grupos e supergrupos têm IDs negativos
+                buckets.append(TokenBucket(self.group_per_minute / 60, self.group_per_minute))
+            self._chat_buckets[chat_id] = buckets
+        return buckets
+    
+    async def send(self, bot, chat_ids: List[int], text: str, **kwargs) -> List[Dict]:
+        """Envia `text` para todos os chats e retorna um resultado por chat"""
+        return list(await asyncio.gather(*(self._send_one(bot, chat_id, text, kwargs) for chat_id in chat_ids)))
+    
+    async def _send_one(self, bot, chat_id: int, text: str, kwargs: Dict) -> Dict:
+        attempts = 0
+        while True:
+            attempts += 1
+            buckets = self._buckets_for(chat_id)
+            for bucket in buckets:
+                await bucket.acquire()
+            await self._global.acquire()
+            try:
+                message = await bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                return {'chat_id': chat_id, 'ok': True, 'attempts': attempts,
+                        'message_id': getattr(message, 'message_id', None), 'error': None}
+            except RetryAfter as e:
+                delay = float(e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta) else e.retry_after)
+                for bucket in buckets:
+                    bucket.penalize(delay)
+                error = e
+            except (BadRequest, Forbidden) as e:
+                # Erros permanentes (chat inexistente, bot removido, Markdown inválido...)
+                return {'chat_id': chat_id, 'ok': False, 'attempts': attempts, 'message_id': None, 'error': str(e)}
+            except NetworkError as e:
+                delay = self.base_delay * 2 ** (attempts - 1) + random.uniform(0, self.base_delay)
+                error = e
+            except Exception as e:
+                return {'chat_id': chat_id, 'ok': False, 'attempts': attempts, 'message_id': None, 'error': str(e)}
+            
+            if attempts > self.max_retries:
+                return {'chat_id': chat_id, 'ok': False, 'attempts': attempts, 'message_id': None, 'error': str(error)}
+            logger.warning(f"Falha temporária ao enviar para {chat_id} ({error}); nova tentativa em {delay:.1f}s")
+            if not isinstance(error, RetryAfter):
+                await asyncio.sleep(delay)
+
+class TimerHeap:
+    """Fila de disparos ordenada por horário (heap), atendida por uma única task asyncio.
+    
+    Cada chave tem no máximo um disparo pendente; reagendar ou cancelar marca a
+    entrada antiga como inválida, que é descartada quando chega ao topo do heap.
+    """
+    
+    def __init__(self, on_due: Callable[[Any], Awaitable[None]], name: str = 'timer-heap'):
+        self.on_due = on_due
+        self.name = name
+        self._heap: List[list] = []
+        self._entries: Dict[Any, list] = {}
+        self._counter = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._running: set = set()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def __contains__(self, key) -> bool:
+        return key in self._entries
+    
+    def push(self, key, when: float):
+        """Agenda (ou reagenda) `key` para o timestamp epoch `when`"""
+        self.cancel(key)
+        entry = [when, next(self._counter), key, True]
+        self._entries[key] = entry
+        heapq.heappush(self._heap, entry)
+        if self._wakeup is not None and self._heap[0] is entry:
+            self._wakeup.set()
+    
+    def cancel(self, key):
+        """Cancela o disparo pendente de `key`, se houver"""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            entry[3] = False
+    
+    def start(self):
+        """Inicia a task de disparo no event loop atual"""
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run(), name=self.name)
+    
+    async def stop(self):
+        """Interrompe a task de disparo (os agendamentos continuam no heap)"""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+    
+    async def _run(self):
+        while True:
+            while self._heap and not self._heap[0][3]:
+                heapq.heappop(self._heap)
+            timeout = self._heap[0][0] - time_module.time() if self._heap else None
+            if timeout is None or timeout > 0:
+                self._wakeup.clear()
+                try:
+                    # Acorda no máximo a cada hora para tolerar ajustes no relógio
+                    await asyncio.wait_for(self._wakeup.wait(), min(timeout or 3600, 3600))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            
+            _, _, key, _ = heapq.heappop(self._heap)
+            del self._entries[key]
+            task = asyncio.get_running_loop().create_task(self._fire(key))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+    
+    async def _fire(self, key):
+        try:
+            await self.on_due(key)
+        except Exception as e:
+            logger.error(f"Erro ao executar disparo {key} de {self.name}: {e}")
+
+class MeetingScheduler:
+    """Lembretes de reunião persistentes.
+    
+    Na inicialização recarrega do banco, com uma única consulta indexada, as
+    reuniões ainda não notificadas e as coloca em um TimerHeap. Antes de enviar,
+    o lembrete é marcado como em envio (notify_claimed_at); só depois que ao
+    menos um grupo o recebe ele é marcado como entregue (notified_at). Se nenhum
+    grupo recebe, a marcação é liberada e o envio é repetido a cada
+    `retry_seconds` até o início da reunião. Envios interrompidos por uma queda
+    são liberados no próximo start(). A entrega é portanto "pelo menos uma vez"
+    enquanto a reunião não começou: uma queda entre o envio e a marcação pode
+    repetir o lembrete. Reuniões que começaram com o bot parado ficam sem lembrete.
+    """
+    
+    def __init__(self, db: 'DatabaseManager', lead_minutes: int = MEETING_NOTIFY_MINUTES,
+                 retry_seconds: int = MEETING_RETRY_SECONDS):
+        self.db = db
+        self.lead = timedelta(minutes=lead_minutes)
+        self.retry = max(1, retry_seconds)
+        self.bot = None
+        self._meetings: Dict[int, Dict] = {}
+        self._timers = TimerHeap(self._notify, name='meeting-scheduler')
+    
+    def __len__(self) -> int:
+        return len(self._timers)
+    
+    async def start(self, bot):
+        """Carrega as reuniões pendentes e inicia os disparos"""
+        self.bot = bot
+        released = await self.db.release_meeting_claims()
+        if released:
+            logger.warning(f"{released} lembretes de reunião interrompidos no último encerramento serão reenviados")
+        now = datetime.now(TIMEZONE)
+        missed = await self.db.count_missed_meetings(now)
+        if missed:
+            # Descartados de propósito: um lembrete depois do início da reunião não ajuda ninguém
+            logger.warning(f"{missed} reuniões começaram com o bot parado e ficaram sem lembrete")
+        meetings = await self.db.get_pending_meetings(now)
+        for meeting in meetings:
+            self.schedule(meeting)
+        self._timers.start()
+        logger.info(f"{len(meetings)} lembretes de reunião recarregados do banco")
+    
+    async def stop(self):
+        await self._timers.stop()
+    
+    def schedule(self, meeting: Dict):
+        """Agenda o lembrete; se o horário do lembrete já passou, dispara imediatamente"""
+        self._meetings[meeting['id']] = meeting
+        notify_at = meeting['scheduled_time'] - self.lead
+        self._timers.push(meeting['id'], notify_at.timestamp())
+    
+    def cancel(self, meeting_id: int):
+        self._meetings.pop(meeting_id, None)
+        self._timers.cancel(meeting_id)
+    
+    async def _notify(self, meeting_id: int):
+        meeting = self._meetings.pop(meeting_id, None)
+        if meeting is None:
+            return
+        if not await self.db.claim_meeting_notification(meeting_id):
+            logger.info(f"Lembrete da reunião {meeting_id} já havia sido enviado")
+            return
+        delivered = False
+        try:
+            results = await send_meeting_notification(self.bot, meeting['title'], meeting['scheduled_time'])
+            # Sem grupos de destino não há o que repetir
+            delivered = not results or any(result['ok'] for result in results)
+        finally:
+            await self.db.finish_meeting_notification(meeting_id, delivered)
+        if delivered:
+            return
+        retry_at = time_module.time() + self.retry
+        if retry_at < meeting['scheduled_time'].timestamp():
+            logger.warning(f"Lembrete da reunião {meeting_id} não chegou a nenhum grupo; nova tentativa em {self.retry}s")
+            self._meetings[meeting_id] = meeting
+            self._timers.push(meeting_id, retry_at)
+        else:
+            logger.error(f"Lembrete da reunião {meeting_id} não chegou a nenhum grupo antes do início da reunião")
+
+class CronError(ValueError):
+    """Expressão cron ou fuso horário inválido"""
+
+class CronExpression:
+    """Expressão cron de 5 campos (minuto hora dia mês dia-da-semana) em um fuso horário.
+    
+    Aceita `*`, listas (1,15), intervalos (1-5), passos (*/15, 8-18/2) e os atalhos
+    @hourly, @daily, @weekly e @monthly. Como no cron, se dia do mês e dia da semana
+    forem ambos restritos, basta um dos dois coincidir; 0 e 7 são domingo. Os
+    horários são de parede no fuso da expressão, então o disparo segue o horário de verão.
+    """
+    
+    FIELDS = (('minuto', 0, 59), ('hora', 0, 23), ('dia', 1, 31), ('mês', 1, 12), ('dia da semana', 0, 7))
+    ALIASES = {'@hourly': '0 * * * *', '@daily': '0 0 * * *', '@weekly': '0 0 * * 0', '@monthly': '0 0 1 * *'}
+    MAX_YEARS = 5
+    
+    def __init__(self, expression: str, timezone: str = TIMEZONE.zone):
+        self.expression = ' '.join(expression.split())
+        try:
+            self.tz = pytz.timezone(timezone)
+        except pytz.UnknownTimeZoneError:
+            raise CronError(f"fuso horário desconhecido: {timezone}")
+        fields = self.ALIASES.get(self.expression.lower(), self.expression).split()
+        if len(fields) != 5:
+            raise CronError("a expressão deve ter 5 campos: minuto hora dia mês dia-da-semana")
+        minutes, hours, days, months, weekdays = (
+            self._parse_field(text, *spec) for text, spec in zip(fields, self.FIELDS)
+        )
+        self.minutes, self.hours = minutes, hours
+        # Dias, meses e dias da semana como máscaras de bits: poucos bytes por expressão
+        self.days = sum(1 << day for day in days)
+        self.months = sum(1 << month for month in months)
+        self.weekdays = sum(1 << day for day in {day % 7 for day in weekdays})
+        # Campos começando com '*' não restringem o dia (regra do cron para dia x dia da semana)
+        self.any_day = fields[2].startswith('*') or fields[4].startswith('*')
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=4096)
+    def shared(expression: str, timezone: str = TIMEZONE.zone) -> 'CronExpression':
+        """Instância compartilhada entre as programações com a mesma expressão e fuso"""
+        return CronExpression(expression, timezone)
+    
+    @staticmethod
+    def _parse_field(text: str, name: str, low: int, high: int) -> tuple:
+        """Valores de um campo em ordem crescente"""
+        values = set()
+        for part in text.split(','):
+            base, _, step = part.partition('/')
+            try:
+                if base == '*':
+                    start, end = low, high
+                elif '-' in base:
+                    start, end = (int(value) for value in base.split('-', 1))
+                else:
+                    start = end = int(base)
+                    if step:
+                        end = high
+                step = int(step) if step else 1
+            except ValueError:
+                raise CronError(f"{name}: valor inválido '{part}'")
+            if not (low <= start <= end <= high) or step < 1:
+                raise CronError(f"{name}: '{part}' fora do intervalo {low}-{high}")
+            values.update(range(start, end + 1, step))
+        return tuple(sorted(values))
+    
+    def _day_matches(self, day: datetime) -> bool:
+        in_month = self.days >> day.day & 1
+        in_week = self.weekdays >> (day.isoweekday() % 7) & 1
+        return (in_month and in_week) if self.any_day else (in_month or in_week)
+    
+    def next_after(self, ts: float) -> float:
+        """Próximo disparo (epoch) estritamente depois de `ts`"""
+        local = datetime.fromtimestamp(ts, self.tz).replace(tzinfo=None, second=0, microsecond=0)
+        local += timedelta(minutes=1)
+        last_year = local.year + self.MAX_YEARS
+        # Avança campo a campo, do maior para o menor, pulando direto para o próximo valor válido
+        while local.year <= last_year:
+            if not self.months >> local.month & 1:
+                local = datetime(local.year + local.month // 12, local.month % 12 + 1, 1)
+                continue
+            if not self._day_matches(local):
+                local = datetime(local.year, local.month, local.day) + timedelta(days=1)
+                continue
+            index = bisect.bisect_left(self.hours, local.hour)
+            if index == len(self.hours):
+                local = datetime(local.year, local.month, local.day) + timedelta(days=1)
+                continue
+            if self.hours[index] != local.hour:
+                local = local.replace(hour=self.hours[index], minute=0)
+            index = bisect.bisect_left(self.minutes, local.minute)
+            if index == len(self.minutes):
+                local = local.replace(minute=0) + timedelta(hours=1)
+                continue
+            local = local.replace(minute=self.minutes[index])
+            fire = self.tz.normalize(self.tz.localize(local)).timestamp()
+            if fire > ts:
+                return fire
+            local += timedelta(minutes=1)  # horário repetido na volta do horário de verão
+        raise CronError(f"a expressão '{self.expression}' nunca dispara")
+
+class BroadcastScheduler:
+    """Envios recorrentes persistentes (tabela schedules), definidos por expressões cron.
+    
+    Todas as programações ativas compartilham um único TimerHeap que guarda só o
+    próximo disparo de cada uma: em repouso, milhares de programações custam uma
+    entrada no heap cada e uma task dormindo até o disparo mais próximo. Cada
+    disparo é registrado no banco (last_fire_ts) antes do envio, então nenhum se
+    repete após um restart. Os disparos perdidos com o bot fora do ar, dentro das
+    últimas `catchup_hours`, seguem a política da programação: 'ignorar' não envia,
+    'ultimo' envia uma vez e 'todos' envia cada um, até `catchup_max`.
+    """
+    
+    CATCH_UP_POLICIES = {
+        'ignorar': 'ignorar os perdidos',
+        'ultimo': 'enviar o último perdido',
+        'todos': 'enviar todos os perdidos',
+    }
+    
+    def __init__(self, db: 'DatabaseManager', catchup_hours: float = SCHEDULE_CATCHUP_HOURS,
+                 catchup_max: int = SCHEDULE_CATCHUP_MAX):
+        self.db = db
+        self.catchup_window = catchup_hours * 3600
+        self.catchup_max = max(1, catchup_max)
+        self.bot = None
+        self._schedules: Dict[int, Dict] = {}
+        self._timers = TimerHeap(self._fire, name='broadcast-scheduler')
+    
+    def __len__(self) -> int:
+        return len(self._schedules)
+    
+    def all(self) -> List[Dict]:
+        return sorted(self._schedules.values(), key=lambda schedule: schedule['due'])
+    
+    async def start(self, bot):
+        """Carrega as programações ativas, agenda o próximo disparo (ou o perdido) de cada uma e inicia os disparos"""
+        self.bot = bot
+        schedules = await self.db.get_schedules()
+        now = time_module.time()
+        late = 0
+        for schedule in schedules:
+            try:
+                self.add(schedule, now)
+            except CronError as e:
+                logger.error(f"Envio programado #{schedule['id']} ignorado: {e}")
+                continue
+            late += schedule['due'] <= now
+        self._timers.start()
+        logger.info(f"{len(self._schedules)} envios programados carregados ({late} com disparos perdidos a recuperar)")
+    
+    async def stop(self):
+        await self._timers.stop()
+    
+    def add(self, schedule: Dict, now: Optional[float] = None):
+        """Agenda uma programação a partir do seu último disparo (levanta CronError se a expressão for inválida)"""
+        schedule['expr'] = CronExpression.shared(schedule['cron'], schedule['timezone'])
+        self._schedules[schedule['id']] = schedule
+        self._push(schedule, schedule['last_fire_ts'] or now or time_module.time(), now)
+    
+    def cancel(self, schedule_id: int):
+        self._schedules.pop(schedule_id, None)
+        self._timers.cancel(schedule_id)
+    
+    def _push(self, schedule: Dict, after: float, now: Optional[float] = None):
+        """Agenda o próximo disparo depois de `after`, aplicando a política aos que já passaram"""
+        now = time_module.time() if now is None else now
+        expr = schedule['expr']
+        missed = deque(maxlen=self.catchup_max)
+        due = expr.next_after(max(after, now - self.catchup_window))
+        while due <= now:
+            missed.append(due)
+            due = expr.next_after(due)
+        if missed and schedule['catch_up'] == 'ultimo':
+            due = missed[-1]
+        elif missed and schedule['catch_up'] == 'todos':
+            due = missed[0]  # os seguintes são agendados a cada disparo
+        schedule['due'] = due
+        self._timers.push(schedule['id'], due)
+    
+    async def _fire(self, schedule_id: int):
+        schedule = self._schedules.get(schedule_id)
+        if schedule is None:
+            return
+        due = schedule['due']
+        try:
+            if await self.db.claim_schedule_fire(schedule_id, int(due)):
+                await self._send(schedule, due)
+            else:
+                logger.info(f"Disparo do envio programado #{schedule_id} já havia sido tratado")
+        finally:
+            # A programação pode ter sido cancelada durante o envio
+            if self._schedules.get(schedule_id) is schedule:
+                self._push(schedule, due)
+    
+    async def _send(self, schedule: Dict, due: float):
+        schedule_id = schedule['id']
+        if schedule['template'] not in templates:
+            metrics.inc('bot_schedule_fires_total', result='error')
+            logger.error(f"Envio programado #{schedule_id}: template {schedule['template']} não encontrado")
+            return
+        chat_ids = group_registry.target_chats(schedule['target']) or []
+        if not chat_ids:
+            metrics.inc('bot_schedule_fires_total', result='no_target')
+            logger.warning(f"Envio programado #{schedule_id}: nenhum grupo em '{schedule['target']}'")
+            return
+        late = time_module.time() - due
+        results = await broadcast_engine.send(
+            self.bot, chat_ids, templates.render(schedule['template']), parse_mode=ParseMode.MARKDOWN
+        )
+        failed = [result for result in results if not result['ok']]
+        for result in failed:
+            logger.error(f"Envio programado #{schedule_id} falhou para {result['chat_id']}: {result['error']}")
+        metrics.inc('bot_schedule_fires_total', result='error' if failed else 'ok')
+        logger.info(
+            f"Envio programado #{schedule_id} ({schedule['template']}) enviado para "
+            f"{len(results) - len(failed)}/{len(results)} grupos" + (f", {late:.0f}s atrasado" if late >= 60 else "")
+        )
+
+class JoinAggregator:
+    """Agrupa as entradas de membros por chat em uma janela curta.
+    
+    A primeira entrada abre uma janela de `window_seconds`; ao fim dela (ou antes,
+    se o grupo acumular `flush_size` membros) todos são gravados de uma vez e
+    recebem uma única mensagem de boas-vindas, evitando inundar o grupo em rajadas.
+    O envio roda em uma task própria, sem segurar o processamento de updates.
+    """
+    
+    def __init__(self, window_seconds: float = JOIN_WINDOW_SECONDS, flush_size: int = JOIN_FLUSH_SIZE):
+        self.window = window_seconds
+        self.flush_size = max(1, flush_size)
+        self._pending: Dict[int, Dict[int, tuple]] = {}
+        self._bots: Dict[int, Any] = {}
+        self._timers: Dict[int, asyncio.Task] = {}
+        self._flushing: set = set()
+    
+    @property
+    def pending(self) -> int:
+        return sum(len(members) for members in self._pending.values())
+    
+    async def add(self, bot, chat_id: int, members: List[tuple]):
+        """Acumula membros (user_id, username, nome, sobrenome) para o chat"""
+        pending = self._pending.setdefault(chat_id, {})
+        for member in members:
+            pending[member[0]] = member
+        self._bots[chat_id] = bot
+        if self.window <= 0 or len(pending) >= self.flush_size:
+            task = asyncio.get_running_loop().create_task(self.flush(chat_id), name=f'join-flush-{chat_id}')
+            self._flushing.add(task)
+            task.add_done_callback(self._flushing.discard)
+        elif chat_id not in self._timers:
+            self._timers[chat_id] = asyncio.get_running_loop().create_task(
+                self._flush_later(chat_id), name=f'join-window-{chat_id}'
+            )
+    
+    async def _flush_later(self, chat_id: int):
+        await asyncio.sleep(self.window)
+        self._timers.pop(chat_id, None)
+        await self.flush(chat_id)
+    
+    async def flush(self, chat_id: int):
+        """Grava e dá as boas-vindas aos membros pendentes do chat"""
+        timer = self._timers.pop(chat_id, None)
+        if timer is not None and timer is not asyncio.current_task():
+            timer.cancel()
+        members = self._pending.pop(chat_id, None)
+        bot = self._bots.pop(chat_id, None)
+        if not members:
+            return
+        try:
+            await welcome_members(bot, chat_id, list(members.values()))
+        except Exception as e:
+            logger.error(f"Erro ao processar {len(members)} novos membros no chat {chat_id}: {e}")
+    
+    async def stop(self):
+        """Encerra as janelas abertas processando o que já foi acumulado"""
+        for chat_id in list(self._pending):
+            await self.flush(chat_id)
+        if self._flushing:
+            await asyncio.gather(*self._flushing, return_exceptions=True)
+
+class AdminRegistry:
+    """Administradores resolvidos a partir das listas reais dos grupos gerenciados.
+    
+    A lista de cada grupo fica em cache por `ttl` segundos e é atualizada por uma
+    task em segundo plano; atualizações chat_member aplicam a mudança na hora e
+    antecipam a próxima atualização do grupo. `is_admin` só consulta um set em
+    memória: nenhuma chamada à API acontece no caminho dos comandos. Os IDs de
+    ADMIN_IDS continuam sempre administradores. A carga inicial também roda em
+    segundo plano (todos os grupos em paralelo), sem atrasar o início do bot;
+    até ela terminar, apenas ADMIN_IDS são reconhecidos. Os grupos acompanhados
+    seguem o registro de grupos (`track_chats`).
+    """
+    
+    ADMIN_STATUSES = (ChatMember.ADMINISTRATOR, ChatMember.OWNER)
+    RETRY_SECONDS = 60
+    
+    def __init__(self, chat_ids: List[int] = (), static_ids: List[int] = ADMIN_IDS, ttl: int = ADMIN_CACHE_TTL):
+        self.static_ids = frozenset(static_ids)
+        self.ttl = max(1, ttl)
+        self.bot = None
+        self._chat_admins: Dict[int, set] = {}
+        self._expires: Dict[int, float] = {chat_id: 0.0 for chat_id in chat_ids if chat_id}
+        self._admins: frozenset = self.static_ids
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    @property
+    def chat_ids(self) -> List[int]:
+        return list(self._expires)
+    
+    def is_admin(self, user_id: int) -> bool:
+        return user_id in self._admins
+    
+    def track_chats(self, chat_ids: List[int]):
+        """Passa a acompanhar exatamente estes grupos: novos são carregados na próxima volta da task"""
+        wanted = set(chat_ids)
+        for chat_id in list(self._expires):
+            if chat_id not in wanted:
+                del self._expires[chat_id]
+                self._chat_admins.pop(chat_id, None)
+        added = wanted - set(self._expires)
+        for chat_id in added:
+            self._expires[chat_id] = 0.0
+        self._rebuild()
+        if added and self._wakeup:
+            self._wakeup.set()
+    
+    def _rebuild(self):
+        self._admins = self.static_ids.union(*self._chat_admins.values())
+    
+    async def refresh(self, chat_id: int) -> bool:
+        """Relê os administradores de um grupo; em caso de erro mantém a lista anterior"""
+        try:
+            members = await self.bot.get_chat_administrators(chat_id)
+        except Exception as e:
+            logger.warning(f"Não foi possível atualizar os administradores do chat {chat_id}: {e}")
+            metrics.inc('bot_admin_refresh_total', result='error')
+            if chat_id in self._expires:
+                self._expires[chat_id] = time_module.monotonic() + min(self.ttl, self.RETRY_SECONDS)
+            return False
+        if chat_id not in self._expires:
+            return False  # grupo removido do registro durante a consulta
+        self._chat_admins[chat_id] = {member.user.id for member in members if not member.user.is_bot}
+        self._expires[chat_id] = time_module.monotonic() + self.ttl
+        self._rebuild()
+        metrics.inc('bot_admin_refresh_total', result='ok')
+        return True
+    
+    def invalidate(self, chat_id: int):
+        """Antecipa a atualização do grupo para a próxima volta da task"""
+        if chat_id in self._expires:
+            self._expires[chat_id] = 0.0
+            if self._wakeup:
+                self._wakeup.set()
+    
+    def apply_member_update(self, chat_id: int, user_id: int, status: str, is_bot: bool = False):
+        """Aplica imediatamente uma mudança de status recebida via chat_member (bots, como em refresh, nunca entram)"""
+        if chat_id not in self._expires:
+            return
+        admins = self._chat_admins.setdefault(chat_id, set())
+        if status in self.ADMIN_STATUSES and not is_bot:
+            admins.add(user_id)
+        else:
+            admins.discard(user_id)
+        self._rebuild()
+        self.invalidate(chat_id)
+    
+    async def start(self, bot):
+        """Inicia a carga das listas dos grupos e a atualização em segundo plano"""
+        self.bot = bot
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run(), name='admin-registry')
+    
+    async def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+    
+    async def _run(self):
+        await asyncio.gather(*(self.refresh(chat_id) for chat_id in self.chat_ids))
+        logger.info(f"{len(self._admins)} administradores carregados de {len(self.chat_ids)} grupos")
+        while True:
+            now = time_module.monotonic()
+            for chat_id, expires in list(self._expires.items()):
+                if expires <= now:
+                    await self.refresh(chat_id)
+            self._wakeup.clear()
+            timeout = max(0.0, min(self._expires.values(), default=now + self.ttl) - time_module.monotonic())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+# Papéis de grupo: definem os destinos do menu de mensagens e o template de boas-vindas padrão
+GROUP_ROLES: Dict[str, str] = {
+    'principal': 'Grupo principal',
+    'duvidas': 'Grupo de dúvidas',
+}
+
+class GroupRegistry:
+    """Índice em memória dos grupos gerenciados (tabela groups).
+    
+    Cada grupo tem um apelido (usado em `chat:` e nos comandos), um papel
+    (GROUP_ROLES), o template de boas-vindas e se participa dos envios. O
+    cadastro é lido inteiro na inicialização e relido a cada alteração; as
+    consultas dos handlers (grupo por ID, por apelido, destinos de um papel) são
+    buscas em dicionários montados a cada carga e trocados de uma só vez.
+    `on_change` recebe os IDs cadastrados após cada carga.
+    """
+    
+    def __init__(self, db: 'DatabaseManager', on_change: Optional[Callable[[List[int]], None]] = None):
+        self.db = db
+        self.on_change = on_change
+        self._groups: Dict[int, Dict] = {}
+        self._aliases: Dict[str, int] = {}
+        self._targets: Dict[Optional[str], List[tuple]] = {}
+    
+    def __len__(self) -> int:
+        return len(self._groups)
+    
+    def __contains__(self, chat_id: int) -> bool:
+        return chat_id in self._groups
+    
+    def replace(self, groups: List[Dict]):
+        """Monta os índices a partir das linhas da tabela e os troca de uma vez"""
+        targets: Dict[Optional[str], List[tuple]] = {None: []}
+        for group in groups:
+            if group['broadcast']:
+                targets[None].append((group['chat_id'], group['title']))
+                targets.setdefault(group['role'], []).append((group['chat_id'], group['title']))
+        self._groups = {group['chat_id']: group for group in groups}
+        self._aliases = {group['alias'].lower(): group['chat_id'] for group in groups}
+        self._targets = targets
+        if self.on_change:
+            self.on_change(list(self._groups))
+    
+    async def load(self):
+        """(Re)carrega o cadastro do banco"""
+        self.replace(await self.db.get_groups())
+        logger.info(f"{len(self._groups)} grupos cadastrados")
+    
+    def get(self, chat_id: int) -> Optional[Dict]:
+        return self._groups.get(chat_id)
+    
+    def all(self) -> List[Dict]:
+        return sorted(self._groups.values(), key=lambda group: group['alias'])
+    
+    def resolve(self, ref: str) -> Optional[int]:
+        """ID do grupo a partir do apelido ou do próprio ID (apenas grupos cadastrados)"""
+        chat_id = self._aliases.get(ref.lower())
+        if chat_id is None and ref.lstrip('-').isdigit() and int(ref) in self._groups:
+            chat_id = int(ref)
+        return chat_id
+    
+    def label(self, chat_id: int) -> str:
+        group = self._groups.get(chat_id)
+        return group['title'] if group else f'Chat {chat_id}'
+    
+    def targets(self, role: Optional[str] = None) -> List[tuple]:
+        """Grupos (chat_id, nome) que recebem envios; de um papel ou de todos"""
+        return self._targets.get(role, [])
+    
+    def target_chats(self, target: str) -> Optional[List[int]]:
+        """IDs de um destino: 'todos', um papel ou apelidos separados por vírgula (None se algum não existir)"""
+        if target == 'todos':
+            return [chat_id for chat_id, _ in self.targets()]
+        if target in GROUP_ROLES:
+            return [chat_id for chat_id, _ in self.targets(target)]
+        chat_ids = [self.resolve(alias) for alias in target.split(',')]
+        return None if None in chat_ids else chat_ids
+    
+    @staticmethod
+    def welcome_template(group: Dict) -> Optional[str]:
+        """Template de boas-vindas do grupo (None se desativadas)"""
+        template = group['welcome_template']
+        if template is None:
+            return f"welcome_{group['role']}"
+        return template or None
+    
+    async def save(self, chat_id: int, alias: str, title: str, role: str):
+        await self.db.save_group(chat_id, alias, title, role)
+        await self.load()
+    
+    async def update(self, chat_id: int, **fields) -> bool:
+        updated = await self.db.update_group(chat_id, **fields)
+        await self.load()
+        return updated
+    
+    async def remove(self, chat_id: int) -> bool:
+        removed = await self.db.remove_group(chat_id)
+        await self.load()
+        return removed
+
+class SQLitePersistence(BasePersistence):
+    """Persistência do PTB (user_data, chat_data, bot_data e conversas) no banco do bot.
+    
+    Cada chat e cada usuário ocupa uma linha própria, lida sob demanda no
+    primeiro update do chat/usuário (refresh_*) em vez de carregar tudo na
+    inicialização; só os IDs com linha gravada ficam em memória, então chats e
+    usuários sem dados não custam leitura. A cada ciclo de update_persistence só entram na fila as
+    entradas cujo pickle mudou desde a última gravação (comparado por hash), e
+    a fila é gravada em uma única transação `flush_delay` segundos após a
+    primeira alteração. Entradas vazias não ocupam linhas.
+    """
+    
+    def __init__(self, db: 'DatabaseManager', update_interval: float = PERSISTENCE_UPDATE_SECONDS,
+                 flush_delay: float = WRITE_FLUSH_MS / 1000):
+        # Sem callback_data: os botões usam callback_data em texto (CallbackRouter)
+        super().__init__(store_data=PersistenceInput(callback_data=False), update_interval=update_interval)
+        self.db = db
+        self.flush_delay = flush_delay
+        self._loaded: Dict[str, set] = {'user': set(), 'chat': set()}
+        self._stored: Dict[str, set] = {'user': set(), 'chat': set(), 'bot': {0}}
+        self._digests: Dict[tuple, bytes] = {}
+        self._dirty: Dict[tuple, Optional[bytes]] = {}  # (tipo, id) -> pickle (None remove a linha)
+        self._flush_task: Optional[asyncio.Task] = None
+    
+    @property
+    def pending(self) -> int:
+        return len(self._dirty)
+    
+    @staticmethod
+    def _digest(blob: bytes) -> bytes:
+        return hashlib.blake2b(blob, digest_size=16).digest()
+    
+    @staticmethod
+    def _read_data(conn: sqlite3.Connection, kind: str, key: int) -> Optional[bytes]:
+        row = conn.execute('SELECT data FROM persistence_data WHERE kind = ? AND id = ?', (kind, key)).fetchone()
+        return row[0] if row else None
+    
+    @staticmethod
+    def _read_ids(conn: sqlite3.Connection, kind: str) -> set:
+        return {row[0] for row in conn.execute('SELECT id FROM persistence_data WHERE kind = ?', (kind,))}
+    
+    @staticmethod
+    def _read_conversations(conn: sqlite3.Connection, name: str) -> List[tuple]:
+        return conn.execute('SELECT key, state FROM persistence_conversations WHERE name = ?', (name,)).fetchall()
+    
+    @staticmethod
+    def _write_batch(conn: sqlite3.Connection, batch: Dict[tuple, Optional[bytes]], now: int) -> Dict[str, int]:
+        """Grava as entradas alteradas de um ciclo; retorna quantas de cada tipo"""
+        upserts, deletes, states, finished = [], [], [], []
+        counts: Dict[str, int] = {}
+        for (kind, key), blob in batch.items():
+            counts[kind] = counts.get(kind, 0) + 1
+            if kind == 'conversation':
+                if blob is not None:
+                    states.append((*key, blob))
+                else:
+                    finished.append(key)
+            elif blob is not None:
+                upserts.append((kind, key, blob, now))
+            else:
+                deletes.append((kind, key))
+        conn.executemany('''
+            INSERT INTO persistence_data (kind, id, data, updated_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(kind, id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+        ''', upserts)
+        conn.executemany('DELETE FROM persistence_data WHERE kind = ? AND id = ?', deletes)
+        conn.executemany('INSERT OR REPLACE INTO persistence_conversations (name, key, state) VALUES (?, ?, ?)', states)
+        conn.executemany('DELETE FROM persistence_conversations WHERE name = ? AND key = ?', finished)
+        return counts
+    
+    async def _merge(self, kind: str, key: int, data: Dict):
+        """Completa `data` com o que está gravado para a entrada, sem sobrescrever chaves já presentes"""
+        if key not in self._stored[kind]:
+            return
+        blob = await self.db.engine.read(self._read_data, kind, key)
+        if blob is None:
+            return
+        self._digests.setdefault((kind, key), self._digest(blob))
+        for name, value in pickle.loads(blob).items():
+            data.setdefault(name, value)
+    
+    async def _refresh(self, kind: str, key: int, data: Dict):
+        """Carrega a entrada na primeira vez que o chat/usuário aparece"""
+        if key in self._loaded[kind]:
+            return
+        self._loaded[kind].add(key)
+        try:
+            await self._merge(kind, key, data)
+        except Exception:
+            self._loaded[kind].discard(key)
+            raise
+    
+    async def _update(self, kind: str, key: int, data: Dict):
+        """Enfileira a entrada se o conteúdo mudou desde a última gravação"""
+        if kind != 'bot' and key not in self._loaded[kind]:
+            # Alterada antes de qualquer refresh: preserva o que já estava gravado
+            await self._merge(kind, key, data)
+        blob = pickle.dumps(data, pickle.HIGHEST_PROTOCOL) if data else None
+        digest = self._digest(blob) if blob is not None else None
+        if self._digests.get((kind, key)) == digest:
+            return
+        self._queue((kind, key), blob, digest)
+    
+    def _queue(self, entry: tuple, blob: Optional[bytes], digest: Optional[bytes]):
+        self._dirty[entry] = blob
+        kind, key = entry
+        if kind in self._stored and blob is not None:
+            self._stored[kind].add(key)
+        elif kind in self._stored:
+            self._stored[kind].discard(key)
+        if digest is None:
+            self._digests.pop(entry, None)
+        else:
+            self._digests[entry] = digest
+        if self._flush_task is None:
+            self._flush_task = asyncio.get_running_loop().create_task(
+                self._flush_later(), name='persistence-flush'
+            )
+    
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_delay)
+        self._flush_task = None
+        await self._write()
+    
+    async def _write(self):
+        """Grava a fila em uma transação; em caso de erro as entradas voltam para a fila"""
+        if not self._dirty:
+            return
+        batch, self._dirty = self._dirty, {}
+        try:
+            counts = await self.db.engine.write(self._write_batch, batch, int(time_module.time()))
+        except Exception as e:
+            for entry, blob in batch.items():
+                self._dirty.setdefault(entry, blob)
+            logger.error(f"Erro ao gravar a persistência ({len(batch)} entradas): {e}")
+            return
+        for kind, count in counts.items():
+            metrics.inc('bot_persistence_rows_written_total', count, kind=kind)
+    
+    async def get_user_data(self) -> Dict[int, Dict]:
+        await self.db.start()
+        self._stored['user'] = await self.db.engine.read(self._read_ids, 'user')
+        return {}  # carregados sob demanda em refresh_user_data
+    
+    async def get_chat_data(self) -> Dict[int, Dict]:
+        await self.db.start()
+        self._stored['chat'] = await self.db.engine.read(self._read_ids, 'chat')
+        return {}  # carregados sob demanda em refresh_chat_data
+    
+    async def get_bot_data(self) -> Dict:
+        await self.db.start()
+        data: Dict = {}
+        await self._merge('bot', 0, data)
+        return data
+    
+    async def get_callback_data(self) -> None:
+        return None
+    
+    async def get_conversations(self, name: str) -> Dict:
+        await self.db.start()
+        rows = await self.db.engine.read(self._read_conversations, name)
+        return {tuple(json.loads(key)): pickle.loads(state) for key, state in rows}
+    
+    async def update_conversation(self, name: str, key: tuple, new_state: Optional[object]):
+        blob = None if new_state is None else pickle.dumps(new_state, pickle.HIGHEST_PROTOCOL)
+        self._queue(('conversation', (name, json.dumps(list(key)))), blob, None)
+    
+    async def update_user_data(self, user_id: int, data: Dict):
+        await self._update('user', user_id, data)
+    
+    async def update_chat_data(self, chat_id: int, data: Dict):
+        await self._update('chat', chat_id, data)
+    
+    async def update_bot_data(self, data: Dict):
+        await self._update('bot', 0, data)
+    
+    async def update_callback_data(self, data: object):
+        pass
+    
+    async def drop_user_data(self, user_id: int):
+        self._loaded['user'].discard(user_id)
+        self._queue(('user', user_id), None, None)
+    
+    async def drop_chat_data(self, chat_id: int):
+        self._loaded['chat'].discard(chat_id)
+        self._queue(('chat', chat_id), None, None)
+    
+    async def refresh_user_data(self, user_id: int, user_data: Dict):
+        await self._refresh('user', user_id, user_data)
+    
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict):
+        await self._refresh('chat', chat_id, chat_data)
+    
+    async def refresh_bot_data(self, bot_data: Dict):
+        pass  # só este processo grava bot_data, carregado em get_bot_data
+    
+    async def flush(self):
+        """Grava imediatamente o que estiver na fila (chamado pelo PTB no encerramento)"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self._write()
+
+class CallbackRouter:
+    """Roteamento dos callbacks inline por prefixo, com payloads tipados e versionados.
+    
+    O callback_data tem o formato `<prefixo><versão>:<arg>:<arg>...` e deve caber
+    nos 64 bytes do Telegram. O despacho é uma única busca em dicionário pela
+    chave `<prefixo><versão>`; os argumentos são convertidos pelos tipos da rota.
+    Ao mudar o formato de uma rota, registre-a com uma nova versão: botões antigos
+    deixam de casar e recebem um aviso de menu expirado em vez de um erro.
+    """
+    
+    SEPARATOR = ':'
+    MAX_BYTES = 64
+    
+    def __init__(self):
+        self._routes: Dict[str, tuple] = {}
+        self._versions: Dict[str, int] = {}
+    
+    def route(self, prefix: str, version: int = 1, types: tuple = (), admin_only: bool = True):
+        """Decorador: registra `handler(update, context, *args)` para o prefixo"""
+        if not prefix.isalpha() or self.SEPARATOR in prefix:
+            raise ValueError(f"Prefixo de callback inválido: {prefix!r}")
+        
+        def decorator(handler):
+            key = f'{prefix}{version}'
+            if key in self._routes:
+                raise ValueError(f"Rota de callback duplicada: {key}")
+            self._routes[key] = (handler, types, admin_only)
+            self._versions[prefix] = max(version, self._versions.get(prefix, 0))
+            return handler
+        return decorator
+    
+    def encode(self, prefix: str, *args) -> str:
+        """Monta o callback_data da versão atual da rota"""
+        key = f'{prefix}{self._versions[prefix]}'
+        _, types, _ = self._routes[key]
+        if len(args) != len(types):
+            raise ValueError(f"{key}: esperados {len(types)} argumentos, recebidos {len(args)}")
+        data = self.SEPARATOR.join([key, *(str(arg) for arg in args)])
+        if any(self.SEPARATOR in str(arg) for arg in args) or len(data.encode()) > self.MAX_BYTES:
+            raise ValueError(f"callback_data inválido ou acima de {self.MAX_BYTES} bytes: {data!r}")
+        return data
+    
+    def decode(self, data: str) -> Optional[tuple]:
+        """Retorna (handler, admin_only, args) ou None se o payload não casar com nenhuma rota"""
+        key, *raw_args = (data or '').split(self.SEPARATOR)
+        route = self._routes.get(key)
+        if route is None:
+            return None
+        handler, types, admin_only = route
+        if len(raw_args) != len(types):
+            return None
+        try:
+            args = tuple(cast(value) for cast, value in zip(types, raw_args))
+        except ValueError:
+            return None
+        return handler, admin_only, args
+    
+    async def dispatch(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handler único de CallbackQuery"""
+        query = update.callback_query
+        await query.answer()
+        
+        decoded = self.decode(query.data)
+        if decoded is None:
+            await query.edit_message_text("⌛ Este menu expirou. Abra-o novamente pelo comando.")
+            return
+        handler, admin_only, args = decoded
+        if admin_only and not is_admin(query.from_user.id):
+            await query.edit_message_text(MessagesManager.get_error_message('permission'))
+            return
+        await handler(update, context, *args)
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Processa updates em paralelo entre chats, preservando a ordem dentro de cada chat e usuário.
+    
+    Cada update adquire, em ordem fixa, um lock por chat e por usuário (locks do asyncio
+    são FIFO, então updates do mesmo chat rodam na ordem de chegada) e depois uma das
+    `max_in_flight` vagas de processamento. Updates esperando a vez de um chat não
+    ocupam vagas, então uma rajada no grupo de dúvidas não atrasa os comandos de outro chat.
+    `max_pending` limita quantos updates podem estar dentro do processador.
+    """
+    
+    def __init__(self, max_in_flight: int = UPDATE_CONCURRENCY, max_pending: int = UPDATE_QUEUE_MAX):
+        super().__init__(max(2, max_pending))
+        self._slots = asyncio.BoundedSemaphore(max(1, max_in_flight))
+        self._locks: Dict[tuple, list] = {}  # chave -> [lock, updates usando a chave]
+        self.pending = 0
+        self.in_flight = 0
+    
+    @staticmethod
+    def ordering_keys(update: object) -> List[tuple]:
+        """Chaves de ordenação do update, em ordem fixa para evitar deadlock"""
+        keys = set()
+        if isinstance(update, Update):
+            if update.effective_chat:
+                keys.add(('chat', update.effective_chat.id))
+            if update.effective_user:
+                keys.add(('user', update.effective_user.id))
+        return sorted(keys)
+    
+    def _lock_for(self, key: tuple) -> asyncio.Lock:
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        return entry[0]
+    
+    def _release(self, key: tuple, acquired: bool):
+        entry = self._locks[key]
+        if acquired:
+            entry[0].release()
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._locks[key]
+    
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        arrived = time_module.perf_counter()
+        keys = self.ordering_keys(update)
+        locks = [self._lock_for(key) for key in keys]
+        acquired = 0
+        started = False
+        self.pending += 1
+        try:
+            for lock in locks:
+                await lock.acquire()
+                acquired += 1
+            async with self._slots:
+                metrics.observe('bot_update_wait_seconds', time_module.perf_counter() - arrived)
+                self.pending -= 1
+                started = True
+                self.in_flight += 1
+                try:
+                    await coroutine
+                finally:
+                    self.in_flight -= 1
+        finally:
+            if not started:
+                # Cancelado antes de começar: descarta a corrotina sem executá-la
+                self.pending -= 1
+                if inspect.iscoroutine(coroutine):
+                    coroutine.close()
+            for index, key in enumerate(keys):
+                self._release(key, index < acquired)
+    
+    async def initialize(self) -> None:
+        pass
+    
+    async def shutdown(self) -> None:
+        pass
+
+# Serviços globais do bot: criados por init_services(), nunca no import do módulo
+db_manager: Optional[DatabaseManager] = None
+broadcast_engine: Optional[BroadcastEngine] = None
+meeting_scheduler: Optional[MeetingScheduler] = None
+broadcast_scheduler: Optional[BroadcastScheduler] = None
+persistence: Optional[SQLitePersistence] = None
+join_aggregator: Optional[JoinAggregator] = None
+flood_guard: Optional[FloodGuard] = None
+admin_registry: Optional[AdminRegistry] = None
+group_registry: Optional[GroupRegistry] = None
+
+# Teclado fixo da mensagem de boas-vindas do grupo principal
+WELCOME_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📚 Mentoria Completa", url="https://www.mentoriaaugetraders.com.br/")],
+    [InlineKeyboardButton("❓ Grupo de Dúvidas", url="https://t.me/+5ueqV0IGf7NlODIx")]
+])
+
+# Instância global do roteador de callbacks inline
+callback_router = CallbackRouter()
+
+# Buscas recentes do /buscar, referenciadas pelos botões de paginação
+search_sessions = TTLCache(ttl=1800)
+search_session_ids = itertools.count(int(time_module.time()))
+
+# Exportações em andamento (uma por vez)
+export_tasks: set = set()
+
+def init_services(db_path: str = DATABASE_PATH, flood: Optional[FloodGuard] = None) -> DatabaseManager:
+    """Cria os serviços globais do bot (banco, agendadores, persistência, anti-flood, grupos e templates).
+    
+    Chamada por build_application(); importar o módulo não abre o banco nem
+    inicia threads. Uma nova chamada substitui todos os serviços (o benchmark
+    usa um banco por cenário); fechar o banco anterior fica a cargo de quem chama.
+    """
+    global db_manager, broadcast_engine, meeting_scheduler, broadcast_scheduler, persistence
+    global join_aggregator, flood_guard, admin_registry, group_registry, templates
+    
+    # Migrações em post_init/run_bot, fora da construção
+    db = DatabaseManager(db_path, initialize=False)
+    db_manager = db
+    broadcast_engine = BroadcastEngine()
+    meeting_scheduler = MeetingScheduler(db)
+    broadcast_scheduler = BroadcastScheduler(db)
+    persistence = SQLitePersistence(db)
+    join_aggregator = JoinAggregator()
+    flood_guard = flood or FloodGuard()
+    # ADMIN_IDS + administradores dos grupos cadastrados (carregados em post_init)
+    admin_registry = AdminRegistry()
+    group_registry = GroupRegistry(db, on_change=admin_registry.track_chats)
+    templates = TemplateRegistry()
+    templates.load()
+    
+    metrics.gauge('bot_write_buffer_pending', lambda: db.buffer.pending)
+    metrics.gauge('bot_db_size_bytes', lambda: os.path.getsize(db.db_path))
+    metrics.gauge('bot_schedules_active', lambda: len(broadcast_scheduler))
+    metrics.gauge('bot_persistence_pending', lambda: persistence.pending)
+    metrics.gauge('bot_flood_tracked_keys', lambda: flood_guard.tracked)
+    return db
 
 # Funções de verificação
 def is_admin(user_id: int) -> bool:
-    """Verifica se o usuário é administrador"""
-    return user_id in ADMIN_IDS
+    """Verifica se o usuário é administrador (consulta apenas o cache em memória)"""
+    return admin_registry.is_admin(user_id)
 
 def is_group_chat(chat_id: int) -> bool:
-    """Verifica se é um chat de grupo"""
-    return chat_id in [GRUPO_PRINCIPAL_ID, GRUPO_DUVIDAS_ID]
+    """Verifica se é um dos grupos cadastrados"""
+    return chat_id in group_registry
 
 # Handlers de comandos
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -332,7 +3408,7 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat = update.effective_chat
     
     # Adiciona usuário ao banco
-    db_manager.add_user(user.id, user.username, user.first_name, user.last_name)
+    await db_manager.add_user(user.id, user.username, user.first_name, user.last_name)
     
     if chat.type == 'private':
         message = (
@@ -345,8 +3421,9 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
     else:
         # Mensagem de boas-vindas para grupos
-        group_type = 'principal' if chat.id == GRUPO_PRINCIPAL_ID else 'duvidas'
-        message = MessagesManager.get_welcome_message(group_type)
+        group = group_registry.get(chat.id)
+        template = GroupRegistry.welcome_template(group) if group else None
+        message = MessagesManager.get_welcome_message(template or 'welcome_principal')
     
     await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
 
@@ -358,15 +3435,27 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         message = (
             "🔧 **COMANDOS ADMINISTRATIVOS** 🔧\n\n"
             "📊 **Estatísticas:**\n"
-            "/stats - Estatísticas do bot\n\n"
+            "/stats - Estatísticas do bot\n"
+            "/stats recontar - Recalcula os contadores\n"
+            "/stats 7d | 30d | DD/MM/AAAA - Estatísticas por período e grupo\n\n"
             "📝 **Mensagens:**\n"
             "/mensagens - Menu de mensagens\n"
             "/morning - Mensagem matinal\n"
             "/alert - Mensagem de alerta\n"
-            "/motivacional - Mensagem motivacional\n\n"
+            "/motivacional - Mensagem motivacional\n"
+            "/templates - Templates de mensagens\n"
+            "/buscar - Buscar no histórico de mensagens\n"
+            "/exportar - Exportar usuários ou mensagens\n"
+            "/grupos - Grupos gerenciados\n\n"
             "📅 **Reuniões:**\n"
             "/set_meeting - Agendar reunião\n"
-            "/test_meeting - Testar notificação\n\n"
+            "/test_meeting - Testar notificação\n"
+            "/reunioes - Próximas reuniões\n"
+            "/cancelar_reuniao - Cancelar reunião\n\n"
+            "🔁 **Envios programados:**\n"
+            "/programar - Programar envio recorrente\n"
+            "/programacoes - Envios programados\n"
+            "/cancelar_programacao - Cancelar envio programado\n\n"
             "👥 **Usuários:**\n"
             "/start - Comando inicial"
         )
@@ -381,13 +3470,80 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
 
+def parse_stats_range(args: List[str]) -> Optional[tuple]:
+    """Interpreta '7d', '30d' ou 'DD/MM/AAAA [DD/MM/AAAA]'; retorna (início, fim) em date"""
+    today = datetime.now(timezone.utc).date()
+    spec = args[0].lower()
+    if spec.endswith('d') and spec[:-1].isdigit():
+        days = int(spec[:-1])
+        if days < 1:
+            return None
+        return today - timedelta(days=days - 1), today
+    try:
+        start = datetime.strptime(args[0], '%d/%m/%Y').date()
+        end = datetime.strptime(args[1], '%d/%m/%Y').date() if len(args) > 1 else today
+    except ValueError:
+        return None
+    return (start, end) if start <= end else None
+
+def group_label(chat_id: int) -> str:
+    """Nome legível de um grupo cadastrado (ou o próprio ID)"""
+    return group_registry.label(chat_id)
+
+async def range_stats_reply(update: Update, args: List[str]):
+    """Responde ao /stats com intervalo, a partir dos rollups diários"""
+    period = parse_stats_range(args)
+    if period is None:
+        await update.message.reply_text(
+            "❌ Intervalo inválido!\n\n"
+            "Use: `/stats 7d`, `/stats 30d` ou `/stats DD/MM/AAAA [DD/MM/AAAA]`",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        return
+    start, end = period
+    stats = await db_manager.get_range_stats(start.isoformat(), end.isoformat())
+    
+    message = (
+        f"📊 **ESTATÍSTICAS** 📊\n"
+        f"{start.strftime('%d/%m/%Y')} a {end.strftime('%d/%m/%Y')} (UTC)\n\n"
+        f"💬 Mensagens: {stats['messages']}\n"
+        f"👥 Usuários ativos: {stats['active_users']}\n"
+        f"🆕 Entradas: {stats['joins']}\n"
+    )
+    if stats['groups']:
+        message += "\n🏘️ **Por grupo:**\n"
+        for group in stats['groups']:
+            message += (
+                f"• {TemplateRegistry.escape(group_label(group['chat_id']))}: "
+                f"{group['messages']} msgs, {group['active_users']} ativos, {group['joins']} entradas\n"
+            )
+    await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
+
 async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Comando /stats - apenas para admins"""
     if not is_admin(update.effective_user.id):
         await update.message.reply_text(MessagesManager.get_error_message('permission'))
         return
     
-    stats = db_manager.get_user_stats()
+    # /stats recontar - refaz a contagem completa e corrige os contadores
+    if context.args and context.args[0].lower() == 'recontar':
+        drift = await db_manager.reconcile_user_stats()
+        logger.info(f"Contadores de estatísticas reconciliados: {drift}")
+        await update.message.reply_text(
+            f"🔄 **CONTADORES RECALCULADOS** 🔄\n\n"
+            f"• Usuários: {drift['total_users']:+d}\n"
+            f"• Novos hoje: {drift['users_today']:+d}\n"
+            f"• Mensagens: {drift['total_messages']:+d}",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        return
+    
+    # /stats 7d | 30d | DD/MM/AAAA [DD/MM/AAAA] - intervalo com detalhamento por grupo
+    if context.args:
+        await range_stats_reply(update, context.args)
+        return
+    
+    stats = await db_manager.get_user_stats()
     now = datetime.now(TIMEZONE)
     
     message = (
@@ -410,16 +3566,9 @@ async def mensagens_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(MessagesManager.get_error_message('permission'))
         return
     
-    keyboard = [
-        [InlineKeyboardButton("🌅 Mensagem Matinal", callback_data="select_group_morning")],
-        [InlineKeyboardButton("🚨 Alerta de Oportunidade", callback_data="select_group_alert")],
-        [InlineKeyboardButton("💪 Mensagem Motivacional", callback_data="select_group_motivational")],
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
     await update.message.reply_text(
-        "📝 **MENU DE MENSAGENS**\n\nEscolha o tipo de mensagem para enviar:",
-        reply_markup=reply_markup,
+        MESSAGES_MENU_TEXT,
+        reply_markup=MESSAGES_MENU_KEYBOARD,
         parse_mode=ParseMode.MARKDOWN
     )
 
@@ -429,16 +3578,9 @@ async def morning_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(MessagesManager.get_error_message('permission'))
         return
     
-    keyboard = [
-        [InlineKeyboardButton("🎯 Grupo Principal", callback_data="send_morning_principal")],
-        [InlineKeyboardButton("❓ Grupo de Dúvidas", callback_data="send_morning_duvidas")],
-        [InlineKeyboardButton("📢 Ambos os Grupos", callback_data="send_morning_both")],
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
     await update.message.reply_text(
         "🌅 **MENSAGEM MATINAL**\n\nPara onde deseja enviar?",
-        reply_markup=reply_markup,
+        reply_markup=TARGET_KEYBOARDS[('morning', False)],
         parse_mode=ParseMode.MARKDOWN
     )
 
@@ -448,16 +3590,9 @@ async def alert_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(MessagesManager.get_error_message('permission'))
         return
     
-    keyboard = [
-        [InlineKeyboardButton("🎯 Grupo Principal", callback_data="send_alert_principal")],
-        [InlineKeyboardButton("❓ Grupo de Dúvidas", callback_data="send_alert_duvidas")],
-        [InlineKeyboardButton("📢 Ambos os Grupos", callback_data="send_alert_both")],
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
     await update.message.reply_text(
         "🚨 **ALERTA DE OPORTUNIDADE**\n\nPara onde deseja enviar?",
-        reply_markup=reply_markup,
+        reply_markup=TARGET_KEYBOARDS[('alert', False)],
         parse_mode=ParseMode.MARKDOWN
     )
 
@@ -467,136 +3602,347 @@ async def motivacional_command(update: Update, context: ContextTypes.DEFAULT_TYP
         await update.message.reply_text(MessagesManager.get_error_message('permission'))
         return
     
-    keyboard = [
-        [InlineKeyboardButton("🎯 Grupo Principal", callback_data="send_motivational_principal")],
-        [InlineKeyboardButton("❓ Grupo de Dúvidas", callback_data="send_motivational_duvidas")],
-        [InlineKeyboardButton("📢 Ambos os Grupos", callback_data="send_motivational_both")],
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
     await update.message.reply_text(
         "💪 **MENSAGEM MOTIVACIONAL**\n\nPara onde deseja enviar?",
-        reply_markup=reply_markup,
+        reply_markup=TARGET_KEYBOARDS[('motivational', False)],
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+# Callbacks dos botões inline (despachados pelo callback_router)
+@callback_router.route('m')
+async def messages_menu_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Volta ao menu principal de mensagens"""
+    await update.callback_query.edit_message_text(
+        MESSAGES_MENU_TEXT,
+        reply_markup=MESSAGES_MENU_KEYBOARD,
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+@callback_router.route('g', types=(str,))
+async def select_group_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, message_type: str):
+    """Seleção do grupo de destino de uma mensagem"""
+    if message_type not in MESSAGE_TYPES:
+        await update.callback_query.edit_message_text("❌ Tipo de mensagem não reconhecido.")
+        return
+    await update.callback_query.edit_message_text(
+        f"📍 **SELECIONE O GRUPO DE DESTINO**\n\nMensagem: {MESSAGE_TYPES[message_type]['name']}\n\nPara onde deseja enviar?",
+        reply_markup=TARGET_KEYBOARDS[(message_type, True)],
         parse_mode=ParseMode.MARKDOWN
     )
 
-# Handler para callbacks dos botões inline
-async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handler para callbacks dos botões inline"""
+@callback_router.route('s', types=(str, str))
+async def send_message_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, message_type: str, target: str):
+    """Envio de uma mensagem predefinida para os grupos escolhidos"""
     query = update.callback_query
-    await query.answer()
+    if message_type not in MESSAGE_TYPES or target not in MESSAGE_TARGETS:
+        await query.edit_message_text("❌ Formato de callback inválido.")
+        return
+    spec = MESSAGE_TYPES[message_type]
+    type_name = spec['type_name']
+    message = spec['render']()
     
-    if not is_admin(query.from_user.id):
-        await query.edit_message_text(MessagesManager.get_error_message('permission'))
+    # Determinar grupos de destino (registro de grupos)
+    groups = MESSAGE_TARGETS[target]['groups']()
+    target_chats = [chat_id for chat_id, _ in groups]
+    group_names = [group_name for _, group_name in groups]
+    
+    if not target_chats:
+        await query.edit_message_text("❌ Nenhum grupo configurado para envio.")
         return
     
-    # Seleção de grupo para mensagens
-    if query.data.startswith("select_group_"):
-        message_type = query.data.replace("select_group_", "")
-        keyboard = [
-            [InlineKeyboardButton("🎯 Grupo Principal", callback_data=f"send_{message_type}_principal")],
-            [InlineKeyboardButton("❓ Grupo de Dúvidas", callback_data=f"send_{message_type}_duvidas")],
-            [InlineKeyboardButton("📢 Ambos os Grupos", callback_data=f"send_{message_type}_both")],
-            [InlineKeyboardButton("⬅️ Voltar", callback_data="back_to_menu")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        message_names = {
-            "morning": "Matinal",
-            "alert": "Alerta de Oportunidade", 
-            "motivational": "Motivacional"
-        }
-        
+    # Enviar mensagens (concorrente, respeitando os limites do Telegram)
+    results = await broadcast_engine.send(
+        context.bot, target_chats, message, parse_mode=ParseMode.MARKDOWN
+    )
+    failed = []
+    for result, group_name in zip(results, group_names):
+        if not result['ok']:
+            failed.append(group_name)
+            logger.error(f"Erro ao enviar mensagem {type_name} para {result['chat_id']}: {result['error']}")
+    
+    if not failed:
+        groups_text = format_member_names(group_names)
+        await query.edit_message_text(f"✅ Mensagem {type_name} enviada com sucesso para: {groups_text}!")
+    elif len(failed) < len(results):
         await query.edit_message_text(
-            f"📍 **SELECIONE O GRUPO DE DESTINO**\n\nMensagem: {message_names.get(message_type, message_type)}\n\nPara onde deseja enviar?",
-            reply_markup=reply_markup,
-            parse_mode=ParseMode.MARKDOWN
+            f"⚠️ Mensagem {type_name} enviada parcialmente. Falhou para: {format_member_names(failed)}."
         )
+    else:
+        await query.edit_message_text(f"❌ Erro ao enviar mensagem {type_name}. Verifique as configurações.")
+
+@callback_router.route('p', types=(int, int))
+async def meetings_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, ts: int, meeting_id: int):
+    """Paginação da lista de reuniões"""
+    page = await db_manager.get_upcoming_meetings(limit=MEETINGS_PAGE_SIZE, cursor=(ts, meeting_id))
+    message, reply_markup = build_meetings_page(page)
+    await update.callback_query.edit_message_text(message, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+
+# Tipos de mensagem e destinos do menu de mensagens
+MESSAGE_TYPES: Dict[str, Dict] = {
+    'morning': {'button': "🌅 Mensagem Matinal", 'name': "Matinal", 'type_name': "matinal",
+                'render': MessagesManager.get_morning_message},
+    'alert': {'button': "🚨 Alerta de Oportunidade", 'name': "Alerta de Oportunidade", 'type_name': "de alerta",
+              'render': MessagesManager.get_alert_message},
+    'motivational': {'button': "💪 Mensagem Motivacional", 'name': "Motivacional", 'type_name': "motivacional",
+                     'render': MessagesManager.get_motivational_message},
+}
+
+MESSAGE_TARGETS: Dict[str, Dict] = {
+    'principal': {'button': "🎯 Grupos Principais",
+                  'groups': lambda: group_registry.targets('principal')},
+    'duvidas': {'button': "❓ Grupos de Dúvidas",
+                'groups': lambda: group_registry.targets('duvidas')},
+    'both': {'button': "📢 Todos os Grupos",
+             'groups': lambda: group_registry.targets()},
+}
+
+# Teclados fixos, montados uma única vez e compartilhados (InlineKeyboardMarkup é imutável)
+MESSAGES_MENU_TEXT = "📝 **MENU DE MENSAGENS**\n\nEscolha o tipo de mensagem para enviar:"
+MESSAGES_MENU_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton(spec['button'], callback_data=callback_router.encode('g', message_type))]
+    for message_type, spec in MESSAGE_TYPES.items()
+])
+TARGET_KEYBOARDS: Dict[tuple, InlineKeyboardMarkup] = {
+    (message_type, with_back): InlineKeyboardMarkup(
+        [[InlineKeyboardButton(target['button'], callback_data=callback_router.encode('s', message_type, key))]
+         for key, target in MESSAGE_TARGETS.items()]
+        + ([[InlineKeyboardButton("⬅️ Voltar", callback_data=callback_router.encode('m'))]] if with_back else [])
+    )
+    for message_type in MESSAGE_TYPES
+    for with_back in (False, True)
+}
+
+async def templates_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Comando /templates - lista os templates e permite recarregá-los"""
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text(MessagesManager.get_error_message('permission'))
         return
     
-    # Voltar ao menu principal
-    if query.data == "back_to_menu":
-        keyboard = [
-            [InlineKeyboardButton("🌅 Mensagem Matinal", callback_data="select_group_morning")],
-            [InlineKeyboardButton("🚨 Alerta de Oportunidade", callback_data="select_group_alert")],
-            [InlineKeyboardButton("💪 Mensagem Motivacional", callback_data="select_group_motivational")],
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await query.edit_message_text(
-            "📝 **MENU DE MENSAGENS**\n\nEscolha o tipo de mensagem para enviar:",
-            reply_markup=reply_markup,
-            parse_mode=ParseMode.MARKDOWN
+    if context.args and context.args[0].lower() == 'recarregar':
+        try:
+            templates.load()
+        except (OSError, TemplateError) as e:
+            await update.message.reply_text(f"❌ Templates não recarregados: {e}")
+            return
+    
+    names = "\n".join(f"• {name}" for name in templates.names())
+    await update.message.reply_text(f"🧩 Templates carregados:\n{names}")
+
+# Cadastro de grupos
+GROUPS_USAGE = (
+    "🏘️ **GRUPOS**\n\n"
+    "`/grupos` - Lista os grupos cadastrados\n"
+    "`/grupos adicionar apelido principal|duvidas [ID]` - Cadastra ou atualiza um grupo "
+    "(sem ID, usa o grupo onde o comando foi enviado)\n"
+    "`/grupos remover apelido|ID`\n"
+    "`/grupos boasvindas apelido|ID template|padrao|nenhuma`\n"
+    "`/grupos envios apelido|ID sim|nao`"
+)
+LIST_MAX_CHARS = 3500
+
+def valid_group_alias(alias: str) -> bool:
+    """Apelido de grupo: começa com letra, até 32 caracteres entre letras, dígitos, '_' e '-'"""
+    return (0 < len(alias) <= 32 and alias[0].isalpha()
+            and all(char.isalnum() or char in '_-' for char in alias))
+
+def format_groups_list() -> str:
+    """Lista dos grupos cadastrados, resumida se passar do tamanho de uma mensagem"""
+    groups = group_registry.all()
+    if not groups:
+        return "🏘️ Nenhum grupo cadastrado.\n\n" + GROUPS_USAGE
+    lines = [f"🏘️ **GRUPOS CADASTRADOS** ({len(groups)})\n"]
+    size = len(lines[0])
+    for shown, group in enumerate(groups):
+        welcome = group['welcome_template']
+        welcome = 'padrão' if welcome is None else (welcome or 'nenhuma')
+        line = (
+            f"• `{group['alias']}` {TemplateRegistry.escape(group['title'])} ({group['chat_id']})\n"
+            f"  {GROUP_ROLES.get(group['role'], group['role'])} · boas-vindas: {TemplateRegistry.escape(welcome)}"
+            f" · envios: {'sim' if group['broadcast'] else 'não'}"
         )
+        if size + len(line) > LIST_MAX_CHARS:
+            lines.append(f"… e mais {len(groups) - shown} grupos")
+            break
+        lines.append(line)
+        size += len(line) + 1
+    return "\n".join(lines)
+
+async def grupos_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Comando /grupos - lista e altera o cadastro de grupos"""
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text(MessagesManager.get_error_message('permission'))
         return
     
-    # Envio de mensagens para grupos específicos
-    if query.data.startswith("send_"):
-        parts = query.data.split("_")
-        if len(parts) >= 3:
-            message_type = parts[1]
-            target_group = "_".join(parts[2:])
-            
-            # Obter a mensagem correta
-            if message_type == "morning":
-                message = MessagesManager.get_morning_message()
-                type_name = "matinal"
-            elif message_type == "alert":
-                message = MessagesManager.get_alert_message()
-                type_name = "de alerta"
-            elif message_type == "motivational":
-                message = MessagesManager.get_motivational_message()
-                type_name = "motivacional"
-            else:
-                await query.edit_message_text("❌ Tipo de mensagem não reconhecido.")
-                return
-            
-            # Determinar grupos de destino
-            target_chats = []
-            group_names = []
-            
-            if target_group == "principal" and GRUPO_PRINCIPAL_ID:
-                target_chats.append(GRUPO_PRINCIPAL_ID)
-                group_names.append("Grupo Principal")
-            elif target_group == "duvidas" and GRUPO_DUVIDAS_ID:
-                target_chats.append(GRUPO_DUVIDAS_ID)
-                group_names.append("Grupo de Dúvidas")
-            elif target_group == "both":
-                if GRUPO_PRINCIPAL_ID:
-                    target_chats.append(GRUPO_PRINCIPAL_ID)
-                    group_names.append("Grupo Principal")
-                if GRUPO_DUVIDAS_ID:
-                    target_chats.append(GRUPO_DUVIDAS_ID)
-                    group_names.append("Grupo de Dúvidas")
-            
-            if not target_chats:
-                await query.edit_message_text("❌ Nenhum grupo configurado para envio.")
+    args = context.args or []
+    if not args:
+        await update.message.reply_text(format_groups_list(), parse_mode=ParseMode.MARKDOWN)
+        return
+    action = args[0].lower()
+    
+    if action == 'adicionar' and len(args) in (3, 4):
+        alias, role = args[1], args[2].lower()
+        if not valid_group_alias(alias) or role not in GROUP_ROLES:
+            await update.message.reply_text(GROUPS_USAGE, parse_mode=ParseMode.MARKDOWN)
+            return
+        chat = update.effective_chat
+        if len(args) == 4:
+            if not args[3].lstrip('-').isdigit():
+                await update.message.reply_text("❌ ID de grupo inválido.")
                 return
-            
-            # Enviar mensagens
-            success_count = 0
-            for chat_id in target_chats:
-                try:
-                    await context.bot.send_message(
-                        chat_id=chat_id,
-                        text=message,
-                        parse_mode=ParseMode.MARKDOWN
-                    )
-                    success_count += 1
-                except Exception as e:
-                    logger.error(f"Erro ao enviar mensagem {type_name} para {chat_id}: {e}")
-            
-            if success_count == len(target_chats):
-                groups_text = " e ".join(group_names)
-                await query.edit_message_text(f"✅ Mensagem {type_name} enviada com sucesso para: {groups_text}!")
-            elif success_count > 0:
-                await query.edit_message_text(f"⚠️ Mensagem {type_name} enviada parcialmente. Verifique os logs.")
+            chat_id = int(args[3])
+            try:
+                title = (await context.bot.get_chat(chat_id)).title or alias
+            except Exception as e:
+                logger.warning(f"Não foi possível ler o nome do chat {chat_id}: {e}")
+                title = alias
+        elif chat.type in ('group', 'supergroup'):
+            chat_id, title = chat.id, chat.title or alias
+        else:
+            await update.message.reply_text("❌ Informe o ID do grupo ou envie o comando dentro dele.")
+            return
+        try:
+            await group_registry.save(chat_id, alias, title, role)
+        except sqlite3.IntegrityError:
+            await update.message.reply_text(f"❌ O apelido {alias} já é usado por outro grupo.")
+            return
+        logger.info(f"Grupo {chat_id} cadastrado como {alias} ({role}) por {update.effective_user.id}")
+        await update.message.reply_text(f"✅ Grupo {title} cadastrado como {alias} ({GROUP_ROLES[role]}).")
+        return
+    
+    if action in ('remover', 'boasvindas', 'envios') and len(args) == (2 if action == 'remover' else 3):
+        chat_id = group_registry.resolve(args[1])
+        if chat_id is None:
+            await update.message.reply_text("❌ Grupo não encontrado. Use /grupos para ver os cadastrados.")
+            return
+        if action == 'remover':
+            await group_registry.remove(chat_id)
+            logger.info(f"Grupo {chat_id} removido do cadastro por {update.effective_user.id}")
+            await update.message.reply_text(f"✅ Grupo {chat_id} removido do cadastro.")
+            return
+        value = args[2].lower()
+        if action == 'boasvindas':
+            if value == 'padrao':
+                fields = {'welcome_template': None}
+            elif value == 'nenhuma':
+                fields = {'welcome_template': ''}
+            elif args[2] in templates:
+                fields = {'welcome_template': args[2]}
             else:
-                await query.edit_message_text(f"❌ Erro ao enviar mensagem {type_name}. Verifique as configurações.")
+                await update.message.reply_text(f"❌ Template {args[2]} não encontrado. Veja /templates.")
+                return
+        elif value in ('sim', 'nao', 'não'):
+            fields = {'broadcast': int(value == 'sim')}
         else:
-            await query.edit_message_text("❌ Formato de callback inválido.")
-    else:
-        await query.edit_message_text("❌ Ação não reconhecida.")
+            await update.message.reply_text(GROUPS_USAGE, parse_mode=ParseMode.MARKDOWN)
+            return
+        await group_registry.update(chat_id, **fields)
+        logger.info(f"Grupo {chat_id} alterado por {update.effective_user.id}: {fields}")
+        await update.message.reply_text(f"✅ Cadastro de {group_label(chat_id)} atualizado.")
+        return
+    
+    await update.message.reply_text(GROUPS_USAGE, parse_mode=ParseMode.MARKDOWN)
+
+# Envios programados
+SCHEDULE_USAGE = (
+    "🔁 **PROGRAMAR ENVIO**\n\n"
+    "Use: `/programar min hora dia mês dia-da-semana template destino [ignorar|ultimo|todos] [fuso]`\n\n"
+    "• Expressão cron de 5 campos (`*`, `1,15`, `1-5`, `*/15`) ou `@daily`, `@weekly`...\n"
+    "• Template: um dos /templates\n"
+    "• Destino: `principal`, `duvidas`, `todos` ou apelidos separados por vírgula\n"
+    "• Disparos perdidos com o bot fora do ar: `ignorar` (padrão), `ultimo` ou `todos`\n\n"
+    "Ex.: `/programar 0 8 * * 1-5 morning principal`"
+)
+
+def parse_schedule_args(args: List[str]) -> Dict:
+    """Interpreta os argumentos do /programar (levanta CronError com o motivo se forem inválidos)"""
+    cron_size = 1 if args and args[0].startswith('@') else 5
+    if len(args) < cron_size + 2:
+        raise CronError("faltam argumentos")
+    cron = ' '.join(args[:cron_size])
+    template, target = args[cron_size], args[cron_size + 1].lower()
+    catch_up, timezone = 'ignorar', TIMEZONE.zone
+    for arg in args[cron_size + 2:]:
+        if arg.lower() in BroadcastScheduler.CATCH_UP_POLICIES:
+            catch_up = arg.lower()
+        else:
+            timezone = arg
+    expr = CronExpression(cron, timezone)
+    expr.next_after(time_module.time())  # rejeita expressões que nunca disparam
+    if template not in templates:
+        raise CronError(f"template {template} não encontrado (veja /templates)")
+    if group_registry.target_chats(target) is None:
+        raise CronError(f"destino {target} não encontrado (veja /grupos)")
+    return {'cron': expr.expression, 'timezone': timezone, 'template': template,
+            'target': target, 'catch_up': catch_up}
+
+async def programar_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Comando /programar - cria um envio recorrente"""
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text(MessagesManager.get_error_message('permission'))
+        return
+    
+    try:
+        spec = parse_schedule_args(context.args or [])
+    except CronError as e:
+        await update.message.reply_text(f"❌ {e}\n\n{SCHEDULE_USAGE}", parse_mode=ParseMode.MARKDOWN)
+        return
+    schedule = await db_manager.add_schedule(created_by=update.effective_user.id, **spec)
+    broadcast_scheduler.add(schedule)
+    logger.info(f"Envio programado #{schedule['id']} criado por {update.effective_user.id}: {spec}")
+    
+    next_fire = datetime.fromtimestamp(schedule['due'], schedule['expr'].tz)
+    await update.message.reply_text(
+        f"✅ **ENVIO PROGRAMADO #{schedule['id']}** ✅\n\n"
+        f"🔁 `{schedule['cron']}` ({schedule['timezone']})\n"
+        f"🧩 {TemplateRegistry.escape(schedule['template'])} → {TemplateRegistry.escape(schedule['target'])}\n"
+        f"⏭️ Próximo envio: {next_fire.strftime('%d/%m/%Y às %H:%M')}",
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+async def programacoes_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Comando /programacoes - lista os envios programados, do próximo disparo ao mais distante"""
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text(MessagesManager.get_error_message('permission'))
+        return
+    
+    schedules = broadcast_scheduler.all()
+    if not schedules:
+        await update.message.reply_text("🔁 Nenhum envio programado. Use /programar para criar um.")
+        return
+    lines = [f"🔁 **ENVIOS PROGRAMADOS** ({len(schedules)})\n"]
+    size = len(lines[0])
+    for shown, schedule in enumerate(schedules):
+        next_fire = datetime.fromtimestamp(schedule['due'], schedule['expr'].tz)
+        line = (
+            f"#{schedule['id']} `{schedule['cron']}` ({schedule['timezone']})\n"
+            f"  {TemplateRegistry.escape(schedule['template'])} → {TemplateRegistry.escape(schedule['target'])}"
+            f" · perdidos: {schedule['catch_up']} · próximo: {next_fire.strftime('%d/%m %H:%M')}"
+        )
+        if size + len(line) > LIST_MAX_CHARS:
+            lines.append(f"… e mais {len(schedules) - shown} envios")
+            break
+        lines.append(line)
+        size += len(line) + 1
+    await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.MARKDOWN)
+
+async def cancelar_programacao_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Comando /cancelar_programacao - desativa um envio programado"""
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text(MessagesManager.get_error_message('permission'))
+        return
+    
+    if not context.args or len(context.args) != 1 or not context.args[0].lstrip('#').isdigit():
+        await update.message.reply_text("❌ Formato inválido. Use: /cancelar_programacao ID")
+        return
+    
+    schedule_id = int(context.args[0].lstrip('#'))
+    if not await db_manager.cancel_schedule(schedule_id):
+        await update.message.reply_text("❌ Envio programado não encontrado ou já cancelado.")
+        return
+    
+    broadcast_scheduler.cancel(schedule_id)
+    logger.info(f"Envio programado #{schedule_id} cancelado por {update.effective_user.id}")
+    await update.message.reply_text(f"✅ Envio programado #{schedule_id} cancelado.")
 
 # Comandos de reunião
 async def set_meeting_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -626,27 +3972,22 @@ async def set_meeting_command(update: Update, context: ContextTypes.DEFAULT_TYPE
             return
         
         # Adiciona reunião ao banco
-        meeting_id = db_manager.add_meeting(
+        meeting_id = await db_manager.add_meeting(
             title=title,
             description=f"Reunião agendada por {update.effective_user.first_name}",
             scheduled_time=meeting_time,
             created_by=update.effective_user.id
         )
         
-        # Agenda job para notificação
-        context.job_queue.run_once(
-            meeting_notification_job,
-            when=meeting_time - timedelta(minutes=30),
-            data={'meeting_id': meeting_id, 'title': title, 'time': meeting_time},
-            name=f"meeting_notification_{meeting_id}"
-        )
+        # Agenda o lembrete (persistido no banco, sobrevive a restarts)
+        meeting_scheduler.schedule({'id': meeting_id, 'title': title, 'scheduled_time': meeting_time})
         
         formatted_time = meeting_time.strftime("%d/%m/%Y às %H:%M")
         message = (
             f"✅ **REUNIÃO AGENDADA** ✅\n\n"
             f"📅 **Data:** {formatted_time}\n"
-            f"📋 **Título:** {title}\n\n"
-            f"🔔 Os membros serão notificados 30 minutos antes da reunião."
+            f"📋 **Título:** {TemplateRegistry.escape(title)}\n\n"
+            f"🔔 Os membros serão notificados {MEETING_NOTIFY_MINUTES} minutos antes da reunião."
         )
         
         await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
@@ -683,93 +4024,301 @@ async def test_meeting_command(update: Update, context: ContextTypes.DEFAULT_TYP
     
     await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
 
-# Job para notificações de reunião
-async def meeting_notification_job(context: ContextTypes.DEFAULT_TYPE):
-    """Job que envia notificações de reunião"""
-    job_data = context.job.data
-    title = job_data['title']
-    meeting_time = job_data['time']
+def build_meetings_page(page: Dict) -> tuple:
+    """Monta o texto e o teclado de uma página da lista de reuniões"""
+    if not page['meetings']:
+        return "📅 Nenhuma reunião agendada.", None
+    
+    lines = ["📅 **PRÓXIMAS REUNIÕES** 📅\n"]
+    for meeting in page['meetings']:
+        formatted_time = meeting['scheduled_time'].strftime("%d/%m/%Y às %H:%M")
+        lines.append(f"• `#{meeting['id']}` {formatted_time} - {TemplateRegistry.escape(meeting['title'])}")
+    
+    reply_markup = None
+    if page['next_cursor']:
+        ts, meeting_id = page['next_cursor']
+        reply_markup = InlineKeyboardMarkup([
+            [InlineKeyboardButton("➡️ Próximas", callback_data=callback_router.encode('p', ts, meeting_id))]
+        ])
+    return "\n".join(lines), reply_markup
+
+async def reunioes_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Comando /reunioes - lista as próximas reuniões (paginado)"""
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text(MessagesManager.get_error_message('permission'))
+        return
+    
+    page = await db_manager.get_upcoming_meetings(limit=MEETINGS_PAGE_SIZE)
+    message, reply_markup = build_meetings_page(page)
+    await update.message.reply_text(message, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+
+async def cancelar_reuniao_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Comando /cancelar_reuniao - cancela uma reunião agendada"""
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text(MessagesManager.get_error_message('permission'))
+        return
+    
+    if len(context.args) != 1 or not context.args[0].lstrip('#').isdigit():
+        await update.message.reply_text("❌ Formato inválido. Use: /cancelar_reuniao ID")
+        return
+    
+    meeting_id = int(context.args[0].lstrip('#'))
+    if not await db_manager.cancel_meeting(meeting_id):
+        await update.message.reply_text("❌ Reunião não encontrada ou já cancelada.")
+        return
+    
+    meeting_scheduler.cancel(meeting_id)
+    await update.message.reply_text(f"✅ Reunião #{meeting_id} cancelada.")
+
+# Busca no histórico de mensagens
+SEARCH_USAGE = (
+    "🔎 **BUSCA NAS MENSAGENS**\n\n"
+    "Use: `/buscar [chat:apelido|ID] [de:DD/MM/AAAA] [ate:DD/MM/AAAA] termos`\n\n"
+    "Termos terminados em `*` buscam por prefixo (ex.: `opç*`)."
+)
+
+def parse_search_args(args: List[str], groups: Optional[GroupRegistry] = None) -> Optional[Dict]:
+    """Separa filtros (chat:, de:, ate:) dos termos; retorna None se algum filtro for inválido.
+    
+    Os apelidos de `chat:` são resolvidos em `groups` (padrão: o registro do bot).
+    """
+    if groups is None:
+        groups = group_registry
+    search = {'text': [], 'chat_id': None, 'start': None, 'end': None}
+    for arg in args:
+        key, _, value = arg.partition(':')
+        key = key.lower()
+        try:
+            if key == 'chat' and value:
+                search['chat_id'] = groups.resolve(value) or int(value)
+            elif key == 'de' and value:
+                search['start'] = datetime.strptime(value, '%d/%m/%Y').strftime('%Y-%m-%d 00:00:00')
+            elif key in ('ate', 'até') and value:
+                day = datetime.strptime(value, '%d/%m/%Y') + timedelta(days=1)
+                search['end'] = day.strftime('%Y-%m-%d 00:00:00')
+            else:
+                search['text'].append(arg)
+        except ValueError:
+            return None
+    search['text'] = ' '.join(search['text'])
+    return search
+
+async def build_search_page(session_id: int, page: int) -> tuple:
+    """Executa a busca salva e monta o texto e o teclado da página"""
+    search = search_sessions.get(session_id)
+    if search is None:
+        return "⌛ Esta busca expirou. Use /buscar novamente.", None
+    found = await db_manager.search_messages(
+        search['text'], chat_id=search['chat_id'], start=search['start'], end=search['end'],
+        limit=SEARCH_PAGE_SIZE, offset=page * SEARCH_PAGE_SIZE
+    )
+    if not found['results']:
+        return "🔎 Nenhuma mensagem encontrada." if page == 0 else "🔎 Não há mais resultados.", None
+    
+    lines = [f"🔎 **RESULTADOS** (página {page + 1})\n"]
+    for result in found['results']:
+        sent_at = datetime.strptime(result['timestamp'], '%Y-%m-%d %H:%M:%S').replace(tzinfo=pytz.utc)
+        author = f"@{result['username']}" if result['username'] else (result['first_name'] or 'desconhecido')
+        lines.append(
+            f"• {sent_at.astimezone(TIMEZONE).strftime('%d/%m/%Y %H:%M')} · "
+            f"{TemplateRegistry.escape(group_label(result['chat_id']))} · {TemplateRegistry.escape(author)}\n"
+            f"  {TemplateRegistry.escape(result['snippet'])}"
+        )
     
-    formatted_time = meeting_time.strftime("%d/%m/%Y às %H:%M")
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton("⬅️ Anteriores", callback_data=callback_router.encode('b', session_id, page - 1)))
+    if found['has_more']:
+        buttons.append(InlineKeyboardButton("➡️ Próximos", callback_data=callback_router.encode('b', session_id, page + 1)))
+    return "\n".join(lines), InlineKeyboardMarkup([buttons]) if buttons else None
+
+async def buscar_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Comando /buscar - busca textual no histórico de mensagens"""
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text(MessagesManager.get_error_message('permission'))
+        return
+    
+    search = parse_search_args(context.args or [])
+    if search is None or not DatabaseManager.fts_query(search['text']):
+        await update.message.reply_text(SEARCH_USAGE, parse_mode=ParseMode.MARKDOWN)
+        return
+    
+    session_id = next(search_session_ids)
+    search_sessions.put(session_id, search)
+    message, reply_markup = await build_search_page(session_id, 0)
+    await update.message.reply_text(message, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+
+@callback_router.route('b', types=(int, int))
+async def search_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, session_id: int, page: int):
+    """Paginação dos resultados do /buscar"""
+    message, reply_markup = await build_search_page(session_id, max(0, page))
+    await update.callback_query.edit_message_text(message, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+
+# Exportação de usuários e mensagens
+EXPORT_USAGE = (
+    "📦 **EXPORTAÇÃO**\n\n"
+    "Use: `/exportar usuarios|mensagens [csv|jsonl] [chat:apelido|ID] [de:DD/MM/AAAA] [ate:DD/MM/AAAA]`\n\n"
+    "Os arquivos (.gz, em partes) são enviados no seu privado."
+)
+
+def parse_export_args(args: List[str], groups: Optional[GroupRegistry] = None) -> Optional[Dict]:
+    """Interpreta tabela, formato e filtros (os mesmos do /buscar); retorna None se inválido"""
+    parsed = parse_search_args(args, groups)
+    if parsed is None:
+        return None
+    words = parsed['text'].lower().split()
+    tables = [word for word in words if word in TableExporter.TABLES]
+    formats = [word for word in words if word in TableExporter.FORMATS]
+    if len(tables) != 1 or len(formats) > 1 or len(words) != len(tables) + len(formats):
+        return None
+    if tables[0] == 'usuarios' and parsed['chat_id'] is not None:
+        return None
+    return {'table': tables[0], 'format': formats[0] if formats else 'csv',
+            'chat_id': parsed['chat_id'], 'start': parsed['start'], 'end': parsed['end']}
+
+async def send_export(bot, chat_id: int, spec: Dict):
+    """Gera a exportação e envia cada parte como documento assim que fica pronta"""
+    out_dir = tempfile.mkdtemp(prefix='bot-export-')
+    exporter = TableExporter(db_manager.db_path)
+    parts = rows = 0
+    try:
+        # aclosing: se o envio falhar ou for cancelado, a thread de leitura para na hora
+        async with aclosing(exporter.iter_parts(
+            spec['table'], spec['format'], out_dir,
+            chat_id=spec['chat_id'], start=spec['start'], end=spec['end']
+        )) as export_parts:
+            async for path, number, total in export_parts:
+                with open(path, 'rb') as document:
+                    await bot.send_document(chat_id, document=document, filename=os.path.basename(path),
+                                            caption=f"{spec['table']} · parte {number}", write_timeout=300)
+                parts, rows = number, total
+        if parts:
+            await bot.send_message(chat_id, f"✅ Exportação concluída: {rows} linhas em {parts} arquivo(s).")
+        else:
+            await bot.send_message(chat_id, "📦 Nenhuma linha para exportar com esses filtros.")
+        logger.info(f"Exportação de {spec['table']} ({spec['format']}) enviada para {chat_id}: {rows} linhas")
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"Erro na exportação de {spec['table']} para {chat_id}: {e}")
+        try:
+            await bot.send_message(chat_id, "❌ Erro ao gerar a exportação. Tente novamente.")
+        except Exception:
+            pass
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+async def exportar_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Comando /exportar - exporta usuários ou mensagens em arquivos compactados"""
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text(MessagesManager.get_error_message('permission'))
+        return
+    
+    spec = parse_export_args(context.args or [])
+    if spec is None:
+        await update.message.reply_text(EXPORT_USAGE, parse_mode=ParseMode.MARKDOWN)
+        return
+    if export_tasks:
+        await update.message.reply_text("⏳ Já existe uma exportação em andamento. Aguarde ela terminar.")
+        return
+    
+    # Roda fora do handler: os updates deste chat não esperam a exportação terminar
+    task = asyncio.get_running_loop().create_task(
+        send_export(context.bot, update.effective_user.id, spec), name=f"export-{spec['table']}"
+    )
+    export_tasks.add(task)
+    task.add_done_callback(export_tasks.discard)
+    await update.message.reply_text(
+        f"📦 Exportando {spec['table']} ({spec['format'].upper()}). Os arquivos serão enviados no seu "
+        f"privado (se ainda não conversou com o bot, envie /start para ele)."
+    )
+
+# Notificações de reunião
+async def send_meeting_notification(bot, title: str, meeting_time: datetime) -> List[Dict]:
+    """Envia o lembrete de reunião para os grupos principais; retorna o resultado de cada grupo"""
+    formatted_time = meeting_time.astimezone(TIMEZONE).strftime("%d/%m/%Y às %H:%M")
     
     message = (
         f"🔔 **LEMBRETE DE REUNIÃO** 🔔\n\n"
         f"📅 **Data:** {formatted_time}\n"
-        f"📋 **Título:** {title}\n\n"
-        f"⏰ **A reunião começará em 30 minutos!**\n\n"
+        f"📋 **Título:** {TemplateRegistry.escape(title)}\n\n"
+        f"⏰ **A reunião começará em {MEETING_NOTIFY_MINUTES} minutos!**\n\n"
         f"🎯 Preparem-se e não percam esta oportunidade de aprendizado!"
     )
     
-    # Envia para o grupo principal
-    if GRUPO_PRINCIPAL_ID:
-        try:
-            await context.bot.send_message(
-                chat_id=GRUPO_PRINCIPAL_ID,
-                text=message,
-                parse_mode=ParseMode.MARKDOWN
-            )
-            logger.info(f"Notificação de reunião enviada: {title}")
-        except Exception as e:
-            logger.error(f"Erro ao enviar notificação de reunião: {e}")
+    # Envia para os grupos principais que recebem envios
+    chat_ids = [chat_id for chat_id, _ in group_registry.targets('principal')]
+    results = await broadcast_engine.send(bot, chat_ids, message, parse_mode=ParseMode.MARKDOWN)
+    for result in results:
+        if result['ok']:
+            logger.info(f"Notificação de reunião enviada para {result['chat_id']}: {title}")
+        else:
+            logger.error(f"Erro ao enviar notificação de reunião para {result['chat_id']}: {result['error']}")
+    return results
 
-# Job para mensagens automáticas diárias
-async def daily_morning_job(context: ContextTypes.DEFAULT_TYPE):
-    """Job que envia mensagem matinal automaticamente"""
-    message = MessagesManager.get_morning_message()
-    
-    if GRUPO_PRINCIPAL_ID:
-        try:
-            await context.bot.send_message(
-                chat_id=GRUPO_PRINCIPAL_ID,
-                text=message,
-                parse_mode=ParseMode.MARKDOWN
-            )
-            logger.info("Mensagem matinal automática enviada")
-        except Exception as e:
-            logger.error(f"Erro ao enviar mensagem matinal automática: {e}")
+async def meeting_notification_job(context: ContextTypes.DEFAULT_TYPE):
+    """Job que envia notificações de reunião (usado pelo /test_meeting)"""
+    job_data = context.job.data
+    await send_meeting_notification(context.bot, job_data['title'], job_data['time'])
 
 # Handler para novos membros
+def format_member_names(names: List[str], max_names: int = WELCOME_MAX_NAMES) -> str:
+    """Junta os nomes ('Ana, Bruno e Carla'), resumindo o excedente ('... e mais 12')"""
+    names = [name or 'trader' for name in names]
+    if len(names) > max_names:
+        return f"{', '.join(names[:max_names])} e mais {len(names) - max_names}"
+    if len(names) == 1:
+        return names[0]
+    return f"{', '.join(names[:-1])} e {names[-1]}"
+
+async def welcome_members(bot, chat_id: int, members: List[tuple]):
+    """Grava os membros acumulados e envia uma única mensagem de boas-vindas"""
+    await db_manager.add_members(chat_id, members)
+    
+    group = group_registry.get(chat_id)
+    if group is None:
+        logger.warning(f"Chat ID {chat_id} não cadastrado, usando as boas-vindas do grupo principal")
+        group = {'role': 'principal', 'welcome_template': None}
+    template = GroupRegistry.welcome_template(group)
+    if template is None:
+        return  # boas-vindas desativadas neste grupo
+    text = (MessagesManager.get_welcome_greeting(format_member_names([member[2] for member in members]))
+            + MessagesManager.get_welcome_message(template))
+    
+    # Botões inline apenas nos grupos principais
+    kwargs = {'parse_mode': ParseMode.MARKDOWN}
+    if group['role'] == 'principal':
+        kwargs['reply_markup'] = WELCOME_KEYBOARD
+    
+    result = (await broadcast_engine.send(bot, [chat_id], text, **kwargs))[0]
+    if result['ok']:
+        logger.info(f"Boas-vindas enviadas para {len(members)} novo(s) membro(s) no chat {chat_id}")
+    else:
+        logger.error(f"Erro ao enviar boas-vindas no chat {chat_id}: {result['error']}")
+
 async def new_member_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handler para novos membros do grupo"""
-    for member in update.message.new_chat_members:
-        # Adiciona usuário ao banco
-        db_manager.add_user(member.id, member.username, member.first_name, member.last_name)
-        
-        # Debug: Log dos IDs para verificar
-        chat_id = update.effective_chat.id
-        logger.info(f"Novo membro no chat {chat_id}. GRUPO_PRINCIPAL_ID: {GRUPO_PRINCIPAL_ID}, GRUPO_DUVIDAS_ID: {GRUPO_DUVIDAS_ID}")
-        
-        # Determina tipo do grupo
-        if chat_id == GRUPO_PRINCIPAL_ID:
-            group_type = 'principal'
-            logger.info(f"Identificado como grupo principal")
-        elif chat_id == GRUPO_DUVIDAS_ID:
-            group_type = 'duvidas'
-            logger.info(f"Identificado como grupo de dúvidas")
-        else:
-            group_type = 'principal'  # Default para grupo principal
-            logger.warning(f"Chat ID {chat_id} não reconhecido, usando grupo principal como padrão")
-        
-        welcome_msg = MessagesManager.get_welcome_message(group_type)
-        
-        # Adiciona botões inline apenas para o grupo principal
-        if group_type == 'principal':
-            keyboard = [
-                [InlineKeyboardButton("📚 Mentoria Completa", url="https://www.mentoriaaugetraders.com.br/")],
-                [InlineKeyboardButton("❓ Grupo de Dúvidas", url="https://t.me/+5ueqV0IGf7NlODIx")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await update.message.reply_text(
-                f"👋 Olá {member.first_name}!\n\n{welcome_msg}",
-                parse_mode=ParseMode.MARKDOWN,
-                reply_markup=reply_markup
-            )
-        else:
-            await update.message.reply_text(
-                f"👋 Olá {member.first_name}!\n\n{welcome_msg}",
-                parse_mode=ParseMode.MARKDOWN
-            )
+    """Handler para novos membros do grupo (agrupados por chat pelo JoinAggregator)"""
+    members = [(member.id, member.username, member.first_name, member.last_name)
+               for member in update.message.new_chat_members]
+    await join_aggregator.add(context.bot, update.effective_chat.id, members)
+
+async def chat_member_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Mantém o cache de administradores em dia com promoções e remoções"""
+    change = update.chat_member
+    user = change.new_chat_member.user
+    admin_registry.apply_member_update(change.chat.id, user.id, change.new_chat_member.status, is_bot=user.is_bot)
+
+async def mute_flooder(bot, chat_id: int, user_id: int):
+    """Silencia temporariamente um usuário que estourou o limite de mensagens"""
+    until = datetime.now(pytz.utc) + timedelta(seconds=flood_guard.mute_seconds)
+    try:
+        await bot.restrict_chat_member(chat_id, user_id, ChatPermissions(can_send_messages=False), until_date=until)
+    except Exception as e:
+        metrics.inc('bot_flood_mutes_total', result='error')
+        logger.warning(f"Não foi possível silenciar {user_id} no chat {chat_id}: {e}")
+        return
+    metrics.inc('bot_flood_mutes_total', result='ok')
+    logger.info(f"Usuário {user_id} silenciado por flood no chat {chat_id} por {flood_guard.mute_seconds}s")
 
 # Handler para mensagens gerais
 async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -778,98 +4327,366 @@ async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat = update.effective_chat
     message_text = update.message.text or ""
     
+    # Anti-flood: mensagens acima do limite não chegam ao banco
+    exceeded = flood_guard.check(chat.id, user.id, exempt=is_admin(user.id))
+    if exceeded:
+        metrics.inc('bot_flood_dropped_total', scope=exceeded)
+        if exceeded == 'user' and is_group_chat(chat.id) and flood_guard.claim_mute(chat.id, user.id):
+            await mute_flooder(context.bot, chat.id, user.id)
+        return
+    
     # Log da mensagem
-    db_manager.log_message(user.id, chat.id, message_text, 'user')
+    await db_manager.log_message(user.id, chat.id, message_text, 'user')
     
     # Adiciona/atualiza usuário
-    db_manager.add_user(user.id, user.username, user.first_name, user.last_name)
+    await db_manager.add_user(user.id, user.username, user.first_name, user.last_name)
 
-# Função principal
-def main():
-    """Função principal do bot"""
-    if not BOT_TOKEN:
-        logger.error("BOT_TOKEN não encontrado nas variáveis de ambiente")
+# Servidor HTTP (webhook, health check)
+class WebServer:
+    """Servidor HTTP/1.1 mínimo rodando no próprio event loop do bot.
+    
+    Atende o webhook do Telegram, o /health do Railway e a página inicial,
+    sem threads extras. Se a `update_queue` da aplicação estiver acima de
+    `max_queue`, o webhook responde 503 com Retry-After e o Telegram reenvia
+    o update mais tarde (backpressure). Conexões que ficam `idle_timeout`
+    segundos sem enviar o cabeçalho ou o corpo de uma requisição são fechadas.
+    """
+    
+    MAX_BODY = 1024 * 1024
+    REASONS = {200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found',
+               405: 'Method Not Allowed', 413: 'Payload Too Large', 503: 'Service Unavailable'}
+    
+    def __init__(self, application: Application, port: int = PORT, host: str = '0.0.0.0',
+                 webhook_path: Optional[str] = None, secret_token: Optional[str] = WEBHOOK_SECRET,
+                 max_queue: int = UPDATE_QUEUE_MAX, idle_timeout: float = HTTP_IDLE_TIMEOUT):
+        self.application = application
+        self.host = host
+        self.port = port
+        self.webhook_path = webhook_path
+        self.secret_token = secret_token
+        self.max_queue = max_queue
+        self.idle_timeout = idle_timeout
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: Dict[asyncio.Task, asyncio.StreamWriter] = {}
+        self.routes: Dict[tuple, Callable[[Dict, bytes], Awaitable[tuple]]] = {
+            ('GET', '/'): self._index,
+            ('GET', '/health'): self._health,
+            ('GET', '/metrics'): self._metrics,
+        }
+        if webhook_path:
+            self.routes[('POST', webhook_path)] = self._webhook
+    
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        logger.info(f"Servidor HTTP escutando em {self.host}:{self.port}")
+    
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            for writer in self._connections.values():
+                writer.close()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+    
+    async def _index(self, headers: Dict, body: bytes) -> tuple:
+        mode = 'webhook' if self.webhook_path else 'polling'
+        return 200, f'Bot Auge Traders está rodando em modo {mode}!'
+    
+    async def _health(self, headers: Dict, body: bytes) -> tuple:
+        return 200, 'OK'
+    
+    async def _metrics(self, headers: Dict, body: bytes) -> tuple:
+        return 200, metrics.render(), None, 'text/plain; version=0.0.4; charset=utf-8'
+    
+    async def _webhook(self, headers: Dict, body: bytes) -> tuple:
+        if self.secret_token and headers.get('x-telegram-bot-api-secret-token') != self.secret_token:
+            return 403, 'Forbidden'
+        if pending_updates(self.application) >= self.max_queue:
+            return 503, 'Busy', {'Retry-After': '1'}
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except ValueError:
+            return 400, 'Invalid JSON'
+        if update is not None:
+            await self.application.update_queue.put(update)
+        return 200, 'OK'
+    
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Atende as requisições de uma conexão (com keep-alive)"""
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self.idle_timeout)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError,
+                        asyncio.TimeoutError):
+                    return
+                
+                request_line, *header_lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = request_line.split(' ', 2)
+                except ValueError:
+                    await self._respond(writer, 400, 'Bad Request', keep_alive=False)
+                    return
+                headers = {}
+                for line in header_lines:
+                    if ':' in line:
+                        name, value = line.split(':', 1)
+                        headers[name.strip().lower()] = value.strip()
+                keep_alive = (version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close')
+                
+                try:
+                    length = int(headers.get('content-length') or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self._respond(writer, 400, 'Invalid Content-Length', keep_alive=False)
+                    return
+                if length > self.MAX_BODY:
+                    await self._respond(writer, 413, 'Payload Too Large', keep_alive=False)
+                    return
+                try:
+                    body = await asyncio.wait_for(reader.readexactly(length), self.idle_timeout) if length else b''
+                except asyncio.TimeoutError:
+                    return
+                
+                path = target.split('?', 1)[0]
+                handler = self.routes.get((method, path))
+                if handler is None:
+                    allowed = any(route_path == path for _, route_path in self.routes)
+                    result = (405, 'Method Not Allowed') if allowed else (404, 'Not Found')
+                else:
+                    try:
+                        result = await handler(headers, body)
+                    except Exception as e:
+                        logger.error(f"Erro ao atender {method} {path}: {e}")
+                        result = (500, 'Internal Server Error')
+                await self._respond(writer, *result, keep_alive=keep_alive)
+                if not keep_alive:
+                    return
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._connections.pop(task, None)
+            writer.close()
+    
+    async def _respond(self, writer: asyncio.StreamWriter, status: int, text: str,
+                       extra_headers: Optional[Dict] = None, content_type: str = 'text/plain; charset=utf-8',
+                       keep_alive: bool = True):
+        body = text.encode('utf-8')
+        lines = [
+            f'HTTP/1.1 {status} {self.REASONS.get(status, "Internal Server Error")}',
+            f'Content-Type: {content_type}',
+            f'Content-Length: {len(body)}',
+            f'Connection: {"keep-alive" if keep_alive else "close"}',
+        ]
+        for name, value in (extra_headers or {}).items():
+            lines.append(f'{name}: {value}')
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+
+# Ciclo de vida da aplicação
+async def post_init(application: Application):
+    """Inicia as tarefas de banco em segundo plano, carrega os grupos e recarrega os envios, os lembretes e os administradores"""
+    await db_manager.start()
+    await group_registry.load()
+    await broadcast_scheduler.start(application.bot)
+    db_manager.backfills.start()
+    db_manager.archiver.start()
+    await meeting_scheduler.start(application.bot)
+    await admin_registry.start(application.bot)
+
+async def post_stop(application: Application):
+    """Para a atualização de administradores e dá as boas-vindas pendentes enquanto o bot ainda está ativo"""
+    await admin_registry.stop()
+    await join_aggregator.stop()
+    for task in list(export_tasks):
+        task.cancel()
+    await asyncio.gather(*export_tasks, return_exceptions=True)
+
+async def post_shutdown(application: Application):
+    """Grava o buffer pendente e libera os recursos do banco ao encerrar a aplicação"""
+    await meeting_scheduler.stop()
+    await broadcast_scheduler.stop()
+    await db_manager.shutdown()
+
+async def startup_profile_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Registra a chegada do primeiro update e escreve o perfil de inicialização no log"""
+    if startup_profile.reported:
         return
+    startup_profile.reported = True
+    startup_profile.mark('first_update')
+    logger.info("Perfil de inicialização:\n" + startup_profile.report())
+
+def pending_updates(application: Application) -> int:
+    """Updates recebidos e ainda não iniciados (update_queue + espera no processador)"""
+    pending = application.update_queue.qsize()
+    if isinstance(application.update_processor, ChatOrderedUpdateProcessor):
+        pending += application.update_processor.pending
+    return pending
+
+async def run_bot(application: Application):
+    """Executa o bot e o servidor HTTP no mesmo event loop até receber SIGINT/SIGTERM"""
+    webhook_path = f"/{BOT_TOKEN}" if WEBHOOK_URL else None
+    web_server = WebServer(application, PORT, webhook_path=webhook_path)
     
-    # Cria a aplicação
-    application = Application.builder().token(BOT_TOKEN).build()
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: Ctrl+C chega como KeyboardInterrupt
+    
+    metrics.gauge('bot_update_queue_depth', lambda: pending_updates(application))
+    if isinstance(application.update_processor, ChatOrderedUpdateProcessor):
+        metrics.gauge('bot_updates_in_flight', lambda: application.update_processor.in_flight)
+    
+    try:
+        # getMe e migrações do banco em paralelo: nenhum dos dois depende do outro
+        await asyncio.gather(
+            startup_profile.timed('initialize', application.initialize()),
+            startup_profile.timed('database', db_manager.start())
+        )
+        if application.post_init:
+            await startup_profile.timed('post_init', application.post_init(application))
+        await startup_profile.timed('web_server', web_server.start())
+        
+        if WEBHOOK_URL:
+            await startup_profile.timed('set_webhook', application.bot.set_webhook(
+                url=f"{WEBHOOK_URL}{webhook_path}",
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=Update.ALL_TYPES
+            ))
+        else:
+            await startup_profile.timed('start_polling', application.updater.start_polling(
+                allowed_updates=Update.ALL_TYPES
+            ))
+        await startup_profile.timed('start', application.start())
+        logger.info(f"Bot pronto para receber updates em {startup_profile.elapsed:.2f}s")
+        
+        await stop_event.wait()
+    finally:
+        await web_server.stop()
+        if application.updater.running:
+            await application.updater.stop()
+        if application.running:
+            await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+# Montagem da aplicação
+def build_application(bot: Optional[ExtBot] = None, concurrency: int = UPDATE_CONCURRENCY) -> Application:
+    """Cria a aplicação com todos os handlers e jobs, cada um instrumentado com métricas.
+    
+    Cria os serviços globais com init_services() se ainda não existirem.
+    """
+    if db_manager is None:
+        init_services()
+    builder = (
+        Application.builder()
+        .bot(bot or InstrumentedBot(token=BOT_TOKEN))
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+    )
+    if PERSISTENCE_UPDATE_SECONDS > 0:
+        builder.persistence(persistence)
+    if concurrency > 1:
+        # Paralelo entre chats, mantendo a ordem dentro de cada chat/usuário
+        builder.concurrent_updates(ChatOrderedUpdateProcessor(concurrency))
+    application = builder.build()
+    
+    # Perfil de inicialização até o primeiro update (STARTUP_PROFILE=1 ou --profile-startup)
+    if STARTUP_PROFILE:
+        application.add_handler(TypeHandler(Update, startup_profile_handler), group=-1)
     
     # Adiciona handlers
-    application.add_handler(CommandHandler("start", start_command))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("stats", stats_command))
-    application.add_handler(CommandHandler("mensagens", mensagens_command))
-    application.add_handler(CommandHandler("morning", morning_command))
-    application.add_handler(CommandHandler("alert", alert_command))
-    application.add_handler(CommandHandler("motivacional", motivacional_command))
-    application.add_handler(CommandHandler("set_meeting", set_meeting_command))
-    application.add_handler(CommandHandler("test_meeting", test_meeting_command))
+    application.add_handler(CommandHandler("start", instrumented("start", start_command)))
+    application.add_handler(CommandHandler("help", instrumented("help", help_command)))
+    application.add_handler(CommandHandler("stats", instrumented("stats", stats_command)))
+    application.add_handler(CommandHandler("mensagens", instrumented("mensagens", mensagens_command)))
+    application.add_handler(CommandHandler("morning", instrumented("morning", morning_command)))
+    application.add_handler(CommandHandler("alert", instrumented("alert", alert_command)))
+    application.add_handler(CommandHandler("motivacional", instrumented("motivacional", motivacional_command)))
+    application.add_handler(CommandHandler("templates", instrumented("templates", templates_command)))
+    application.add_handler(CommandHandler("set_meeting", instrumented("set_meeting", set_meeting_command)))
+    application.add_handler(CommandHandler("test_meeting", instrumented("test_meeting", test_meeting_command)))
+    application.add_handler(CommandHandler("reunioes", instrumented("reunioes", reunioes_command)))
+    application.add_handler(CommandHandler("cancelar_reuniao", instrumented("cancelar_reuniao", cancelar_reuniao_command)))
+    application.add_handler(CommandHandler("buscar", instrumented("buscar", buscar_command)))
+    application.add_handler(CommandHandler("exportar", instrumented("exportar", exportar_command)))
+    application.add_handler(CommandHandler("grupos", instrumented("grupos", grupos_command)))
+    application.add_handler(CommandHandler("programar", instrumented("programar", programar_command)))
+    application.add_handler(CommandHandler("programacoes", instrumented("programacoes", programacoes_command)))
+    application.add_handler(CommandHandler("cancelar_programacao",
+                                           instrumented("cancelar_programacao", cancelar_programacao_command)))
     
     # Handler para callbacks dos botões inline
-    application.add_handler(CallbackQueryHandler(button_callback))
+    application.add_handler(CallbackQueryHandler(instrumented("button_callback", callback_router.dispatch)))
     
-    # Configura job diário para mensagem matinal (8:00 AM)
+    # Recarrega os templates quando o arquivo muda (a mensagem matinal é um envio programado)
     job_queue = application.job_queue
-    job_queue.run_daily(
-        daily_morning_job,
-        time=time(8, 0, 0, tzinfo=TIMEZONE),
-        name="daily_morning_message"
+    job_queue.run_repeating(
+        instrumented("template_reload_job", template_reload_job),
+        interval=TEMPLATES_RELOAD_SECONDS,
+        first=TEMPLATES_RELOAD_SECONDS,
+        name="template_reload"
     )
     
     # Handler para novos membros
-    application.add_handler(MessageHandler(filters.StatusUpdate.NEW_CHAT_MEMBERS, new_member_handler))
+    application.add_handler(MessageHandler(
+        filters.StatusUpdate.NEW_CHAT_MEMBERS, instrumented("new_member_handler", new_member_handler)
+    ))
+    
+    # Mudanças de administradores nos grupos
+    application.add_handler(ChatMemberHandler(
+        instrumented("chat_member_handler", chat_member_handler), ChatMemberHandler.CHAT_MEMBER
+    ))
     
     # Handler para mensagens gerais
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, message_handler))
+    application.add_handler(MessageHandler(
+        filters.TEXT & ~filters.COMMAND, instrumented("message_handler", message_handler)
+    ))
+    
+    return application
+
+# Função principal
+def main():
+    """Função principal do bot"""
+    # Configuração de logging
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    if '--compact-db' in sys.argv:
+        # Operação única e offline: ativa o auto_vacuum incremental em um banco existente
+        DatabaseManager.compact(DATABASE_PATH)
+        return
+    if not BOT_TOKEN:
+        logger.error("BOT_TOKEN não encontrado nas variáveis de ambiente")
+        return
+    startup_profile.mark('module')
+    
+    # Cria a aplicação
+    application = build_application()
+    startup_profile.mark('build_application')
     
     # Configuração para Railway (webhook) ou desenvolvimento (polling)
     if WEBHOOK_URL:
-        # Modo webhook para produção
-        @app.route(f'/{BOT_TOKEN}', methods=['POST'])
-        def webhook():
-            update = Update.de_json(request.get_json(), application.bot)
-            application.update_queue.put_nowait(update)
-            return 'OK'
-        
-        @app.route('/')
-        def index():
-            return 'Bot Auge Traders está rodando!'
-        
-        @app.route('/health')
-        def health():
-            return 'OK'
-        
-        # Configura webhook
-        application.run_webhook(
-            listen="0.0.0.0",
-            port=PORT,
-            url_path=BOT_TOKEN,
-            webhook_url=f"{WEBHOOK_URL}/{BOT_TOKEN}"
-        )
+        logger.info("Iniciando bot em modo webhook...")
     else:
-        # Modo polling para desenvolvimento - Railway também pode usar polling
         logger.info("Iniciando bot em modo polling...")
-        
-        # Adiciona endpoint básico para Railway
-        @app.route('/')
-        def index():
-            return 'Bot Auge Traders está rodando em modo polling!'
-        
-        @app.route('/health')
-        def health():
-            return 'OK'
-        
-        # Inicia Flask em thread separada para Railway
-        import threading
-        def run_flask():
-            app.run(host="0.0.0.0", port=PORT)
-        
-        flask_thread = threading.Thread(target=run_flask)
-        flask_thread.daemon = True
-        flask_thread.start()
-        
-        # Inicia polling
-        application.run_polling()
+    
+    try:
+        asyncio.run(run_bot(application))
+    except KeyboardInterrupt:
+        pass
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exportação de usuários e mensagens do Bot Auge Traders
+
+Lê o banco em streaming (fetchmany, conexão somente leitura) e grava partes
+.gz independentes, sem carregar as tabelas em memória. Aceita os mesmos
+argumentos do comando /exportar:
+
+    python export.py mensagens
+    python export.py mensagens jsonl chat:principal de:01/01/2024 ate:31/01/2024
+    python export.py usuarios csv --output-dir exports --part-mb 45
+
+Pode rodar com o bot ligado: o banco está em modo WAL e a exportação lê um
+snapshot consistente sem bloquear as escritas.
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from contextlib import closing
+
+import bot
+
+def main():
+    parser = argparse.ArgumentParser(description='Exporta usuários ou mensagens em partes CSV/JSONL compactadas')
+    parser.add_argument('args', nargs='+', metavar='arg',
+                        help='usuarios|mensagens [csv|jsonl] [chat:...] [de:DD/MM/AAAA] [ate:DD/MM/AAAA]')
+    parser.add_argument('--db', default=bot.DATABASE_PATH, help='banco SQLite do bot')
+    parser.add_argument('--output-dir', default='exports', help='diretório das partes geradas')
+    parser.add_argument('--part-mb', type=float, default=None, help='tamanho máximo de cada parte (MB)')
+    parser.add_argument('--fetch-size', type=int, default=None, help='linhas lidas por fetchmany')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        parser.error(f"banco não encontrado: {args.db}")
+
+    # Apelidos de grupos (chat:principal) vêm do cadastro de grupos do banco; só leitura, sem os serviços do bot
+    groups = bot.GroupRegistry(None)
+    with closing(sqlite3.connect(f'file:{args.db}?mode=ro', uri=True)) as conn:
+        try:
+            groups.replace(bot.DatabaseManager.read_groups(conn))
+        except sqlite3.OperationalError:
+            pass  # banco anterior ao cadastro de grupos: apenas IDs numéricos
+    spec = bot.parse_export_args(args.args, groups)
+    if spec is None:
+        parser.error("argumentos inválidos (veja o uso do /exportar)")
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    exporter = bot.TableExporter(
+        args.db,
+        fetch_size=args.fetch_size or bot.EXPORT_FETCH_SIZE,
+        part_mb=args.part_mb or bot.EXPORT_PART_MB
+    )
+
+    def on_part(path: str, number: int, rows: int):
+        print(f"  parte {number}: {path} ({os.path.getsize(path) / 1024 / 1024:.1f} MB, {rows:,} linhas)", flush=True)
+
+    start = time.perf_counter()
+    total = exporter.write_parts(
+        spec['table'], spec['format'], args.output_dir, on_part=on_part,
+        chat_id=spec['chat_id'], start=spec['start'], end=spec['end']
+    )
+    print(f"{total:,} linhas de {spec['table']} exportadas em {time.perf_counter() - start:.1f}s")
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,19 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# As configurações do bot vêm do ambiente na importação: banco e token de teste, nunca o bot_data.db real
+os.environ.setdefault('BOT_TOKEN', '123456:TESTE')
+os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='bot-tests-'), 'test.db')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def services(tmp_path):
+    """Serviços globais do bot sobre um banco temporário, fechados ao fim do teste"""
+    import bot
+    db = bot.init_services(str(tmp_path / 'bot.db'))
+    yield bot
+    db.close()
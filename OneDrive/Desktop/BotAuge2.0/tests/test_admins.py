@@ -0,0 +1,164 @@
+"""Testes do AdminRegistry com get_chat_administrators falso"""
+
+import asyncio
+import inspect
+from types import SimpleNamespace
+
+from telegram import ChatMember
+from telegram.error import NetworkError
+
+import bot
+
+GROUP = -100100
+OTHER_GROUP = -100200
+
+
+def member(user_id, is_bot=False):
+    return SimpleNamespace(user=SimpleNamespace(id=user_id, is_bot=is_bot))
+
+
+class StubBot:
+    """Bot falso: devolve a lista de administradores configurada para cada chat"""
+
+    def __init__(self, admins):
+        self.admins = admins
+        self.calls = []
+        self.fail = False
+        self.gate = None  # asyncio.Event que segura a resposta, se definido
+
+    async def get_chat_administrators(self, chat_id):
+        self.calls.append(chat_id)
+        if self.gate is not None:
+            await self.gate.wait()
+        if self.fail:
+            raise NetworkError('falha simulada')
+        return [member(user_id, is_bot) for user_id, is_bot in self.admins.get(chat_id, [])]
+
+
+def registry(stub, chat_ids=(GROUP,), static_ids=(1,), ttl=600):
+    admins = bot.AdminRegistry(chat_ids, static_ids=static_ids, ttl=ttl)
+    admins.bot = stub
+    return admins
+
+
+def test_refresh_loads_admins_and_skips_bots():
+    stub = StubBot({GROUP: [(10, False), (11, False), (99, True)]})
+    admins = registry(stub)
+
+    assert asyncio.run(admins.refresh(GROUP))
+    assert admins.is_admin(10) and admins.is_admin(11)
+    assert not admins.is_admin(99)
+    assert admins.is_admin(1)  # ADMIN_IDS sempre valem
+    assert not admins.is_admin(12)
+
+
+def test_refresh_error_keeps_previous_list():
+    stub = StubBot({GROUP: [(10, False)]})
+    admins = registry(stub)
+    asyncio.run(admins.refresh(GROUP))
+
+    stub.fail = True
+    assert not asyncio.run(admins.refresh(GROUP))
+    assert admins.is_admin(10)
+
+
+def test_refresh_of_untracked_chat_is_ignored():
+    stub = StubBot({OTHER_GROUP: [(10, False)]})
+    admins = registry(stub)
+
+    assert not asyncio.run(admins.refresh(OTHER_GROUP))
+    assert not admins.is_admin(10)
+
+
+def test_list_is_reloaded_after_ttl():
+    stub = StubBot({GROUP: [(10, False)]})
+    admins = registry(stub, ttl=1)
+
+    async def run():
+        await admins.start(stub)
+        await asyncio.sleep(0.2)
+        assert stub.calls == [GROUP] and admins.is_admin(10)
+        stub.admins[GROUP] = [(20, False)]
+        await asyncio.sleep(1.1)
+        await admins.stop()
+
+    asyncio.run(run())
+    assert stub.calls == [GROUP, GROUP]
+    assert admins.is_admin(20) and not admins.is_admin(10)
+
+
+def test_invalidate_triggers_an_early_reload():
+    stub = StubBot({GROUP: [(10, False)]})
+    admins = registry(stub, ttl=600)
+
+    async def run():
+        await admins.start(stub)
+        await asyncio.sleep(0.1)
+        stub.admins[GROUP] = [(20, False)]
+        admins.invalidate(GROUP)
+        await asyncio.sleep(0.1)
+        await admins.stop()
+
+    asyncio.run(run())
+    assert stub.calls == [GROUP, GROUP]
+    assert admins.is_admin(20)
+
+
+def test_member_update_promote_and_demote():
+    stub = StubBot({GROUP: [(10, False)]})
+    admins = registry(stub)
+    asyncio.run(admins.refresh(GROUP))
+
+    admins.apply_member_update(GROUP, 30, ChatMember.ADMINISTRATOR)
+    assert admins.is_admin(30)
+    admins.apply_member_update(GROUP, 10, ChatMember.MEMBER)
+    assert not admins.is_admin(10)
+    admins.apply_member_update(GROUP, 30, ChatMember.LEFT)
+    assert not admins.is_admin(30)
+    # A mudança também antecipa a próxima atualização do grupo
+    assert admins._expires[GROUP] == 0.0
+
+
+def test_member_update_ignores_bots_like_refresh():
+    admins = registry(StubBot({}))
+
+    admins.apply_member_update(GROUP, 40, ChatMember.ADMINISTRATOR, is_bot=True)
+    assert not admins.is_admin(40)
+
+
+def test_member_update_of_untracked_chat_is_ignored():
+    admins = registry(StubBot({}))
+
+    admins.apply_member_update(OTHER_GROUP, 50, ChatMember.OWNER)
+    assert not admins.is_admin(50)
+
+
+def test_is_admin_never_awaits_the_api():
+    stub = StubBot({GROUP: [(10, False)]})
+    admins = registry(stub)
+    assert not inspect.iscoroutinefunction(admins.is_admin)
+
+    async def run():
+        await admins.refresh(GROUP)
+        calls = len(stub.calls)
+        # Com uma atualização presa na API, a consulta responde na hora com a lista atual
+        stub.gate = asyncio.Event()
+        pending = asyncio.create_task(admins.refresh(GROUP))
+        await asyncio.sleep(0)
+        assert admins.is_admin(10) and not admins.is_admin(11)
+        assert len(stub.calls) == calls + 1
+        stub.gate.set()
+        await pending
+
+    asyncio.run(run())
+
+
+def test_track_chats_drops_removed_groups():
+    stub = StubBot({GROUP: [(10, False)], OTHER_GROUP: [(20, False)]})
+    admins = registry(stub, chat_ids=(GROUP, OTHER_GROUP))
+    asyncio.run(admins.refresh(GROUP))
+    asyncio.run(admins.refresh(OTHER_GROUP))
+
+    admins.track_chats([GROUP])
+    assert admins.is_admin(10) and not admins.is_admin(20)
+    assert admins.chat_ids == [GROUP]
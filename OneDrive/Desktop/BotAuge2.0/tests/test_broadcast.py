@@ -0,0 +1,153 @@
+"""Testes do BroadcastEngine contra um Bot falso (sem rede)"""
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+from telegram.error import BadRequest, Forbidden, RetryAfter, TimedOut
+
+import bot
+
+
+class StubBot:
+    """Bot falso: cada chat tem uma fila de erros a lançar antes de aceitar o envio"""
+
+    def __init__(self, failures=None):
+        self.failures = {chat_id: list(errors) for chat_id, errors in (failures or {}).items()}
+        self.calls = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.calls.append((chat_id, time.monotonic()))
+        errors = self.failures.get(chat_id)
+        if errors:
+            raise errors.pop(0)
+        return SimpleNamespace(message_id=len(self.calls))
+
+
+def engine(**kwargs):
+    options = dict(global_rate=1000, chat_rate=1000, group_per_minute=60000, max_retries=3, base_delay=0.05)
+    options.update(kwargs)
+    return bot.BroadcastEngine(**options)
+
+
+def send(engine, stub, chat_ids, text='oi'):
+    async def run():
+        start = time.monotonic()
+        results = await engine.send(stub, chat_ids, text)
+        return results, time.monotonic() - start
+    return asyncio.run(run())
+
+
+def test_reports_one_result_per_chat():
+    stub = StubBot({2: [BadRequest('Chat not found')], 3: [Forbidden('bot was blocked by the user')]})
+    results, _ = send(engine(), stub, [1, 2, 3])
+
+    assert [r['chat_id'] for r in results] == [1, 2, 3]
+    assert results[0]['ok'] and results[0]['message_id'] is not None and results[0]['attempts'] == 1
+    assert not results[1]['ok'] and 'Chat not found' in results[1]['error']
+    assert not results[2]['ok'] and 'blocked' in results[2]['error']
+
+
+def test_permanent_errors_are_not_retried():
+    stub = StubBot({1: [BadRequest("Can't parse entities")], 2: [Forbidden('Forbidden')]})
+    results, _ = send(engine(), stub, [1, 2])
+
+    assert [r['attempts'] for r in results] == [1, 1]
+    assert len(stub.calls) == 2
+
+
+def test_timed_out_is_retried_with_exponential_backoff():
+    stub = StubBot({1: [TimedOut(), TimedOut()]})
+    results, elapsed = send(engine(base_delay=0.05), stub, [1])
+
+    assert results[0]['ok'] and results[0]['attempts'] == 3
+    # 0.05 + 0.10 de backoff, mais até base_delay de jitter em cada tentativa
+    assert 0.15 <= elapsed < 0.5
+    first, second, third = (at for _, at in stub.calls)
+    assert second - first >= 0.05
+    assert third - second >= 0.10
+
+
+def test_gives_up_after_max_retries():
+    stub = StubBot({1: [TimedOut()] * 10})
+    results, _ = send(engine(max_retries=2, base_delay=0.01), stub, [1])
+
+    assert not results[0]['ok']
+    assert results[0]['attempts'] == 3
+    assert len(stub.calls) == 3
+    assert 'Timed out' in results[0]['error']
+
+
+def test_retry_after_waits_the_requested_time():
+    stub = StubBot({1: [RetryAfter(0.2)]})
+    results, elapsed = send(engine(), stub, [1])
+
+    assert results[0]['ok'] and results[0]['attempts'] == 2
+    assert stub.calls[1][1] - stub.calls[0][1] >= 0.2
+    assert elapsed < 1
+
+
+def test_retry_after_on_one_chat_does_not_delay_the_others():
+    stub = StubBot({1: [RetryAfter(0.3)]})
+    results, _ = send(engine(), stub, [1, 2, 3])
+
+    assert all(r['ok'] for r in results)
+    other_sends = [at for chat_id, at in stub.calls if chat_id != 1]
+    assert max(other_sends) - stub.calls[0][1] < 0.1
+
+
+def test_global_rate_limit():
+    # 20 tokens acumulados e 20/s: os 10 envios além da rajada levam ~0.5s
+    results, elapsed = send(engine(global_rate=20), StubBot(), list(range(1, 31)))
+
+    assert all(r['ok'] for r in results)
+    assert elapsed >= 0.45
+
+
+def test_per_chat_rate_limit():
+    eng, stub = engine(chat_rate=10), StubBot()
+
+    async def run():
+        start = time.monotonic()
+        results = await asyncio.gather(*(eng.send(stub, [7], f'msg {i}') for i in range(4)))
+        return results, time.monotonic() - start
+    results, elapsed = asyncio.run(run())
+
+    # Capacidade 1 a 10 msg/s: o 4º envio sai ~0.3s depois do primeiro
+    assert all(r[0]['ok'] for r in results)
+    assert elapsed >= 0.28
+
+
+def test_groups_have_a_per_minute_bucket():
+    eng = engine(group_per_minute=20)
+
+    assert len(eng._buckets_for(12345)) == 1
+    buckets = eng._buckets_for(-100123)
+    assert len(buckets) == 2
+    assert buckets[1].capacity == 20 and abs(buckets[1].rate - 20 / 60) < 1e-9
+    assert eng._buckets_for(-100123) is buckets
+
+
+def test_token_bucket_limits_bursts_to_capacity():
+    bucket = bot.TokenBucket(rate=20, capacity=2)
+
+    async def run():
+        start = time.monotonic()
+        for _ in range(4):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    # 2 tokens imediatos, os outros 2 a 20/s
+    assert asyncio.run(run()) >= 0.095
+
+
+def test_token_bucket_penalize_blocks_until_the_delay_passes():
+    bucket = bot.TokenBucket(rate=10, capacity=5)
+
+    async def run():
+        bucket.penalize(0.2)
+        start = time.monotonic()
+        await bucket.acquire()
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) >= 0.19
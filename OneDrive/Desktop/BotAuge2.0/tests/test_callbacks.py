@@ -0,0 +1,134 @@
+"""Testes do CallbackRouter: codificação, limite de 64 bytes e payloads inválidos"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import bot
+
+
+async def handler(update, context, *args):
+    handler.calls.append(args)
+
+
+def router():
+    handler.calls = []
+    routes = bot.CallbackRouter()
+    routes.route('x')(handler)
+    routes.route('y', types=(str, int))(handler)
+    routes.route('open', types=(int,), admin_only=False)(handler)
+    return routes
+
+
+def test_round_trip():
+    routes = router()
+
+    assert routes.encode('x') == 'x1'
+    data = routes.encode('y', 'principal', -100123)
+    assert data == 'y1:principal:-100123'
+    assert routes.decode(data) == (handler, True, ('principal', -100123))
+    assert routes.decode(routes.encode('open', 7)) == (handler, False, (7,))
+
+
+def test_new_version_replaces_the_old_buttons():
+    routes = router()
+    routes.route('y', version=2, types=(int,))(handler)
+
+    assert routes.encode('y', 5) == 'y2:5'
+    # Botões da versão 1 continuam decodificando pela rota antiga enquanto ela existir
+    assert routes.decode('y1:a:1') == (handler, True, ('a', 1))
+
+
+def test_encode_enforces_the_64_byte_limit():
+    routes = router()
+
+    assert len(routes.encode('y', 'a' * 59, 1).encode()) == 64
+    with pytest.raises(ValueError):
+        routes.encode('y', 'a' * 60, 1)
+    # Bytes, não caracteres: 'ç' ocupa 2
+    with pytest.raises(ValueError):
+        routes.encode('y', 'ç' * 30, 1)
+
+
+def test_encode_rejects_bad_arguments():
+    routes = router()
+
+    with pytest.raises(ValueError):
+        routes.encode('y', 'a:b', 1)  # separador dentro do argumento
+    with pytest.raises(ValueError):
+        routes.encode('y', 'a')  # faltando argumento
+    with pytest.raises(KeyError):
+        routes.encode('z')
+
+
+def test_route_registration_errors():
+    routes = router()
+
+    with pytest.raises(ValueError):
+        routes.route('x')(handler)  # duplicada
+    with pytest.raises(ValueError):
+        routes.route('a1')
+    with pytest.raises(ValueError):
+        routes.route('a:b')
+
+
+@pytest.mark.parametrize('data', [
+    None, '', 'z1', 'x2', 'x', 'x1:extra', 'y1:a', 'y1:a:b', 'y1:a:1:2', 'open1:', 'open1:1.5',
+    'm_principal', 'principal_morning',  # formato anterior ao roteador
+])
+def test_unknown_or_malformed_payloads(data):
+    assert router().decode(data) is None
+
+
+def test_real_routes_fit_with_large_ids():
+    routes = bot.callback_router
+    for prefix, args in (('m', ()), ('g', ('motivacional',)), ('s', ('motivacional', 'todos')),
+                         ('p', (2 ** 40, 2 ** 62)), ('b', (2 ** 62, 10 ** 6))):
+        data = routes.encode(prefix, *args)
+        assert len(data.encode()) <= 64
+        assert routes.decode(data)[2] == args
+
+
+class Query:
+    def __init__(self, data, user_id):
+        self.data = data
+        self.from_user = SimpleNamespace(id=user_id)
+        self.answered = False
+        self.edits = []
+
+    async def answer(self):
+        self.answered = True
+
+    async def edit_message_text(self, text, **kwargs):
+        self.edits.append(text)
+
+
+def dispatch(routes, data, user_id=5):
+    query = Query(data, user_id)
+    asyncio.run(routes.dispatch(SimpleNamespace(callback_query=query), None))
+    return query
+
+
+def test_dispatch_calls_the_handler(services):
+    routes = router()
+    query = dispatch(routes, 'open1:42')
+
+    assert query.answered and query.edits == []
+    assert handler.calls == [(42,)]
+
+
+def test_dispatch_answers_expired_menus(services):
+    routes = router()
+    query = dispatch(routes, 'm_principal')
+
+    assert query.answered and 'expirou' in query.edits[0]
+    assert handler.calls == []
+
+
+def test_dispatch_checks_admin_routes(services):
+    routes = router()
+    query = dispatch(routes, 'x1', user_id=5)
+
+    assert query.edits == [bot.MessagesManager.get_error_message('permission')]
+    assert handler.calls == []
@@ -0,0 +1,166 @@
+"""Testes do TableExporter: divisão em partes, filtros e cancelamento"""
+
+import asyncio
+import csv
+import gzip
+import json
+import os
+import random
+import sqlite3
+import string
+import threading
+
+import pytest
+
+import bot
+
+COLUMNS = bot.TableExporter.TABLES['mensagens'][1]
+
+
+def database(tmp_path, count=3000):
+    """Banco com mensagens de texto aleatório (pouco compressível, para as partes crescerem)"""
+    path = str(tmp_path / 'bot.db')
+    conn = sqlite3.connect(path)
+    bot.migrate_database(conn)
+    rng = random.Random(7)
+    conn.executemany(
+        'INSERT INTO messages (user_id, chat_id, message_text, message_type, timestamp) VALUES (?, ?, ?, ?, ?)',
+        [(i % 50, -100 if i % 3 else -200, ''.join(rng.choices(string.ascii_letters + 'çã, "\n', k=120)),
+          'user', f'2024-01-{1 + i * 30 // count:02d} 12:00:00') for i in range(count)]
+    )
+    conn.commit()
+    expected = conn.execute(
+        'SELECT id, user_id, chat_id, message_text, message_type, timestamp FROM messages ORDER BY id').fetchall()
+    conn.close()
+    return path, expected
+
+
+def exporter(path, part_kb=128, margin_kb=32, fetch_size=7):
+    """Exportador com partes pequenas (o mínimo real é de alguns MB)"""
+    exp = bot.TableExporter(path, fetch_size=fetch_size)
+    exp.PART_MARGIN = margin_kb * 1024
+    exp.part_bytes = part_kb * 1024
+    return exp
+
+
+def read_csv(path):
+    with gzip.open(path, 'rt', encoding='utf-8', newline='') as f:
+        rows = list(csv.reader(f))
+    assert tuple(rows[0]) == COLUMNS
+    return [(int(r[0]), int(r[1]), int(r[2]), r[3], r[4], r[5]) for r in rows[1:]]
+
+
+def test_large_export_is_split_into_independent_parts(tmp_path):
+    path, expected = database(tmp_path)
+    exp = exporter(path)
+    parts = []
+
+    count = exp.write_parts('mensagens', 'csv', str(tmp_path), on_part=lambda *part: parts.append(part))
+
+    assert count == len(expected)
+    assert len(parts) > 2
+    assert [number for _, number, _ in parts] == list(range(1, len(parts) + 1))
+    assert parts[-1][2] == count
+    rows = []
+    for part_path, _, total in parts:
+        assert os.path.getsize(part_path) < exp.part_bytes
+        rows.extend(read_csv(part_path))  # cada parte abre sozinha, com cabeçalho
+        assert len(rows) == total
+    assert rows == expected
+
+
+def test_small_export_is_a_single_jsonl_part(tmp_path):
+    path, expected = database(tmp_path, count=20)
+    parts = []
+
+    count = exporter(path).write_parts('mensagens', 'jsonl', str(tmp_path),
+                                       on_part=lambda *part: parts.append(part))
+
+    assert count == 20
+    [(part_path, number, total)] = parts
+    assert (number, total) == (1, 20)
+    assert part_path.endswith('_parte001.jsonl.gz')
+    with gzip.open(part_path, 'rt', encoding='utf-8') as f:
+        lines = [json.loads(line) for line in f]
+    assert [tuple(line[column] for column in COLUMNS) for line in lines] == expected
+
+
+def test_filters_and_empty_results(tmp_path):
+    path, expected = database(tmp_path, count=300)
+    exp = exporter(path)
+    parts = []
+
+    count = exp.write_parts('mensagens', 'csv', str(tmp_path), on_part=lambda *part: parts.append(part),
+                            chat_id=-200, start='2024-01-05', end='2024-01-10')
+    wanted = [row for row in expected if row[2] == -200 and '2024-01-05' <= row[5] < '2024-01-10']
+    assert count == len(wanted) > 0
+    assert read_csv(parts[0][0]) == wanted
+
+    # Sem linhas, nenhuma parte é criada
+    parts.clear()
+    assert exp.write_parts('mensagens', 'csv', str(tmp_path / 'vazio'), on_part=lambda *part: parts.append(part),
+                           chat_id=-300) == 0
+    assert parts == []
+
+
+def test_stop_discards_the_incomplete_part(tmp_path):
+    path, _ = database(tmp_path)
+    out_dir = tmp_path / 'out'
+    out_dir.mkdir()
+    stop = threading.Event()
+
+    def on_part(part_path, number, rows):
+        stop.set()  # cancela logo depois da primeira parte
+
+    with pytest.raises(bot.ExportCancelled):
+        exporter(path).write_parts('mensagens', 'csv', str(out_dir), on_part=on_part, stop=stop)
+    # Só a parte concluída continua no disco
+    assert len(os.listdir(out_dir)) == 1
+
+
+def test_iter_parts_limits_and_removes_files(tmp_path):
+    path, expected = database(tmp_path)
+    out_dir = tmp_path / 'out'
+    out_dir.mkdir()
+    exp = exporter(path)
+
+    async def run():
+        seen, on_disk, rows = [], [], []
+        async for part_path, number, total in exp.iter_parts('mensagens', 'csv', str(out_dir)):
+            rows.extend(read_csv(part_path))
+            await asyncio.sleep(0.05)  # consumidor lento: a thread precisa esperar
+            on_disk.append(len(os.listdir(out_dir)))
+            seen.append((number, total))
+        return seen, on_disk, rows
+
+    seen, on_disk, rows = asyncio.run(run())
+    assert len(seen) > 2 and seen[-1][1] == len(expected)
+    assert rows == expected
+    # No máximo as partes prontas e a que está sendo gravada
+    assert max(on_disk) <= exp.MAX_READY_PARTS + 1
+    assert os.listdir(out_dir) == []
+
+
+def test_iter_parts_cleans_up_when_the_consumer_stops(tmp_path):
+    path, _ = database(tmp_path)
+    out_dir = tmp_path / 'out'
+    out_dir.mkdir()
+
+    async def run():
+        parts = exporter(path).iter_parts('mensagens', 'csv', str(out_dir))
+        async for _ in parts:
+            break
+        await parts.aclose()
+        # A thread percebe a parada na próxima espera por vaga e apaga o que sobrou
+        for _ in range(60):
+            if not os.listdir(out_dir):
+                break
+            await asyncio.sleep(0.05)
+
+    asyncio.run(run())
+    assert os.listdir(out_dir) == []
+
+
+def test_minimum_part_size():
+    exp = bot.TableExporter(':memory:', part_mb=0.1)
+    assert exp.part_bytes == 2 * exp.PART_MARGIN
@@ -0,0 +1,110 @@
+"""Testes das janelas deslizantes do anti-flood"""
+
+import bot
+
+
+def test_exactly_limit_hits_fit_in_the_window():
+    limiter = bot.SlidingWindowLimiter(limit=3, window=10, max_keys=100)
+
+    assert [limiter.hit('u', t) for t in (0, 1, 2)] == [True, True, True]
+    assert not limiter.hit('u', 9.9)
+
+
+def test_hit_is_allowed_once_the_oldest_leaves_the_window():
+    limiter = bot.SlidingWindowLimiter(limit=3, window=10, max_keys=100)
+    for t in (0, 1, 2):
+        limiter.hit('u', t)
+
+    # O evento de t=0 sai da janela exatamente em t=10
+    assert limiter.hit('u', 10)
+    assert limiter.hit('u', 11)
+    assert limiter.hit('u', 12)
+    assert not limiter.hit('u', 12.5)
+
+
+def test_refused_hits_keep_the_key_blocked():
+    limiter = bot.SlidingWindowLimiter(limit=2, window=10, max_keys=100)
+    limiter.hit('u', 0)
+    limiter.hit('u', 1)
+
+    # Quem insiste a cada 4s nunca deixa de ter 2 eventos nos últimos 10s
+    assert [limiter.hit('u', t) for t in (5, 9, 13, 17)] == [False, False, False, False]
+    # Volta a passar só quando o penúltimo evento (mesmo recusado) sai da janela
+    assert not limiter.hit('u', 22.9)
+    assert limiter.hit('u', 27)
+
+
+def test_keys_are_independent():
+    limiter = bot.SlidingWindowLimiter(limit=1, window=10, max_keys=100)
+
+    assert limiter.hit('a', 0)
+    assert not limiter.hit('a', 1)
+    assert limiter.hit('b', 1)
+    assert limiter.hit('c', 2)
+
+
+def test_limit_of_one():
+    limiter = bot.SlidingWindowLimiter(limit=1, window=5, max_keys=100)
+
+    assert limiter.hit('u', 0)
+    assert not limiter.hit('u', 4.99)
+    assert limiter.hit('u', 9.99)
+
+
+def test_idle_keys_are_evicted_and_memory_is_bounded():
+    limiter = bot.SlidingWindowLimiter(limit=2, window=10, max_keys=5)
+    for key in range(20):
+        limiter.hit(key, 0)
+    assert len(limiter) == 5
+
+    # Chaves ociosas há mais de uma janela saem aos poucos a cada evento
+    for t in range(3):
+        limiter.hit('new', 20 + t)
+    assert len(limiter) == 1
+
+
+def guard(monkeypatch, **kwargs):
+    clock = [1000.0]
+    monkeypatch.setattr(bot.time_module, 'monotonic', lambda: clock[0])
+    options = dict(user_limit=3, user_window=10, chat_limit=5, chat_window=10, mute_seconds=60, max_keys=100)
+    options.update(kwargs)
+    return bot.FloodGuard(**options), clock
+
+
+def test_flood_guard_limits_each_user_per_chat(monkeypatch):
+    flood, _ = guard(monkeypatch, chat_limit=0)
+
+    assert [flood.check(-1, 10) for _ in range(3)] == [None, None, None]
+    assert flood.check(-1, 10) == 'user'
+    # Outro usuário no mesmo chat e o mesmo usuário em outro chat não são afetados
+    assert flood.check(-1, 11) is None
+    assert flood.check(-2, 10) is None
+
+
+def test_flood_guard_chat_limit_and_exemption(monkeypatch):
+    flood, clock = guard(monkeypatch)
+
+    assert [flood.check(-1, user) for user in range(5)] == [None] * 5
+    assert flood.check(-1, 99) == 'chat'
+    # Administradores (exempt) não contam no limite por usuário, mas contam no do chat
+    assert flood.check(-2, 1, exempt=True) is None
+    clock[0] += 10
+    assert [flood.check(-1, 1, exempt=True) for _ in range(5)] == [None] * 5
+    assert flood.check(-1, 1, exempt=True) == 'chat'
+
+
+def test_disabled_limits_let_everything_through(monkeypatch):
+    flood, _ = guard(monkeypatch, user_limit=0, chat_limit=0)
+
+    assert all(flood.check(-1, 10) is None for _ in range(100))
+    assert flood.tracked == 0
+
+
+def test_mute_is_claimed_once_per_period(monkeypatch):
+    flood, clock = guard(monkeypatch)
+
+    assert flood.claim_mute(-1, 10)
+    assert not flood.claim_mute(-1, 10)
+    assert flood.claim_mute(-1, 11)
+    clock[0] += 61
+    assert flood.claim_mute(-1, 10)
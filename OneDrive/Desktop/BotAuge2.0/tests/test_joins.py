@@ -0,0 +1,147 @@
+"""Testes do JoinAggregator: janela de agrupamento das entradas por chat"""
+
+import asyncio
+import logging
+import time
+
+import pytest
+
+import bot
+
+
+@pytest.fixture
+def welcomed(monkeypatch):
+    """Substitui welcome_members e registra (instante, chat, ids) de cada chamada"""
+    calls = []
+
+    async def fake(telegram_bot, chat_id, members):
+        calls.append((time.monotonic(), chat_id, [member[0] for member in members]))
+
+    monkeypatch.setattr(bot, 'welcome_members', fake)
+    return calls
+
+
+def member(user_id, username=None):
+    return (user_id, username or f'user{user_id}', f'Nome {user_id}', None)
+
+
+def test_joins_in_the_window_get_one_welcome(welcomed):
+    joins = bot.JoinAggregator(window_seconds=0.1, flush_size=50)
+
+    async def run():
+        start = time.monotonic()
+        await joins.add(None, -100, [member(1)])
+        await asyncio.sleep(0.03)
+        await joins.add(None, -100, [member(2), member(3)])
+        pending = joins.pending
+        await asyncio.sleep(0.2)
+        return start, pending
+
+    start, pending = asyncio.run(run())
+    assert pending == 3
+    [(at, chat_id, ids)] = welcomed
+    assert chat_id == -100 and ids == [1, 2, 3]
+    # A janela conta a partir da primeira entrada, não da última
+    assert 0.09 <= at - start < 0.18
+    assert joins.pending == 0
+
+
+def test_each_chat_has_its_own_window(welcomed):
+    joins = bot.JoinAggregator(window_seconds=0.05, flush_size=50)
+
+    async def run():
+        await joins.add(None, -100, [member(1)])
+        await joins.add(None, -200, [member(2)])
+        await joins.add(None, -100, [member(3)])
+        await asyncio.sleep(0.15)
+
+    asyncio.run(run())
+    assert sorted((chat_id, ids) for _, chat_id, ids in welcomed) == [(-200, [2]), (-100, [1, 3])]
+
+
+def test_full_batch_is_flushed_before_the_window_ends(welcomed):
+    joins = bot.JoinAggregator(window_seconds=10, flush_size=3)
+
+    async def run():
+        await joins.add(None, -100, [member(1), member(2)])
+        await joins.add(None, -100, [member(3), member(4)])
+        await asyncio.sleep(0.02)
+        # O lote cheio cancelou a janela: nada fica esperando os 10 s
+        return dict(joins._timers)
+
+    assert asyncio.run(run()) == {}
+    assert [ids for _, _, ids in welcomed] == [[1, 2, 3, 4]]
+
+
+def test_repeated_member_is_welcomed_once(welcomed):
+    joins = bot.JoinAggregator(window_seconds=0.05, flush_size=50)
+
+    async def run():
+        await joins.add(None, -100, [member(1, 'antigo')])
+        await joins.add(None, -100, [member(1, 'novo'), member(2)])
+        await asyncio.sleep(0.12)
+
+    asyncio.run(run())
+    assert [ids for _, _, ids in welcomed] == [[1, 2]]
+
+
+def test_new_joins_after_a_flush_open_a_new_window(welcomed):
+    joins = bot.JoinAggregator(window_seconds=0.05, flush_size=50)
+
+    async def run():
+        await joins.add(None, -100, [member(1)])
+        await asyncio.sleep(0.1)
+        await joins.add(None, -100, [member(2)])
+        await asyncio.sleep(0.1)
+
+    asyncio.run(run())
+    assert [ids for _, _, ids in welcomed] == [[1], [2]]
+
+
+def test_zero_window_flushes_immediately(welcomed):
+    joins = bot.JoinAggregator(window_seconds=0, flush_size=50)
+
+    async def run():
+        await joins.add(None, -100, [member(1)])
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert [ids for _, _, ids in welcomed] == [[1]]
+
+
+def test_stop_flushes_open_windows(welcomed):
+    joins = bot.JoinAggregator(window_seconds=10, flush_size=50)
+
+    async def run():
+        await joins.add(None, -100, [member(1)])
+        await joins.add(None, -200, [member(2)])
+        start = time.monotonic()
+        await joins.stop()
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) < 1
+    assert sorted((chat_id, ids) for _, chat_id, ids in welcomed) == [(-200, [2]), (-100, [1])]
+    assert joins.pending == 0 and joins._timers == {}
+
+
+def test_welcome_errors_are_logged_and_do_not_stop_the_aggregator(monkeypatch, caplog):
+    calls = []
+
+    async def flaky(telegram_bot, chat_id, members):
+        calls.append(chat_id)
+        if chat_id == -100:
+            raise RuntimeError('Forbidden')
+
+    monkeypatch.setattr(bot, 'welcome_members', flaky)
+    caplog.set_level(logging.ERROR, logger='bot')
+    joins = bot.JoinAggregator(window_seconds=0.03, flush_size=50)
+
+    async def run():
+        await joins.add(None, -100, [member(1)])
+        await joins.add(None, -200, [member(2)])
+        await asyncio.sleep(0.1)
+
+    asyncio.run(run())
+    assert sorted(calls) == [-200, -100]
+    assert 'Erro ao processar 1 novos membros no chat -100' in caplog.text
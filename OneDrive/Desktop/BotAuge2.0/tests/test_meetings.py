@@ -0,0 +1,166 @@
+"""Testes da listagem, do lembrete e do agendador de reuniões"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import bot
+
+TITLE = 'Live_de *análise* `BTC` [parte 2]'
+ESCAPED = 'Live\\_de \\*análise\\* \\`BTC\\` \\[parte 2]'
+
+
+def meeting(meeting_id, title=TITLE):
+    return {'id': meeting_id, 'title': title, 'created_by': 1, 'description': '',
+            'scheduled_time': bot.TIMEZONE.localize(datetime(2030, 1, 2, 19, 30))}
+
+
+def test_meetings_page_escapes_titles():
+    text, markup = bot.build_meetings_page({'meetings': [meeting(1), meeting(2, 'Sem formatação')],
+                                            'next_cursor': (1893612600, 2)})
+
+    assert f"`#1` 02/01/2030 às 19:30 - {ESCAPED}" in text
+    assert "`#2` 02/01/2030 às 19:30 - Sem formatação" in text
+    assert markup is not None
+
+
+def test_empty_meetings_page():
+    assert bot.build_meetings_page({'meetings': [], 'next_cursor': None}) == ("📅 Nenhuma reunião agendada.", None)
+
+
+def test_meeting_notification_escapes_title(services, monkeypatch):
+    sent = []
+
+    async def send(bot_, chat_ids, text, **kwargs):
+        sent.append(text)
+        return []
+
+    monkeypatch.setattr(services.broadcast_engine, 'send', send)
+    asyncio.run(bot.send_meeting_notification(None, TITLE, meeting(1)['scheduled_time']))
+    assert f"**Título:** {ESCAPED}" in sent[0]
+
+
+def in_hours(hours):
+    return datetime.now(bot.TIMEZONE).replace(microsecond=0) + timedelta(hours=hours)
+
+
+def notified_at(db, meeting_id):
+    return db.engine.write_sync(lambda conn: conn.execute(
+        'SELECT notified_at, notify_claimed_at FROM meetings WHERE id = ?', (meeting_id,)).fetchone())
+
+
+def test_claim_is_exclusive_until_finished(services):
+    db = services.db_manager
+
+    async def run():
+        await db.start()
+        meeting_id = await db.add_meeting('Live', '', in_hours(2), 1)
+        assert await db.claim_meeting_notification(meeting_id)
+        assert not await db.claim_meeting_notification(meeting_id)
+        # Nenhum grupo recebeu: a marcação é liberada para nova tentativa
+        await db.finish_meeting_notification(meeting_id, delivered=False)
+        assert await db.claim_meeting_notification(meeting_id)
+        await db.finish_meeting_notification(meeting_id, delivered=True)
+        assert not await db.claim_meeting_notification(meeting_id)
+        return meeting_id
+
+    meeting_id = asyncio.run(run())
+    sent, claimed = notified_at(db, meeting_id)
+    assert sent is not None and claimed is None
+
+
+def test_cancelled_meeting_is_never_claimed(services):
+    db = services.db_manager
+    scheduler = bot.MeetingScheduler(db)
+
+    async def run():
+        await db.start()
+        meeting_id = await db.add_meeting('Live', '', in_hours(2), 1)
+        scheduler.schedule({'id': meeting_id, 'title': 'Live', 'scheduled_time': in_hours(2)})
+        assert len(scheduler) == 1
+        assert await db.cancel_meeting(meeting_id)
+        scheduler.cancel(meeting_id)
+        assert len(scheduler) == 0
+        return await db.claim_meeting_notification(meeting_id)
+
+    assert not asyncio.run(run())
+
+
+def test_start_rehydrates_pending_and_interrupted_reminders(services, caplog):
+    db = services.db_manager
+
+    async def run():
+        await db.start()
+        pending = await db.add_meeting('Pendente', '', in_hours(2), 1)
+        interrupted = await db.add_meeting('Interrompida', '', in_hours(3), 1)
+        delivered = await db.add_meeting('Entregue', '', in_hours(4), 1)
+        await db.add_meeting('Perdida', '', in_hours(-1), 1)
+        # Queda entre marcar e entregar; o outro lembrete já foi entregue
+        await db.claim_meeting_notification(interrupted)
+        await db.claim_meeting_notification(delivered)
+        await db.finish_meeting_notification(delivered, delivered=True)
+
+        scheduler = bot.MeetingScheduler(db)
+        await scheduler.start(None)
+        await scheduler.stop()
+        return scheduler, pending, interrupted
+
+    scheduler, pending, interrupted = asyncio.run(run())
+    assert sorted(scheduler._meetings) == [pending, interrupted]
+    assert notified_at(db, interrupted) == (None, None)
+    assert 'ficaram sem lembrete' in caplog.text
+
+
+def deliver(services, monkeypatch, ok):
+    db = services.db_manager
+    services.group_registry.replace([{'chat_id': -100500, 'alias': 'principal', 'title': 'Principal',
+                                      'role': 'principal', 'welcome_template': None, 'broadcast': True}])
+
+    async def send(bot_, chat_ids, text, **kwargs):
+        return [{'chat_id': chat_id, 'ok': ok, 'error': None if ok else 'Forbidden'} for chat_id in chat_ids]
+
+    monkeypatch.setattr(services.broadcast_engine, 'send', send)
+    scheduler = bot.MeetingScheduler(db, retry_seconds=60)
+
+    async def run():
+        await db.start()
+        when = in_hours(2)
+        meeting_id = await db.add_meeting('Live', '', when, 1)
+        scheduler.schedule({'id': meeting_id, 'title': 'Live', 'scheduled_time': when})
+        # Como faz o TimerHeap: o disparo sai da fila antes de chamar _notify
+        scheduler._timers.cancel(meeting_id)
+        await scheduler._notify(meeting_id)
+        return meeting_id
+
+    meeting_id = asyncio.run(run())
+    return scheduler, meeting_id, notified_at(db, meeting_id)
+
+
+def test_reminder_is_marked_after_delivery(services, monkeypatch):
+    scheduler, meeting_id, (sent, claimed) = deliver(services, monkeypatch, ok=True)
+    assert sent is not None and claimed is None
+    assert meeting_id not in scheduler._timers
+
+
+def test_failed_reminder_is_retried(services, monkeypatch):
+    scheduler, meeting_id, (sent, claimed) = deliver(services, monkeypatch, ok=False)
+    assert sent is None and claimed is None
+    assert meeting_id in scheduler._timers
+
+
+def test_cached_first_page_drops_started_meetings(services, monkeypatch):
+    db = services.db_manager
+    now = bot.time_module.time()
+
+    async def run():
+        await db.start()
+        started = await db.add_meeting('Começa antes', '', in_hours(1), 1)
+        later = await db.add_meeting('Depois', '', in_hours(2), 1)
+        first = await db.get_upcoming_meetings(limit=5)
+        # Uma hora e meia depois, dentro do TTL do cache e sem nenhuma alteração nas reuniões
+        monkeypatch.setattr(bot.time_module, 'time', lambda: now + 5400)
+        second = await db.get_upcoming_meetings(limit=5)
+        return started, later, first, second
+
+    started, later, first, second = asyncio.run(run())
+    assert [m['id'] for m in first['meetings']] == [started, later]
+    assert [m['id'] for m in second['meetings']] == [later]
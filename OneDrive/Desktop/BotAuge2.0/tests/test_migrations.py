@@ -0,0 +1,113 @@
+"""Testes das migrações versionadas (PRAGMA user_version)"""
+
+import logging
+import sqlite3
+
+import pytest
+
+import bot
+
+LATEST = bot.MIGRATIONS[-1][0]
+
+# Esquema do bot antes das migrações (criado por init_database, sem user_version)
+LEGACY_SCHEMA = '''
+    CREATE TABLE users (
+        user_id INTEGER PRIMARY KEY, username TEXT, first_name TEXT, last_name TEXT,
+        join_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP, is_active BOOLEAN DEFAULT 1
+    );
+    CREATE TABLE messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, chat_id INTEGER, message_text TEXT,
+        message_type TEXT, timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (user_id)
+    );
+    CREATE TABLE meetings (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT NOT NULL, description TEXT,
+        scheduled_time TIMESTAMP NOT NULL, created_by INTEGER, is_active BOOLEAN DEFAULT 1,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, FOREIGN KEY (created_by) REFERENCES users (user_id)
+    );
+'''
+
+
+def connect(tmp_path, name='bot.db'):
+    return sqlite3.connect(str(tmp_path / name))
+
+
+def schema(conn):
+    return conn.execute("SELECT type, name, sql FROM sqlite_master ORDER BY type, name").fetchall()
+
+
+def version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def test_versions_are_sequential():
+    assert [number for number, _, _ in bot.MIGRATIONS] == list(range(1, LATEST + 1))
+
+
+def test_new_database_gets_every_migration(tmp_path):
+    conn = connect(tmp_path)
+    assert version(conn) == 0
+
+    assert bot.migrate_database(conn) == LATEST
+    assert version(conn) == LATEST
+    tables = {name for kind, name, _ in schema(conn) if kind == 'table'}
+    assert {'users', 'messages', 'meetings', 'stats_counters', 'backfills', 'groups',
+            'schedules', 'persistence_data', 'messages_fts'} <= tables
+
+
+def test_rerunning_is_a_no_op(tmp_path, caplog):
+    conn = connect(tmp_path)
+    bot.migrate_database(conn)
+    before = schema(conn)
+
+    caplog.set_level(logging.INFO, logger='bot')
+    assert bot.migrate_database(conn) == LATEST
+    assert schema(conn) == before
+    assert 'Aplicando migração' not in caplog.text
+
+
+def test_legacy_database_keeps_its_data(tmp_path):
+    conn = connect(tmp_path)
+    conn.executescript(LEGACY_SCHEMA)
+    conn.execute("INSERT INTO users (user_id, username, join_date) VALUES (1, 'ana', '2024-01-05 10:00:00')")
+    conn.execute("INSERT INTO users (user_id, username, is_active) VALUES (2, 'bia', 0)")
+    conn.execute("INSERT INTO messages (user_id, chat_id, message_text, message_type) VALUES (1, -100, 'oi', 'user')")
+    conn.execute("INSERT INTO meetings (title, scheduled_time, created_by) "
+                 "VALUES ('Live', '2024-01-25T20:00:00-03:00', 1)")
+    conn.commit()
+
+    assert bot.migrate_database(conn) == LATEST
+    assert conn.execute('SELECT username FROM users ORDER BY user_id').fetchall() == [('ana',), ('bia',)]
+    assert conn.execute('SELECT message_text FROM messages').fetchall() == [('oi',)]
+    # Horário ISO com fuso convertido para epoch UTC (23:00 UTC)
+    assert conn.execute('SELECT scheduled_ts, notified_at FROM meetings').fetchone() == (1706223600, None)
+    # Usuários ativos contados na migração; mensagens ficam para o backfill online
+    counters = dict(conn.execute('SELECT name, value FROM stats_counters'))
+    assert counters['total_users'] == 1 and counters['total_messages'] == 0
+    assert conn.execute("SELECT done FROM backfills WHERE name = 'stats_messages'").fetchone() == (0,)
+
+
+def test_only_missing_migrations_are_applied(tmp_path):
+    conn = connect(tmp_path)
+    applied = []
+    migrations = [(number, f'm{number}', lambda c, n=number: applied.append(n)) for number in (1, 2, 3)]
+
+    assert bot.migrate_database(conn, migrations[:2]) == 2
+    assert bot.migrate_database(conn, migrations) == 3
+    assert applied == [1, 2, 3]
+
+
+def test_failed_migration_is_rolled_back(tmp_path):
+    conn = connect(tmp_path)
+
+    def broken(c):
+        c.execute('CREATE TABLE metade (id INTEGER)')
+        raise sqlite3.OperationalError('falha simulada')
+
+    migrations = [(1, 'ok', lambda c: c.execute('CREATE TABLE inteira (id INTEGER)')), (2, 'quebrada', broken)]
+    with pytest.raises(sqlite3.OperationalError):
+        bot.migrate_database(conn, migrations)
+
+    assert version(conn) == 1
+    tables = {name for kind, name, _ in schema(conn) if kind == 'table'}
+    assert 'inteira' in tables and 'metade' not in tables
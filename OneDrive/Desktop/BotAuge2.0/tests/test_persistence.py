@@ -0,0 +1,179 @@
+"""Testes da SQLitePersistence contra o contrato da BasePersistence do PTB"""
+
+import asyncio
+
+import bot
+
+CHAT = -100100
+USER = 42
+
+
+def session(path, body):
+    """Um "processo" do bot: abre o banco, roda `body(persistence)` e grava tudo ao sair"""
+    async def run():
+        db = bot.DatabaseManager(path, initialize=False)
+        persistence = bot.SQLitePersistence(db, update_interval=3600, flush_delay=0.01)
+        try:
+            await persistence.get_user_data()
+            await persistence.get_chat_data()
+            result = await body(persistence)
+            await persistence.flush()
+            return result
+        finally:
+            await db.shutdown()
+    return asyncio.run(run())
+
+
+def rows(path):
+    db = bot.DatabaseManager(path)
+    try:
+        return db.engine.write_sync(lambda conn: conn.execute(
+            'SELECT kind, id FROM persistence_data ORDER BY kind, id').fetchall())
+    finally:
+        db.close()
+
+
+async def refreshed(persistence, kind, key):
+    data = {}
+    await getattr(persistence, f'refresh_{kind}_data')(key, data)
+    return data
+
+
+def test_user_chat_and_bot_data_survive_a_restart(tmp_path):
+    path = str(tmp_path / 'bot.db')
+
+    async def first(p):
+        await p.update_user_data(USER, {'idioma': 'pt'})
+        await p.update_chat_data(CHAT, {'avisos': [1, 2]})
+        await p.update_bot_data({'versao': 3})
+
+    async def second(p):
+        # Dados de usuário e chat chegam sob demanda, no primeiro update de cada um
+        return (await refreshed(p, 'user', USER), await refreshed(p, 'chat', CHAT),
+                await p.get_bot_data(), await refreshed(p, 'chat', -1))
+
+    session(path, first)
+    assert session(path, second) == ({'idioma': 'pt'}, {'avisos': [1, 2]}, {'versao': 3}, {})
+
+
+def test_conversations_survive_and_end(tmp_path):
+    path = str(tmp_path / 'bot.db')
+
+    async def first(p):
+        await p.update_conversation('cadastro', (CHAT, USER), 'NOME')
+        await p.update_conversation('cadastro', (CHAT, 7), 2)
+        await p.update_conversation('outra', (USER,), 'X')
+
+    async def second(p):
+        states = await p.get_conversations('cadastro')
+        await p.update_conversation('cadastro', (CHAT, USER), None)  # conversa encerrada
+        return states
+
+    session(path, first)
+    assert session(path, second) == {(CHAT, USER): 'NOME', (CHAT, 7): 2}
+    assert session(path, lambda p: p.get_conversations('cadastro')) == {(CHAT, 7): 2}
+    assert session(path, lambda p: p.get_conversations('outra')) == {(USER,): 'X'}
+
+
+def test_drop_removes_the_rows(tmp_path):
+    path = str(tmp_path / 'bot.db')
+
+    async def first(p):
+        await p.update_user_data(USER, {'a': 1})
+        await p.update_chat_data(CHAT, {'b': 2})
+        await p.update_chat_data(-1, {'c': 3})
+
+    async def second(p):
+        await p.drop_user_data(USER)
+        await p.drop_chat_data(CHAT)
+
+    async def third(p):
+        return (await refreshed(p, 'user', USER), await refreshed(p, 'chat', CHAT),
+                await refreshed(p, 'chat', -1))
+
+    session(path, first)
+    session(path, second)
+    assert session(path, third) == ({}, {}, {'c': 3})
+    assert rows(path) == [('chat', -1)]
+
+
+def test_empty_data_does_not_keep_a_row(tmp_path):
+    path = str(tmp_path / 'bot.db')
+
+    async def first(p):
+        await p.update_chat_data(CHAT, {'b': 2})
+
+    async def second(p):
+        await refreshed(p, 'chat', CHAT)
+        await p.update_chat_data(CHAT, {})
+
+    session(path, first)
+    session(path, second)
+    assert rows(path) == []
+
+
+def test_refresh_loads_once_and_keeps_memory_values(tmp_path):
+    path = str(tmp_path / 'bot.db')
+    session(path, lambda p: p.update_chat_data(CHAT, {'a': 1, 'b': 2}))
+
+    async def second(p):
+        data = {'b': 'memória'}
+        await p.refresh_chat_data(CHAT, data)
+        first_load = dict(data)
+        data.pop('a')
+        # Já carregado neste processo: um novo refresh não relê o banco
+        await p.refresh_chat_data(CHAT, data)
+        return first_load, data
+
+    assert session(path, second) == ({'a': 1, 'b': 'memória'}, {'b': 'memória'})
+
+
+def test_update_before_refresh_preserves_stored_keys(tmp_path):
+    path = str(tmp_path / 'bot.db')
+    session(path, lambda p: p.update_user_data(USER, {'a': 1}))
+
+    async def second(p):
+        await p.update_user_data(USER, {'b': 2})
+
+    session(path, second)
+    assert session(path, lambda p: refreshed(p, 'user', USER)) == {'a': 1, 'b': 2}
+
+
+def test_unchanged_data_is_not_queued(tmp_path):
+    path = str(tmp_path / 'bot.db')
+    session(path, lambda p: p.update_chat_data(CHAT, {'a': [1, 2]}))
+
+    async def second(p):
+        data = await refreshed(p, 'chat', CHAT)
+        await p.update_chat_data(CHAT, data)
+        unchanged = p.pending
+        data['a'].append(3)
+        await p.update_chat_data(CHAT, data)
+        return unchanged, p.pending
+
+    assert session(path, second) == (0, 1)
+    assert session(path, lambda p: refreshed(p, 'chat', CHAT)) == {'a': [1, 2, 3]}
+
+
+def test_queue_is_written_after_the_flush_delay(tmp_path):
+    path = str(tmp_path / 'bot.db')
+
+    async def body(p):
+        await p.update_chat_data(CHAT, {'a': 1})
+        await p.update_chat_data(-1, {'a': 2})
+        before = p.pending
+        await asyncio.sleep(0.1)
+        return before, p.pending
+
+    assert session(path, body) == (2, 0)
+    assert rows(path) == [('chat', CHAT), ('chat', -1)]
+
+
+def test_callback_data_is_not_stored(tmp_path):
+    db = bot.DatabaseManager(str(tmp_path / 'bot.db'), initialize=False)
+    persistence = bot.SQLitePersistence(db)
+    try:
+        assert persistence.store_data.callback_data is False
+        assert asyncio.run(persistence.get_callback_data()) is None
+    finally:
+        db.close()
@@ -0,0 +1,84 @@
+"""Testes do auto_vacuum incremental e da retenção em bancos antigos"""
+
+import asyncio
+import os
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import bot
+
+
+def legacy_database(path):
+    """Banco criado antes do auto_vacuum incremental, com mensagens antigas"""
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    bot.migrate_database(conn)
+    old = (datetime.now(timezone.utc) - timedelta(days=400)).strftime('%Y-%m-%d %H:%M:%S')
+    conn.executemany('INSERT INTO messages (user_id, chat_id, message_text, message_type, timestamp) VALUES (?, ?, ?, ?, ?)',
+                     [(1, -100, 'x' * 200, 'user', old)] * 500)
+    conn.execute('UPDATE backfills SET done = 1')
+    conn.commit()
+    conn.close()
+
+
+def auto_vacuum(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+
+
+def test_new_database_uses_incremental_vacuum(tmp_path):
+    path = str(tmp_path / 'novo.db')
+    db = bot.DatabaseManager(path)
+    db.close()
+    assert auto_vacuum(path) == 2
+
+
+def test_start_never_vacuums_a_legacy_database(tmp_path, monkeypatch):
+    path = str(tmp_path / 'antigo.db')
+    legacy_database(path)
+    vacuums = []
+    monkeypatch.setattr(bot.MessageArchiver, '_vacuum_step', classmethod(lambda cls, conn: vacuums.append(1) or 0))
+
+    async def run():
+        db = bot.DatabaseManager(path, initialize=False)
+        db.archiver = bot.MessageArchiver(db.engine, archive_dir=str(tmp_path / 'archive'), retention_days=30)
+        await db.start()
+        archived = await db.archiver.run()
+        await db.shutdown()
+        return archived
+
+    assert asyncio.run(run()) == 500
+    assert auto_vacuum(path) == 0
+    assert vacuums == []
+
+
+def test_compact_converts_a_legacy_database(tmp_path):
+    path = str(tmp_path / 'antigo.db')
+    legacy_database(path)
+
+    bot.DatabaseManager.compact(path)
+    assert auto_vacuum(path) == 2
+    assert os.path.getsize(path) > 0
+
+
+def expired_rows(days_ago):
+    old = (datetime.now(timezone.utc) - timedelta(days=days_ago)).strftime('%Y-%m-%d %H:%M:%S')
+    return [(1, 1, -100, 'x', 'user', old), (2, 1, -100, 'y', 'user', old)]
+
+
+def test_budget_only_under_budget_archives_nothing():
+    archiver = bot.MessageArchiver(None, retention_days=0, size_budget_mb=100)
+    assert archiver.enabled
+    assert archiver._expired_prefix(expired_rows(400), over_budget=False) == []
+
+
+def test_budget_only_over_budget_archives_rows_older_than_a_day():
+    archiver = bot.MessageArchiver(None, retention_days=0, size_budget_mb=100)
+    assert len(archiver._expired_prefix(expired_rows(2), over_budget=True)) == 2
+    assert archiver._expired_prefix(expired_rows(0), over_budget=True) == []
+
+
+def test_retention_disabled():
+    archiver = bot.MessageArchiver(None, retention_days=0, size_budget_mb=0)
+    assert not archiver.enabled
+    assert archiver._expired_prefix(expired_rows(400), over_budget=False) == []
@@ -0,0 +1,127 @@
+"""Testes dos rollups diários por chat: nada é contado duas vezes"""
+
+import asyncio
+import sqlite3
+
+import pytest
+
+import bot
+
+# Migração que cria os rollups: mensagens anteriores a ela entram pelo backfill
+ROLLUPS = next(number for number, _, fn in bot.MIGRATIONS if fn is bot._migration_007_chat_daily_stats)
+
+
+def rollups(conn):
+    return conn.execute(
+        'SELECT day, chat_id, messages, active_users, joins FROM chat_daily_stats ORDER BY day, chat_id'
+    ).fetchall()
+
+
+def recount(conn):
+    """Os mesmos números calculados direto da tabela messages"""
+    return conn.execute('''
+        SELECT SUBSTR(timestamp, 1, 10) AS day, chat_id, COUNT(*), COUNT(DISTINCT user_id), 0
+        FROM messages GROUP BY day, chat_id ORDER BY day, chat_id
+    ''').fetchall()
+
+
+def legacy_database(path, messages):
+    """Banco parado antes dos rollups, com mensagens, migrado em seguida até a última versão"""
+    conn = sqlite3.connect(path)
+    bot.migrate_database(conn, bot.MIGRATIONS[:ROLLUPS - 1])
+    conn.executemany('INSERT INTO messages (user_id, chat_id, message_text, message_type, timestamp) '
+                     'VALUES (?, ?, ?, ?, ?)', messages)
+    conn.commit()
+    bot.migrate_database(conn)
+    conn.close()
+
+
+def message(user_id, chat_id, timestamp):
+    return (user_id, chat_id, 'oi', 'user', timestamp)
+
+
+OLD = [message(1, -100, '2024-01-01 10:00:00'), message(1, -100, '2024-01-01 11:00:00'),
+       message(2, -100, '2024-01-01 12:00:00'), message(1, -200, '2024-01-01 13:00:00'),
+       message(1, -100, '2024-01-02 09:00:00'), message(3, -100, '2024-01-02 10:00:00'),
+       message(2, -200, '2024-01-03 08:00:00')]
+
+
+def test_repeated_users_are_counted_once_per_day_and_chat(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'bot.db'))
+    bot.migrate_database(conn)
+
+    with conn:
+        bot.ChatRollups.add(conn, [(1, -100, '2024-01-01 10:00:00'), (1, -100, '2024-01-01 11:00:00'),
+                                   (None, -100, '2024-01-01 11:30:00')], [])
+    with conn:
+        # Outro lote no mesmo dia: o usuário 1 já estava contado
+        bot.ChatRollups.add(conn, [(1, -100, '2024-01-01 15:00:00'), (2, -100, '2024-01-01 16:00:00'),
+                                   (1, -100, '2024-01-02 00:00:00')], [(-100, 5, '2024-01-01')])
+
+    assert rollups(conn) == [('2024-01-01', -100, 5, 2, 1), ('2024-01-02', -100, 1, 1, 0)]
+    stats = bot.ChatRollups.query(conn, '2024-01-01', '2024-01-02')
+    assert stats['messages'] == 6 and stats['joins'] == 1 and stats['active_users'] == 2
+    assert stats['groups'] == [{'chat_id': -100, 'messages': 6, 'joins': 1, 'active_users': 2}]
+
+
+def test_backfill_and_live_writes_do_not_overlap(tmp_path):
+    path = str(tmp_path / 'bot.db')
+    legacy_database(path, OLD)
+    db = bot.DatabaseManager(path)
+    runner = bot.BackfillRunner(db.engine, chunk_size=2, pause_ms=0)
+
+    async def run():
+        # Mensagens novas chegam antes do backfill terminar, inclusive de quem já tinha falado no dia
+        await db.buffer.put('message', message(1, -100, '2024-01-02 18:00:00'))
+        await db.buffer.put('message', message(4, -300, '2024-01-03 09:00:00'))
+        await db.buffer.stop()
+        await runner._run()
+        # Rodar de novo não faz nada: o backfill ficou marcado como concluído
+        await runner._run()
+
+    try:
+        asyncio.run(run())
+        conn_rollups, expected = db.engine.write_sync(lambda conn: (rollups(conn), recount(conn)))
+        assert conn_rollups == expected
+        assert ('2024-01-02', -100, 3, 2, 0) in conn_rollups
+    finally:
+        db.close()
+
+
+def test_interrupted_backfill_resumes_without_recounting(tmp_path):
+    path = str(tmp_path / 'bot.db')
+    legacy_database(path, OLD)
+    db = bot.DatabaseManager(path)
+    runner = bot.BackfillRunner(db.engine, chunk_size=3, pause_ms=0)
+
+    try:
+        # Um bloco gravado e o processo "cai"; o cursor foi salvo na mesma transação
+        cursor, _ = db.engine.write_sync(runner._step, 'chat_daily_stats', 0, len(OLD))
+        assert cursor == 3
+        asyncio.run(runner._run())
+        assert db.engine.write_sync(lambda conn: rollups(conn) == recount(conn))
+    finally:
+        db.close()
+
+
+def test_failed_chunk_is_rolled_back(tmp_path, monkeypatch):
+    path = str(tmp_path / 'bot.db')
+    legacy_database(path, OLD)
+    db = bot.DatabaseManager(path)
+    runner = bot.BackfillRunner(db.engine, chunk_size=100, pause_ms=0)
+
+    def broken(conn, start, end):
+        bot._backfill_chat_daily_stats(conn, start, end)
+        raise sqlite3.OperationalError('disk I/O error')
+
+    try:
+        monkeypatch.setitem(bot.BACKFILLS, 'chat_daily_stats', broken)
+        with pytest.raises(sqlite3.OperationalError):
+            db.engine.write_sync(runner._step, 'chat_daily_stats', 0, len(OLD))
+        assert db.engine.write_sync(rollups) == []
+
+        monkeypatch.undo()
+        asyncio.run(runner._run())
+        assert db.engine.write_sync(lambda conn: rollups(conn) == recount(conn))
+    finally:
+        db.close()
@@ -0,0 +1,205 @@
+"""Testes das expressões cron e da recuperação de envios programados perdidos"""
+
+import asyncio
+from datetime import datetime
+
+import pytest
+import pytz
+
+import bot
+
+UTC = pytz.utc
+NEW_YORK = pytz.timezone('America/New_York')
+
+
+def epoch(year, month, day, hour=0, minute=0, tz=UTC):
+    return tz.localize(datetime(year, month, day, hour, minute)).timestamp()
+
+
+def fires(expression, after, count, timezone='UTC'):
+    expr = bot.CronExpression(expression, timezone)
+    result = []
+    for _ in range(count):
+        after = expr.next_after(after)
+        result.append(datetime.fromtimestamp(after, UTC).strftime('%Y-%m-%d %H:%M'))
+    return result
+
+
+@pytest.mark.parametrize('expression', [
+    '* * * *',            # 4 campos
+    '60 * * * *',         # minuto fora do intervalo
+    '* 24 * * *',
+    '* * 0 * *',
+    '* * * 13 *',
+    '* * * * 8',
+    'a * * * *',
+    '*/0 * * * *',        # passo zero
+    '5-1 * * * *',        # intervalo invertido
+    '1-x * * * *',
+    '@yearly',            # atalho não suportado
+])
+def test_invalid_expressions(expression):
+    with pytest.raises(bot.CronError):
+        bot.CronExpression(expression, 'UTC')
+
+
+def test_unknown_timezone():
+    with pytest.raises(bot.CronError, match='fuso'):
+        bot.CronExpression('0 9 * * *', 'America/Atlantida')
+
+
+def test_expression_that_never_fires():
+    with pytest.raises(bot.CronError, match='nunca dispara'):
+        bot.CronExpression('0 0 30 2 *', 'UTC').next_after(epoch(2024, 1, 1))
+
+
+def test_lists_ranges_steps_and_aliases():
+    assert fires('*/20 8-9 * * *', epoch(2024, 5, 10, 9, 30), 3) == [
+        '2024-05-10 09:40', '2024-05-11 08:00', '2024-05-11 08:20']
+    assert fires('0 9,18 * * *', epoch(2024, 5, 10, 12), 2) == ['2024-05-10 18:00', '2024-05-11 09:00']
+    assert fires('@daily', epoch(2024, 5, 10, 12), 1) == ['2024-05-11 00:00']
+    # next_after é estrito: um disparo exatamente em `ts` não conta
+    assert fires('0 12 * * *', epoch(2024, 5, 10, 12), 1) == ['2024-05-11 12:00']
+
+
+def test_day_of_month_or_day_of_week():
+    # Ambos restritos: dia 1 OU segunda-feira (2024-07-01 é segunda, 2024-07-08 também)
+    assert fires('0 9 1 * 1', epoch(2024, 6, 28), 3) == [
+        '2024-07-01 09:00', '2024-07-08 09:00', '2024-07-15 09:00']
+    # Dia da semana com o dia do mês em '*': só segundas; 0 e 7 são domingo
+    assert fires('0 9 * * 1', epoch(2024, 6, 28), 1) == ['2024-07-01 09:00']
+    assert fires('0 9 * * 7', epoch(2024, 6, 28), 1) == fires('0 9 * * 0', epoch(2024, 6, 28), 1) == ['2024-06-30 09:00']
+
+
+def test_month_ends():
+    # Dia 31 pula os meses que não o têm
+    assert fires('0 9 31 * *', epoch(2024, 1, 31, 10), 3) == [
+        '2024-03-31 09:00', '2024-05-31 09:00', '2024-07-31 09:00']
+    # 29 de fevereiro só em ano bissexto
+    assert fires('0 9 29 2 *', epoch(2024, 3, 1), 1) == ['2028-02-29 09:00']
+    # Virada de ano
+    assert fires('0 0 1 * *', epoch(2024, 12, 15), 2) == ['2025-01-01 00:00', '2025-02-01 00:00']
+
+
+def test_spring_forward_fires_once_after_the_gap():
+    # 2024-03-10: 02:00 EST vira 03:00 EDT; 02:30 não existe e o disparo sai às 03:30 EDT
+    assert fires('30 2 * * *', epoch(2024, 3, 9, 12, tz=NEW_YORK), 3, 'America/New_York') == [
+        '2024-03-10 07:30', '2024-03-11 06:30', '2024-03-12 06:30']
+    # Horários fora do salto seguem a hora de parede (9h local antes e depois da mudança)
+    assert fires('0 9 * * *', epoch(2024, 3, 9, 12, tz=NEW_YORK), 2, 'America/New_York') == [
+        '2024-03-10 13:00', '2024-03-11 13:00']
+
+
+def test_fall_back_fires_once_for_the_repeated_hour():
+    # 2024-11-03: 01:00-02:00 acontece duas vezes; o disparo das 01:30 sai uma vez só
+    assert fires('30 1 * * *', epoch(2024, 11, 2, 12, tz=NEW_YORK), 2, 'America/New_York') == [
+        '2024-11-03 06:30', '2024-11-04 06:30']
+    assert fires('0 9 * * *', epoch(2024, 11, 2, 12, tz=NEW_YORK), 2, 'America/New_York') == [
+        '2024-11-03 14:00', '2024-11-04 14:00']
+
+
+def test_fires_are_strictly_increasing_across_dst():
+    expr = bot.CronExpression('*/15 * * * *', 'America/New_York')
+    after = epoch(2024, 11, 2, 23, tz=NEW_YORK)
+    for _ in range(24):
+        following = expr.next_after(after)
+        assert following > after
+        after = following
+
+
+NOW = epoch(2024, 5, 10, 12, 20)
+
+
+def schedule(policy, last_fire_ts, cron='0 * * * *'):
+    return {'id': 1, 'cron': cron, 'timezone': 'UTC', 'template': 'morning', 'target': None,
+            'catch_up': policy, 'last_fire_ts': last_fire_ts}
+
+
+def hour(value):
+    return epoch(2024, 5, 10, value)
+
+
+@pytest.mark.parametrize('policy, due', [
+    ('ignorar', hour(13)),   # perdidos descartados: só o próximo
+    ('ultimo', hour(12)),    # só o último perdido
+    ('todos', hour(8)),      # o primeiro perdido (7h foi o último disparo)
+])
+def test_catch_up_policies_after_downtime(policy, due):
+    scheduler = bot.BroadcastScheduler(None, catchup_hours=24, catchup_max=10)
+    entry = schedule(policy, hour(7))
+    scheduler.add(entry, NOW)
+    assert entry['due'] == due
+
+
+def test_catch_up_respects_the_window_and_the_maximum():
+    scheduler = bot.BroadcastScheduler(None, catchup_hours=2, catchup_max=10)
+    entry = schedule('todos', hour(1))
+    scheduler.add(entry, NOW)
+    # Janela de 2h: 11h e 12h; 2h a 10h ficam de fora
+    assert entry['due'] == hour(11)
+
+    scheduler = bot.BroadcastScheduler(None, catchup_hours=24, catchup_max=3)
+    entry = schedule('todos', hour(1))
+    scheduler.add(entry, NOW)
+    # No máximo 3 perdidos: os mais recentes (10h, 11h, 12h)
+    assert entry['due'] == hour(10)
+
+
+def test_new_schedule_starts_from_now():
+    scheduler = bot.BroadcastScheduler(None)
+    entry = schedule('todos', None)
+    scheduler.add(entry, NOW)
+    assert entry['due'] == hour(13)
+
+
+class ClaimDB:
+    """Banco falso: registra os disparos reivindicados (cada um no máximo uma vez)"""
+
+    def __init__(self):
+        self.claimed = []
+
+    async def claim_schedule_fire(self, schedule_id, fire_ts):
+        if fire_ts in self.claimed:
+            return False
+        self.claimed.append(fire_ts)
+        return True
+
+
+def test_todos_sends_every_missed_fire_then_resumes(monkeypatch):
+    monkeypatch.setattr(bot.time_module, 'time', lambda: NOW)
+    db = ClaimDB()
+    scheduler = bot.BroadcastScheduler(db, catchup_hours=24, catchup_max=10)
+    sent = []
+
+    async def send(schedule, due):
+        sent.append(due)
+
+    monkeypatch.setattr(scheduler, '_send', send)
+    scheduler.add(schedule('todos', hour(9)), NOW)
+
+    async def run():
+        for _ in range(3):
+            await scheduler._fire(1)
+
+    asyncio.run(run())
+    assert sent == [hour(10), hour(11), hour(12)]
+    assert db.claimed == [hour(10), hour(11), hour(12)]
+    # Depois dos perdidos volta ao próximo horário futuro, que ainda não venceu
+    assert scheduler._schedules[1]['due'] == hour(13)
+
+
+def test_fire_already_claimed_is_not_resent(monkeypatch):
+    monkeypatch.setattr(bot.time_module, 'time', lambda: NOW)
+    db = ClaimDB()
+    db.claimed.append(hour(12))
+    scheduler = bot.BroadcastScheduler(db)
+    sent = []
+
+    async def send(schedule, due):
+        sent.append(due)
+
+    monkeypatch.setattr(scheduler, '_send', send)
+    scheduler.add(schedule('ultimo', hour(11)), NOW)
+    asyncio.run(scheduler._fire(1))
+    assert sent == []
+    assert scheduler._schedules[1]['due'] == hour(13)
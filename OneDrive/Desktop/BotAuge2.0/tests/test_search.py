@@ -0,0 +1,138 @@
+"""Testes do índice FTS5 de messages: triggers, arquivamento e backfill"""
+
+import asyncio
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import bot
+
+# Migração que cria o índice: mensagens anteriores a ela entram pelo backfill
+FTS = next(number for number, _, fn in bot.MIGRATIONS if fn is bot._migration_008_messages_fts)
+
+
+def days_ago(days):
+    return (datetime.now(timezone.utc) - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def database(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'bot.db'))
+    bot.migrate_database(conn)
+    return conn
+
+
+def insert(conn, text, chat_id=-100, timestamp=None):
+    cursor = conn.execute(
+        'INSERT INTO messages (user_id, chat_id, message_text, message_type, timestamp) VALUES (1, ?, ?, ?, ?)',
+        (chat_id, text, 'user', timestamp or days_ago(0))
+    )
+    conn.commit()
+    return cursor.lastrowid
+
+
+def matches(conn, text):
+    query = bot.DatabaseManager.fts_query(text)
+    return [row[0] for row in conn.execute(
+        'SELECT rowid FROM messages_fts WHERE messages_fts MATCH ? ORDER BY rowid', (query,))]
+
+
+def assert_in_sync(conn):
+    # Compara o índice com o conteúdo de messages; levanta "database disk image is malformed" se divergir
+    conn.execute("INSERT INTO messages_fts (messages_fts, rank) VALUES ('integrity-check', 1)")
+
+
+def test_inserted_messages_are_searchable(tmp_path):
+    conn = database(tmp_path)
+    first = insert(conn, 'Análise do índice hoje')
+    second = insert(conn, 'sem relação')
+
+    assert matches(conn, 'analise') == [first]
+    assert matches(conn, 'ind*') == [first]
+    assert matches(conn, 'relacao') == [second]
+    assert_in_sync(conn)
+
+
+def test_update_replaces_the_indexed_text(tmp_path):
+    conn = database(tmp_path)
+    id_ = insert(conn, 'comprar dólar')
+    other = insert(conn, 'vender dólar')
+
+    conn.execute("UPDATE messages SET message_text = 'vender euro' WHERE id = ?", (id_,))
+    conn.commit()
+    assert matches(conn, 'comprar') == []
+    assert matches(conn, 'vender') == [id_, other]
+    assert matches(conn, 'dolar') == [other]
+
+    # Mudar outra coluna não mexe no índice
+    conn.execute('UPDATE messages SET chat_id = -200 WHERE id = ?', (id_,))
+    conn.commit()
+    assert matches(conn, 'euro') == [id_]
+    assert_in_sync(conn)
+
+
+def test_delete_removes_from_the_index(tmp_path):
+    conn = database(tmp_path)
+    id_ = insert(conn, 'mensagem apagada')
+    insert(conn, 'mensagem mantida')
+
+    conn.execute('DELETE FROM messages WHERE id = ?', (id_,))
+    conn.commit()
+    assert matches(conn, 'apagada') == []
+    assert len(matches(conn, 'mensagem')) == 1
+    assert_in_sync(conn)
+
+
+def test_archived_messages_leave_the_index(tmp_path):
+    path = str(tmp_path / 'bot.db')
+    db = bot.DatabaseManager(path)
+    db.archiver = bot.MessageArchiver(db.engine, archive_dir=str(tmp_path / 'archive'),
+                                      retention_days=30, chunk_size=2, pause_ms=0)
+
+    def fill(conn):
+        for i in range(5):
+            insert(conn, f'sinal antigo {i}', timestamp=days_ago(60))
+        return [insert(conn, f'sinal recente {i}') for i in range(2)]
+
+    async def run():
+        archived = await db.archiver.run()
+        found = await db.search_messages('sinal')
+        return archived, found
+
+    try:
+        recent = db.engine.write_sync(fill)
+        archived, found = asyncio.run(run())
+        assert archived == 5
+        assert sorted(result['id'] for result in found['results']) == recent
+        assert db.engine.write_sync(matches, 'antigo') == []
+        db.engine.write_sync(assert_in_sync)
+    finally:
+        db.close()
+
+
+def test_backfill_indexes_existing_messages(tmp_path):
+    path = str(tmp_path / 'bot.db')
+    conn = sqlite3.connect(path)
+    bot.migrate_database(conn, bot.MIGRATIONS[:FTS - 1])
+    old = [insert(conn, f'relatório semanal {i}') for i in range(5)]
+    bot.migrate_database(conn)
+    conn.close()
+
+    db = bot.DatabaseManager(path)
+    db.archiver = bot.MessageArchiver(db.engine, archive_dir=str(tmp_path / 'archive'), retention_days=1)
+
+    async def run():
+        # Enquanto o backfill não termina, a retenção não apaga nada que ainda falta indexar
+        blocked = await db.archiver.run()
+        before = db.engine.write_sync(matches, 'relatorio')
+        await bot.BackfillRunner(db.engine, chunk_size=2, pause_ms=0)._run()
+        return blocked, before
+
+    try:
+        new = db.engine.write_sync(insert, 'relatório mensal')
+        blocked, before = asyncio.run(run())
+        assert blocked == 0
+        # Só a mensagem gravada depois da migração estava no índice
+        assert before == [new]
+        assert db.engine.write_sync(matches, 'relatorio') == old + [new]
+        db.engine.write_sync(assert_in_sync)
+    finally:
+        db.close()
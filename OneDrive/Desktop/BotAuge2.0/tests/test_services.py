@@ -0,0 +1,50 @@
+"""Testes da criação dos serviços globais (nada acontece no import do módulo)"""
+
+import os
+import subprocess
+import sys
+
+import bot
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_has_no_side_effects(tmp_path):
+    code = (
+        "import logging, threading, bot\n"
+        "assert bot.db_manager is None and bot.templates is None\n"
+        "assert threading.active_count() == 1, threading.enumerate()\n"
+        "assert not logging.getLogger().handlers\n"
+    )
+    env = dict(os.environ, DATABASE_PATH=str(tmp_path / 'bot.db'), PYTHONPATH=ROOT)
+    subprocess.run([sys.executable, '-c', code], cwd=tmp_path, env=env, check=True)
+    assert os.listdir(tmp_path) == []
+
+
+def test_init_services_wires_the_globals(services):
+    assert services.meeting_scheduler.db is services.db_manager
+    assert services.persistence.db is services.db_manager
+    assert services.group_registry.on_change == services.admin_registry.track_chats
+    assert 'welcome_principal' in services.templates
+
+
+def test_build_application_takes_the_concurrency(services):
+    sequential = bot.build_application(concurrency=1)
+    parallel = bot.build_application(concurrency=4)
+
+    assert sequential.update_processor.max_concurrent_updates == 1
+    assert isinstance(parallel.update_processor, bot.ChatOrderedUpdateProcessor)
+    assert parallel.update_processor._slots._value == 4
+    # A aplicação usa os serviços já criados em vez de criar outros
+    assert parallel.persistence is services.persistence
+
+
+def test_export_args_resolve_aliases_from_the_given_registry():
+    groups = bot.GroupRegistry(None)
+    groups.replace([{'chat_id': -100500, 'alias': 'principal', 'title': 'Principal', 'role': 'principal',
+                     'welcome_template': None, 'broadcast': True}])
+
+    spec = bot.parse_export_args(['mensagens', 'jsonl', 'chat:principal'], groups)
+    assert spec['table'] == 'mensagens' and spec['format'] == 'jsonl' and spec['chat_id'] == -100500
+    assert bot.parse_export_args(['mensagens', 'chat:-100700'], groups)['chat_id'] == -100700
+    assert bot.parse_export_args(['usuarios', 'chat:principal'], groups) is None
@@ -0,0 +1,105 @@
+"""Testes do TemplateRegistry: validação, renderização e recarga do arquivo"""
+
+import json
+import logging
+import os
+
+import pytest
+
+import bot
+
+
+def write(path, data, mtime=None):
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding='utf-8')
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def registry(tmp_path, data):
+    path = tmp_path / 'templates.json'
+    write(path, data, mtime=1_000_000)
+    templates = bot.TemplateRegistry(str(path))
+    templates.load()
+    return templates, path
+
+
+@pytest.mark.parametrize('text', [
+    '**NEGRITO* aberto',
+    'texto _itálico',
+    'código `aberto',
+    '*a* _b_ `c` e mais um *',
+])
+def test_unbalanced_markdown_is_rejected(text):
+    with pytest.raises(bot.TemplateError, match='sem fechamento'):
+        bot.TemplateRegistry.compile('t', text)
+
+
+@pytest.mark.parametrize('text', ['{nome', '{nome!x}', '{nome!r}', '{nome:>10}', '{0}', '{user.name}', '{}', 123])
+def test_malformed_placeholders_are_rejected(text):
+    with pytest.raises(bot.TemplateError):
+        bot.TemplateRegistry.compile('t', text)
+
+
+def test_compile_lists_the_variables():
+    assert bot.TemplateRegistry.compile('t', '**Olá {nome}**, `{grupo}` {nome}') == (
+        '**Olá {nome}**, `{grupo}` {nome}', ('grupo', 'nome'))
+    assert bot.TemplateRegistry.compile('t', 'sem variáveis') == ('sem variáveis', ())
+
+
+def test_one_bad_variant_rejects_the_file():
+    with pytest.raises(bot.TemplateError, match='motivacional'):
+        bot.TemplateRegistry.parse({'ok': 'texto', 'motivacional': ['*bom*', '*ruim']})
+    with pytest.raises(bot.TemplateError):
+        bot.TemplateRegistry.parse({'vazio': []})
+    with pytest.raises(bot.TemplateError):
+        bot.TemplateRegistry.parse(['não é objeto'])
+
+
+def test_shipped_templates_are_valid():
+    templates = bot.TemplateRegistry(bot.TEMPLATES_PATH)
+    templates.load()
+    assert 'welcome_greeting' in templates
+
+
+def test_render_escapes_variables(tmp_path):
+    templates, _ = registry(tmp_path, {'oi': '👋 *Olá {nome}*!', 'fixo': '**pronto**'})
+
+    assert templates.render('oi', nome='joao_silva*') == '👋 *Olá joao\\_silva\\**!'
+    assert templates.render('oi') == '👋 *Olá *!'
+    assert templates.render('fixo') == '**pronto**'
+    assert templates.names() == ['fixo', 'oi']
+
+
+def test_render_picks_among_variants(tmp_path):
+    templates, _ = registry(tmp_path, {'m': ['um {x}', 'dois {x}']})
+
+    rendered = {templates.render('m', x='_') for _ in range(50)}
+    assert rendered == {'um \\_', 'dois \\_'}
+
+
+def test_reload_picks_up_changes(tmp_path):
+    templates, path = registry(tmp_path, {'a': 'versão 1'})
+
+    assert templates.reload_if_changed() is False
+    write(path, {'a': 'versão 2', 'b': 'novo'}, mtime=1_000_010)
+    assert templates.reload_if_changed() is True
+    assert templates.render('a') == 'versão 2' and 'b' in templates
+
+
+def test_invalid_reload_keeps_the_previous_version(tmp_path, caplog):
+    templates, path = registry(tmp_path, {'a': '*ok*'})
+
+    write(path, {'a': '*quebrado'}, mtime=1_000_010)
+    caplog.set_level(logging.ERROR, logger='bot')
+    assert templates.reload_if_changed() is False
+    assert templates.render('a') == '*ok*'
+    assert 'versão anterior mantida' in caplog.text
+    # Não tenta de novo enquanto o arquivo não mudar
+    caplog.clear()
+    assert templates.reload_if_changed() is False
+    assert caplog.text == ''
+
+    path.write_text('{json inválido', encoding='utf-8')
+    os.utime(path, (1_000_020, 1_000_020))
+    assert templates.reload_if_changed() is False
+    assert templates.render('a') == '*ok*'
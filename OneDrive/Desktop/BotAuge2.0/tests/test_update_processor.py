@@ -0,0 +1,98 @@
+"""Testes do ChatOrderedUpdateProcessor: ordem dentro do chat, paralelismo entre chats"""
+
+import asyncio
+import time
+from datetime import datetime, timezone
+
+from telegram import Chat, Message, Update, User
+
+import bot
+
+
+def update(update_id, chat_id, user_id):
+    chat = Chat(chat_id, Chat.SUPERGROUP if chat_id < 0 else Chat.PRIVATE)
+    message = Message(update_id, datetime.now(timezone.utc), chat,
+                      from_user=User(user_id, f'user{user_id}', False), text=f'msg {update_id}')
+    return Update(update_id, message=message)
+
+
+class Recorder:
+    """Handler falso: dorme `delay` segundos e registra início, fim e o pico de simultâneos"""
+
+    def __init__(self):
+        self.started = []
+        self.finished = []
+        self.running = 0
+        self.peak = 0
+
+    async def handle(self, name, delay):
+        self.started.append(name)
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(delay)
+        self.running -= 1
+        self.finished.append(name)
+
+
+def run(processor, jobs):
+    """Entrega os updates na ordem da lista, todos de uma vez, e mede o tempo total"""
+    recorder = Recorder()
+
+    async def main():
+        start = time.monotonic()
+        await asyncio.gather(*(
+            processor.process_update(upd, recorder.handle(upd.update_id, delay)) for upd, delay in jobs
+        ))
+        return time.monotonic() - start
+
+    elapsed = asyncio.run(main())
+    return recorder, elapsed
+
+
+def test_same_chat_runs_in_arrival_order():
+    # O primeiro é o mais lento: sem a ordenação, terminaria por último
+    jobs = [(update(1, -100, 1), 0.06), (update(2, -100, 2), 0.03), (update(3, -100, 3), 0.0)]
+    recorder, _ = run(bot.ChatOrderedUpdateProcessor(max_in_flight=8), jobs)
+
+    assert recorder.started == [1, 2, 3]
+    assert recorder.finished == [1, 2, 3]
+    assert recorder.peak == 1
+
+
+def test_different_chats_run_concurrently():
+    jobs = [(update(i, -100 - i, i), 0.2) for i in range(1, 5)]
+    recorder, elapsed = run(bot.ChatOrderedUpdateProcessor(max_in_flight=8), jobs)
+
+    assert recorder.peak == 4
+    assert elapsed < 0.35
+
+
+def test_slow_chat_does_not_delay_other_chats():
+    jobs = [(update(1, -100, 1), 0.2), (update(2, -100, 1), 0.0), (update(3, -200, 3), 0.0)]
+    recorder, _ = run(bot.ChatOrderedUpdateProcessor(max_in_flight=8), jobs)
+
+    # O update do outro chat termina antes do primeiro; o segundo do chat lento espera a vez
+    assert recorder.finished == [3, 1, 2]
+
+
+def test_same_user_is_ordered_across_chats():
+    jobs = [(update(1, -100, 7), 0.05), (update(2, -200, 7), 0.0)]
+    recorder, _ = run(bot.ChatOrderedUpdateProcessor(max_in_flight=8), jobs)
+
+    assert recorder.finished == [1, 2]
+
+
+def test_max_in_flight_limits_concurrency():
+    processor = bot.ChatOrderedUpdateProcessor(max_in_flight=2)
+    jobs = [(update(i, -100 - i, i), 0.05) for i in range(1, 7)]
+    recorder, _ = run(processor, jobs)
+
+    assert recorder.peak == 2
+    assert sorted(recorder.finished) == [1, 2, 3, 4, 5, 6]
+    # Tudo liberado ao final: nenhuma chave presa
+    assert processor._locks == {} and processor.pending == 0 and processor.in_flight == 0
+
+
+def test_ordering_keys():
+    assert bot.ChatOrderedUpdateProcessor.ordering_keys(update(1, -100, 7)) == [('chat', -100), ('user', 7)]
+    assert bot.ChatOrderedUpdateProcessor.ordering_keys(object()) == []
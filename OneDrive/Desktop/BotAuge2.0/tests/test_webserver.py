@@ -0,0 +1,92 @@
+"""Testes do servidor HTTP embutido (sem Application: só as rotas que não a usam)"""
+
+import asyncio
+import time
+
+import bot
+
+
+def serve(exchange, idle_timeout=5.0):
+    """Sobe o servidor em uma porta livre e roda `exchange(reader, writer)` contra ele"""
+    async def run():
+        server = bot.WebServer(None, port=0, host='127.0.0.1', idle_timeout=idle_timeout)
+        await server.start()
+        port = server._server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        try:
+            return await exchange(reader, writer)
+        finally:
+            writer.close()
+            await server.stop()
+    return asyncio.run(run())
+
+
+async def request(reader, writer, raw: bytes) -> bytes:
+    writer.write(raw)
+    await writer.drain()
+    return await asyncio.wait_for(reader.read(), 2)
+
+
+def test_health():
+    async def exchange(reader, writer):
+        return await request(reader, writer, b'GET /health HTTP/1.1\r\nConnection: close\r\n\r\n')
+
+    response = serve(exchange)
+    assert response.startswith(b'HTTP/1.1 200 OK') and response.endswith(b'OK')
+
+
+def test_non_numeric_content_length_is_rejected():
+    async def exchange(reader, writer):
+        return await request(reader, writer, b'POST /health HTTP/1.1\r\nContent-Length: abc\r\n\r\n')
+
+    assert serve(exchange).startswith(b'HTTP/1.1 400 Bad Request')
+
+
+def test_negative_content_length_is_rejected():
+    async def exchange(reader, writer):
+        return await request(reader, writer, b'POST /health HTTP/1.1\r\nContent-Length: -1\r\n\r\n')
+
+    assert serve(exchange).startswith(b'HTTP/1.1 400 Bad Request')
+
+
+def test_oversized_body_is_rejected():
+    async def exchange(reader, writer):
+        length = bot.WebServer.MAX_BODY + 1
+        return await request(reader, writer, f'POST /health HTTP/1.1\r\nContent-Length: {length}\r\n\r\n'.encode())
+
+    assert serve(exchange).startswith(b'HTTP/1.1 413')
+
+
+def test_idle_connection_is_closed():
+    async def exchange(reader, writer):
+        start = time.monotonic()
+        data = await asyncio.wait_for(reader.read(), 2)
+        return data, time.monotonic() - start
+
+    data, elapsed = serve(exchange, idle_timeout=0.2)
+    assert data == b'' and elapsed < 1
+
+
+def test_stalled_body_is_closed():
+    async def exchange(reader, writer):
+        writer.write(b'POST /health HTTP/1.1\r\nContent-Length: 10\r\n\r\nabc')
+        await writer.drain()
+        return await asyncio.wait_for(reader.read(), 2)
+
+    assert serve(exchange, idle_timeout=0.2) == b''
+
+
+def test_keep_alive_serves_several_requests_then_times_out():
+    async def exchange(reader, writer):
+        responses = []
+        for _ in range(2):
+            writer.write(b'GET /health HTTP/1.1\r\n\r\n')
+            await writer.drain()
+            responses.append(await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), 2))
+            responses.append(await asyncio.wait_for(reader.readexactly(2), 2))
+        responses.append(await asyncio.wait_for(reader.read(), 2))
+        return responses
+
+    responses = serve(exchange, idle_timeout=0.2)
+    assert responses[0].startswith(b'HTTP/1.1 200') and responses[2].startswith(b'HTTP/1.1 200')
+    assert responses[-1] == b''
@@ -0,0 +1,181 @@
+"""Testes do WriteBehindBuffer: flush por tamanho, por intervalo e no encerramento"""
+
+import asyncio
+import re
+import sqlite3
+import time
+
+import bot
+
+
+class StubEngine:
+    """Motor falso: registra cada lote recebido (instante, usuários, mensagens)"""
+
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+
+    async def write(self, fn, users, messages):
+        self.batches.append((time.monotonic(), users, messages))
+        if self.fail:
+            raise sqlite3.OperationalError('database is locked')
+        return {'new_users': 0, 'messages': len(messages), 'day': '2024-01-01'}
+
+
+def message(i, chat_id=-100):
+    return (i, chat_id, f'msg {i}', 'user', '2024-01-01 12:00:00')
+
+
+def test_flushes_as_soon_as_the_batch_is_full():
+    engine = StubEngine()
+    buffer = bot.WriteBehindBuffer(engine, max_batch=3, flush_interval_ms=10000)
+
+    async def run():
+        start = time.monotonic()
+        for i in range(3):
+            await buffer.put('message', message(i))
+        await asyncio.sleep(0.05)
+        flushed = list(engine.batches)
+        await buffer.stop()
+        return start, flushed
+
+    start, flushed = asyncio.run(run())
+    assert len(flushed) == 1
+    at, users, messages = flushed[0]
+    assert len(messages) == 3 and at - start < 1
+
+
+def test_flushes_after_the_interval():
+    engine = StubEngine()
+    buffer = bot.WriteBehindBuffer(engine, max_batch=100, flush_interval_ms=100)
+
+    async def run():
+        start = time.monotonic()
+        await buffer.put('message', message(1))
+        await buffer.put('message', message(2))
+        await asyncio.sleep(0.03)
+        early = len(engine.batches)
+        await asyncio.sleep(0.2)
+        await buffer.stop()
+        return start, early
+
+    start, early = asyncio.run(run())
+    assert early == 0
+    assert len(engine.batches) == 1
+    at, _, messages = engine.batches[0]
+    assert len(messages) == 2 and 0.09 <= at - start < 0.5
+
+
+def test_stop_flushes_everything_pending():
+    engine = StubEngine()
+    buffer = bot.WriteBehindBuffer(engine, max_batch=4, flush_interval_ms=10000)
+
+    async def run():
+        for i in range(10):
+            await buffer.put('message', message(i))
+        start = time.monotonic()
+        await buffer.stop()
+        return time.monotonic() - start
+
+    elapsed = asyncio.run(run())
+    assert elapsed < 1
+    assert sum(len(messages) for _, _, messages in engine.batches) == 10
+    assert all(len(messages) <= 4 for _, _, messages in engine.batches)
+    assert buffer.pending == 0
+
+
+def test_latest_profile_of_a_user_wins():
+    engine = StubEngine()
+    buffer = bot.WriteBehindBuffer(engine, max_batch=100, flush_interval_ms=10000)
+
+    async def run():
+        await buffer.put('user', (1, 'antigo', 'Ana', None))
+        await buffer.put('user', (2, 'bia', 'Bia', None))
+        await buffer.put('user', (1, 'novo', 'Ana', None))
+        await buffer.stop()
+
+    asyncio.run(run())
+    [(_, users, messages)] = engine.batches
+    assert sorted(users) == [(1, 'novo', 'Ana', None), (2, 'bia', 'Bia', None)]
+    assert messages == []
+
+
+def test_errors_report_the_users_of_the_failed_batch():
+    engine = StubEngine(fail=True)
+    failed = []
+    buffer = bot.WriteBehindBuffer(engine, max_batch=100, flush_interval_ms=10000, on_error=failed.extend)
+
+    async def run():
+        await buffer.put('user', (7, 'x', None, None))
+        await buffer.put('message', message(1))
+        await buffer.stop()
+
+    asyncio.run(run())
+    assert failed == [7]
+
+
+def test_backpressure_when_the_queue_is_full():
+    engine = StubEngine()
+    gate = asyncio.Event()
+    write = engine.write
+
+    async def slow_write(fn, users, messages):
+        await gate.wait()
+        return await write(fn, users, messages)
+
+    engine.write = slow_write
+    buffer = bot.WriteBehindBuffer(engine, max_batch=2, flush_interval_ms=10000, max_pending=2)
+
+    async def run():
+        gate.clear()
+        for i in range(2):
+            await buffer.put('message', message(i))
+        await asyncio.sleep(0.01)  # o primeiro lote sai da fila e fica preso na gravação
+        for i in range(2, 4):
+            await buffer.put('message', message(i))
+        blocked = asyncio.create_task(buffer.put('message', message(4)))
+        await asyncio.sleep(0.05)
+        waiting = not blocked.done()
+        gate.set()
+        await blocked
+        await buffer.stop()
+        return waiting
+
+    assert asyncio.run(run())
+    assert sum(len(messages) for _, _, messages in engine.batches) == 5
+
+
+def test_real_batch_updates_tables_and_counters(tmp_path):
+    db = bot.DatabaseManager(str(tmp_path / 'bot.db'))
+
+    async def run():
+        await db.add_user(1, 'ana', 'Ana')
+        for i in range(5):
+            await db.buffer.put('message', (1, -100, f'msg {i}', 'user', '2024-01-01 12:00:00'))
+        await db.buffer.stop()
+
+    try:
+        asyncio.run(run())
+        count = db.engine.write_sync(lambda conn: conn.execute('SELECT COUNT(*) FROM messages').fetchone()[0])
+        assert count == 5
+        assert db.stats.snapshot()['total_messages'] == 5
+        assert db.stats.snapshot()['total_users'] == 1
+    finally:
+        db.close()
+
+
+def test_logged_timestamps_keep_the_stored_format(tmp_path):
+    db = bot.DatabaseManager(str(tmp_path / 'bot.db'))
+
+    async def run():
+        await db.log_message(1, -100, 'oi')
+        await db.buffer.stop()
+
+    try:
+        asyncio.run(run())
+        timestamp = db.engine.write_sync(lambda conn: conn.execute('SELECT timestamp FROM messages').fetchone()[0])
+        # UTC sem fuso, comparável como texto com CURRENT_TIMESTAMP do SQLite
+        assert re.fullmatch(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}', timestamp)
+        assert re.fullmatch(r'\d{4}-\d{2}-\d{2}', bot.StatsCounters.today())
+    finally:
+        db.close()